@@ -0,0 +1,43 @@
+"""Compare the memory of the trips processed with the default and compact dtypes.
+
+    python -m benchmarks.bench_compact_dtypes --rows 3000000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from src.utils import bytes_per_row
+from benchmarks.synthetic import write_month_csvs
+from src.data.combine_raw import concat_trips, process_data
+
+# the steps are timed, not their memoized results
+os.environ.setdefault('TASK_CACHE_GB', '0')
+
+
+def main(rows: int, months: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_paths = write_month_csvs(tmp_dir, rows // months, months)
+
+        results = {}
+        for name, compact in [('default', False), ('compact', True)]:
+            start = time.perf_counter()
+            df = concat_trips(
+                [process_data.fn(path, compact=compact) for path in csv_paths]
+            )
+            seconds = time.perf_counter() - start
+            results[name] = bytes_per_row(df)
+            print(
+                f'{name:>8}: {seconds:.2f}s,'
+                f' {results[name]:.1f} bytes per row,'
+                f' {results[name] * len(df) / 2**20:,.0f}MiB'
+            )
+    print(f'reduction: {results["default"] / results["compact"]:.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--months', type=int, default=3)
+    args = parser.parse_args()
+    main(args.rows, args.months)
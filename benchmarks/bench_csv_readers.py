@@ -0,0 +1,59 @@
+"""Compare the parse throughput of the csv readers on synthetic monthly files.
+
+Every reader parses the same files, the throughput is the csv bytes over the
+time to read them. `process_data` (parse and clean) is timed too, and its
+result is checked to be the same for every reader.
+
+    python -m benchmarks.bench_csv_readers --months 3 --rows 3000000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from pandas.testing import assert_frame_equal
+
+from benchmarks.synthetic import write_month_csvs
+from src.data.combine_raw import CSV_READERS, read_trips, process_data
+
+# the steps are timed, not their memoized results
+os.environ.setdefault('TASK_CACHE_GB', '0')
+
+
+def main(months: int, rows: int, compact: bool):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_paths = write_month_csvs(tmp_dir, rows, months)
+        megabytes = sum(p.stat().st_size for p in csv_paths) / 2**20
+
+        results = {}
+        for reader in CSV_READERS:
+            start = time.perf_counter()
+            for csv_path in csv_paths:
+                read_trips(csv_path, compact=compact, reader=reader)
+            parse_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results[reader] = [
+                process_data.fn(csv_path, compact=compact, reader=reader)
+                for csv_path in csv_paths
+            ]
+            process_seconds = time.perf_counter() - start
+            print(
+                f'{reader:>8}: parse {megabytes / parse_seconds:.1f}MB/s'
+                f' ({parse_seconds:.2f}s for {megabytes:,.0f}MB),'
+                f' process_data {process_seconds:.2f}s'
+            )
+
+    for reader in CSV_READERS[1:]:
+        for df, expected in zip(results[reader], results[CSV_READERS[0]]):
+            assert_frame_equal(df, expected)
+    print('same cleaned trips with every reader')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--months', type=int, default=3)
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--compact', action='store_true')
+    args = parser.parse_args()
+    main(args.months, args.rows, args.compact)
@@ -0,0 +1,51 @@
+"""Compare DictVectorizer and CategoricalVectorizer throughput.
+
+    python -m benchmarks.bench_encoder --rows 2000000
+"""
+import time
+import argparse
+
+import numpy as np
+from sklearn.feature_extraction import DictVectorizer
+
+from src.utils import feature_dtypes, get_categorical_features
+from src.data.prepare import preprocess
+from benchmarks.synthetic import generate_month
+from src.data.combine_raw import clean_trips
+from src.features.encoding import CategoricalVectorizer
+
+
+def main(rows: int):
+    raw = generate_month(rows).astype(feature_dtypes())
+    raw[['started_at', 'ended_at']] = raw[['started_at', 'ended_at']].apply(
+        lambda column: column.astype('datetime64[ns]')
+    )
+    df = clean_trips(raw, get_categorical_features())
+
+    results = {}
+    for name, dv in [
+        ('DictVectorizer', DictVectorizer()),
+        ('CategoricalVectorizer', CategoricalVectorizer()),
+    ]:
+        start = time.perf_counter()
+        X, dv = preprocess(df.copy(), dv, fit_dv=True)
+        fit_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        preprocess(df.copy(), dv)
+        transform_seconds = time.perf_counter() - start
+        results[name] = X
+        print(
+            f'{name:>21}: fit {fit_seconds:.2f}s, '
+            f'transform {transform_seconds:.2f}s '
+            f'({len(df) / transform_seconds:,.0f} rows/s)'
+        )
+
+    X_dv, X_cv = results['DictVectorizer'], results['CategoricalVectorizer']
+    assert np.array_equal(X_dv.indices, X_cv.indices)
+    assert np.array_equal(X_dv.data, X_cv.data)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    main(parser.parse_args().rows)
@@ -0,0 +1,108 @@
+"""Compare the peak memory and speed of in-memory and external-memory training.
+
+- pickle: the CSR pickle loaded whole then copied into a DMatrix
+- buffer: the cached DMatrix buffer, what the flows load by default
+- quantile: chunks streamed into a QuantileDMatrix
+- paged: chunks paged by XGBoost to an on-disk cache
+
+Every mode runs in a fresh process, so that its peak RSS is its own.
+
+    python -m benchmarks.bench_external_memory --rows 5000000
+"""
+import time
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+import xgboost as xgb
+
+from src.utils import TARGET_COL, read_pickle, write_pickle
+from src.profiling import profile_stage
+from src.data.prepare import preprocess
+from src.features.encoding import CategoricalVectorizer
+from src.models.data_cache import (
+    SPLITS,
+    build_entry,
+    load_dmatrix,
+    external_memory_dmatrix,
+)
+from benchmarks.bench_serving import make_trips
+
+MODES = ['pickle', 'buffer', 'quantile', 'paged']
+
+
+def write_entry(rows: int, artifact_dir: Path, entry_dir: Path) -> None:
+    df = make_trips(rows)
+    X, dv = preprocess(df, CategoricalVectorizer(), fit_dv=True)
+    y = df[TARGET_COL].to_numpy()
+    write_pickle(dv, artifact_dir / 'dv.pkl')
+    for split in SPLITS:
+        write_pickle((X, y), artifact_dir / f'{split}.pkl')
+    build_entry(artifact_dir, entry_dir)
+
+
+def load_train(mode: str, artifact_dir: Path, entry_dir: Path, chunk_rows):
+    if mode == 'pickle':
+        X, y = read_pickle(artifact_dir / 'train.pkl')
+        return xgb.DMatrix(X, label=y)
+    if mode == 'buffer':
+        return load_dmatrix(entry_dir, 'train')
+    return external_memory_dmatrix(
+        entry_dir, ['train'], chunk_rows, quantile=mode == 'quantile'
+    )
+
+
+# pylint: disable=too-many-arguments
+def run_mode(mode, artifact_dir, entry_dir, chunk_rows, rounds, nthread):
+    with profile_stage(mode) as stage:
+        start = time.perf_counter()
+        train = load_train(mode, artifact_dir, entry_dir, chunk_rows)
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        xgb.train(
+            {'tree_method': 'hist', 'nthread': nthread, 'seed': 42},
+            train,
+            num_boost_round=rounds,
+        )
+        train_seconds = time.perf_counter() - start
+    return train.num_row(), load_seconds, train_seconds, stage.peak_rss_bytes
+
+
+def main(rows: int, chunk_rows: int, rounds: int, nthread: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        artifact_dir, entry_dir = Path(tmp_dir) / 'a', Path(tmp_dir) / 'e'
+        artifact_dir.mkdir()
+        entry_dir.mkdir()
+        write_entry(rows, artifact_dir, entry_dir)
+
+        context = multiprocessing.get_context('spawn')
+        for mode in MODES:
+            with context.Pool(1) as pool:
+                n_rows, load_seconds, train_seconds, peak_rss = pool.apply(
+                    run_mode,
+                    (
+                        mode,
+                        artifact_dir,
+                        entry_dir,
+                        chunk_rows,
+                        rounds,
+                        nthread,
+                    ),
+                )
+            print(
+                f'{mode:>8}: load {load_seconds:.2f}s,'
+                f' train {train_seconds:.2f}s'
+                f' ({n_rows * rounds / train_seconds:,.0f} row-rounds/s),'
+                f' {peak_rss / 2**20:,.0f}MiB peak'
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--nthread', type=int, default=8)
+    args = parser.parse_args()
+    main(args.rows, args.chunk_rows, args.rounds, args.nthread)
@@ -0,0 +1,83 @@
+"""Import time of the package's entry modules, from `python -X importtime`.
+
+Every module is imported `--repeat` times in a fresh interpreter, the best
+time is compared with its budget in `IMPORT_BUDGETS` and the heaviest
+packages it imports are listed. Exits with 1 if a module is over budget.
+
+    python -m benchmarks.bench_import_time --repeat 5
+"""
+import sys
+import argparse
+import subprocess
+from operator import itemgetter
+from collections import defaultdict
+
+from src.utils import get_project_root
+
+# seconds, with some headroom over the import times on a single core
+IMPORT_BUDGETS = {
+    'src.utils': 1.0,
+    'src.serving.predict': 1.0,
+    'src.data.combine_raw': 3.0,
+    'src.data.prepare': 4.0,
+    'src.models.xgb_sweep': 5.0,
+}
+# packages only the steps that need them import
+HEAVY_PACKAGES = ['wandb', 'prefect', 'xgboost', 'sklearn']
+
+
+def import_times(module: str) -> {str: float}:
+    """Cumulative import time in seconds of every module `module` imports."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=get_project_root(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def package_times(times: {str: float}) -> {str: float}:
+    """Import time of every top-level package, from its outermost import."""
+    packages = defaultdict(float)
+    for name, seconds in times.items():
+        package = name.split('.')[0]
+        packages[package] = max(packages[package], seconds)
+    return dict(packages)
+
+
+def main(modules: [str], repeat: int) -> int:
+    over_budget = []
+    for module in modules:
+        best = min(
+            (import_times(module) for _ in range(repeat)),
+            key=itemgetter(module),
+        )
+        packages = package_times(best)
+        del packages['src']
+        heaviest = sorted(packages.items(), key=lambda item: -item[1])[:5]
+        print(
+            f'{module:>22}: {best[module]:.2f}s'
+            f' (budget {IMPORT_BUDGETS[module]:.1f}s), '
+            + ', '.join(f'{name} {seconds:.2f}s' for name, seconds in heaviest)
+        )
+        if best[module] > IMPORT_BUDGETS[module]:
+            over_budget.append(module)
+    if over_budget:
+        print(f'over budget: {", ".join(over_budget)}')
+    return int(bool(over_budget))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modules', nargs='+', default=list(IMPORT_BUDGETS))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    sys.exit(main(args.modules, args.repeat))
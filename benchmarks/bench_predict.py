@@ -0,0 +1,56 @@
+"""Compare the ways to score a CSR matrix with a trained booster.
+
+- DMatrix: convert to a DMatrix and predict, what calculate_rmse used to do
+- inplace: Booster.inplace_predict straight from the CSR matrix
+- TreeEnsemble: NumPy traversal of the flattened trees, without XGBoost
+
+    python -m benchmarks.bench_predict --rows 1000000
+"""
+import time
+import argparse
+
+import numpy as np
+import xgboost as xgb
+
+from src.utils import TARGET_COL
+from src.data.prepare import preprocess
+from src.serving.trees import TreeEnsemble
+from src.features.encoding import CategoricalVectorizer
+from benchmarks.bench_serving import make_trips
+
+
+def main(rows: int, rounds: int, nthread: int):
+    df = make_trips(rows)
+    X, _ = preprocess(df, CategoricalVectorizer(), fit_dv=True)
+    booster = xgb.train(
+        {'max_depth': 10, 'nthread': nthread},
+        xgb.DMatrix(X, label=df[TARGET_COL]),
+        num_boost_round=rounds,
+    )
+    start = time.perf_counter()
+    trees = TreeEnsemble.from_booster(booster)
+    print(f'flattened {rounds} trees in {time.perf_counter() - start:.2f}s')
+
+    results = {}
+    for name, predict in [
+        ('DMatrix', lambda: booster.predict(xgb.DMatrix(X, nthread=nthread))),
+        ('inplace', lambda: booster.inplace_predict(X)),
+        ('TreeEnsemble', lambda: trees.predict(X)),
+    ]:
+        start = time.perf_counter()
+        results[name] = predict()
+        seconds = time.perf_counter() - start
+        print(f'{name:>12}: {seconds:.2f}s ({rows / seconds:,.0f} rows/s)')
+
+    for name, y_pred in results.items():
+        np.testing.assert_allclose(y_pred, results['DMatrix'], rtol=1e-5)
+        print(f'{name:>12} matches booster.predict')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--nthread', type=int, default=8)
+    args = parser.parse_args()
+    main(args.rows, args.rounds, args.nthread)
@@ -0,0 +1,56 @@
+"""Compare the per-row and the vectorized trip cleaning on a synthetic month.
+
+    python -m benchmarks.bench_process_data --rows 3000000
+"""
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from src.utils import feature_dtypes, get_categorical_features
+from benchmarks.synthetic import generate_month
+from src.data.combine_raw import clean_trips
+
+
+def legacy_clean_trips(df: pd.DataFrame) -> pd.DataFrame:
+    """Cleaning as `process_data` did it before the vectorized engine."""
+    df = df.dropna().copy()
+    df['duration'] = df.ended_at - df.started_at
+    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
+    df = df[(df.duration >= 0) & (df.duration <= 100)]
+    df = df[df.start_station_id.str.contains('^[0-9]*$', regex=True, na=False)]
+    df = df[df.end_station_id.str.contains('^[0-9]*$', regex=True, na=False)]
+    return df[get_categorical_features() + ['duration', 'started_at']]
+
+
+def main(rows: int):
+    categorical = get_categorical_features()
+    date_columns = ['started_at', 'ended_at']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = Path(tmp_dir) / '202305-capitalbikeshare-tripdata.csv'
+        generate_month(rows).to_csv(csv_path, index=False)
+        df = pd.read_csv(
+            csv_path,
+            parse_dates=date_columns,
+            usecols=categorical + date_columns,
+            dtype=feature_dtypes(),
+        )
+
+    timings = {}
+    for name, clean in [
+        ('legacy', legacy_clean_trips),
+        ('vectorized', lambda df: clean_trips(df, categorical)),
+    ]:
+        start = time.perf_counter()
+        result = clean(df.copy())
+        timings[name] = time.perf_counter() - start
+        print(f'{name:>10}: {timings[name]:.2f}s, {len(result)} rows kept')
+    print(f'speedup: {timings["legacy"] / timings["vectorized"]:.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    main(parser.parse_args().rows)
@@ -0,0 +1,57 @@
+"""Scaling of the combine stage from 1 to `--max-workers` processes.
+
+Processes the same synthetic monthly files in this process, one after the
+other, then in pools of 1, 2, 4, ... processes. The pool times include
+starting the workers.
+
+    python -m benchmarks.bench_process_pool --months 12 --rows 1000000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from benchmarks.synthetic import write_month_csvs
+from src.data.combine_raw import process_data, process_data_in_pool
+
+# the steps are timed, not their memoized results
+os.environ.setdefault('TASK_CACHE_GB', '0')
+
+
+def worker_counts(max_workers: int) -> [int]:
+    counts = [1]
+    while counts[-1] * 2 <= max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+    return counts
+
+
+def main(months: int, rows: int, max_workers: int, memory_limit_mb: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_paths = write_month_csvs(tmp_dir, rows, months)
+
+        start = time.perf_counter()
+        for csv_path in csv_paths:
+            process_data.fn(csv_path)
+        baseline = time.perf_counter() - start
+        print(f'{"serial":>10}: {baseline:.2f}s')
+
+        for n_workers in worker_counts(max_workers):
+            start = time.perf_counter()
+            process_data_in_pool.fn(csv_paths, n_workers, memory_limit_mb)
+            seconds = time.perf_counter() - start
+            print(
+                f'{n_workers:>3} workers: {seconds:.2f}s,'
+                f' speedup {baseline / seconds:.2f}x'
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--memory-limit-mb', type=int, default=None)
+    args = parser.parse_args()
+    main(args.months, args.rows, args.max_workers, args.memory_limit_mb)
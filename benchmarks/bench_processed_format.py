@@ -0,0 +1,67 @@
+"""Compare the processed data as pickles and as memory-mappable arrays.
+
+For both formats: the time to write the splits, their size on disk, the time
+to load a split and to fill the training data cache from the directory.
+
+    python -m benchmarks.bench_processed_format --rows 5000000
+"""
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+from src.utils import TARGET_COL, write_pickle
+from src.data.prepare import preprocess
+from src.data.processed import write_processed, load_processed_split
+from src.features.encoding import CategoricalVectorizer
+from src.models.data_cache import SPLITS, build_entry
+from benchmarks.bench_serving import make_trips
+
+
+def write_pickles(dest_dir: Path, dv, splits: [tuple]) -> None:
+    write_pickle(dv, dest_dir / 'dv.pkl')
+    for split, X, y in splits:
+        write_pickle((X, y), dest_dir / f'{split}.pkl')
+
+
+# pylint: disable=too-many-locals
+def main(rows: int):
+    df = make_trips(rows)
+    X, dv = preprocess(df, CategoricalVectorizer(), fit_dv=True)
+    splits = [(split, X, df[TARGET_COL].to_numpy()) for split in SPLITS]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, write in [
+            ('pickle', write_pickles),
+            ('npy', write_processed),
+        ]:
+            data_dir = Path(tmp_dir) / name
+            entry_dir = Path(tmp_dir) / f'{name}-entry'
+            data_dir.mkdir()
+            entry_dir.mkdir()
+            start = time.perf_counter()
+            write(data_dir, dv, splits)
+            write_seconds = time.perf_counter() - start
+            size = sum(p.stat().st_size for p in data_dir.iterdir())
+
+            start = time.perf_counter()
+            X_loaded, _ = load_processed_split(data_dir, 'train')
+            # touch every value, for the memory map to be read
+            X_loaded.sum()
+            load_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            build_entry(data_dir, entry_dir)
+            cache_seconds = time.perf_counter() - start
+            print(
+                f'{name:>6}: write {write_seconds:.2f}s,'
+                f' {size / 2**20:,.0f}MiB,'
+                f' load and sum train {load_seconds:.2f}s,'
+                f' cache {cache_seconds:.2f}s'
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    args = parser.parse_args()
+    main(args.rows)
@@ -0,0 +1,112 @@
+"""Compare TripScorer with scoring the dv-model pipeline through dicts.
+
+Trains a small model on synthetic trips, then reports batch throughput and
+single-trip p50/p99 latency.
+
+    python -m benchmarks.bench_serving --rows 1000000
+"""
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import xgboost as xgb
+from sklearn.pipeline import make_pipeline
+from sklearn.feature_extraction import DictVectorizer
+
+from src.utils import (
+    TARGET_COL,
+    write_pickle,
+    feature_dtypes,
+    get_categorical_features,
+)
+from src.data.prepare import get_features, add_time_features
+from src.serving.predict import TripScorer
+from benchmarks.synthetic import generate_month
+from src.data.combine_raw import clean_trips
+
+SINGLE_TRIPS = 2000
+
+
+def make_trips(rows: int):
+    raw = generate_month(rows).astype(feature_dtypes())
+    raw[['started_at', 'ended_at']] = raw[['started_at', 'ended_at']].apply(
+        lambda column: column.astype('datetime64[ns]')
+    )
+    return clean_trips(raw, get_categorical_features(), keep=['started_at'])
+
+
+def trip_features(trip: dict) -> dict:
+    """Per-request feature dict, the way the pipeline is called today."""
+    started_at = trip['started_at']
+    return {
+        **{column: trip[column] for column in get_categorical_features()},
+        'hour': started_at.hour,
+        'year': started_at.year,
+        'month': started_at.month,
+    }
+
+
+def latencies(predict, trips: [dict]) -> np.ndarray:
+    seconds = []
+    for trip in trips:
+        start = time.perf_counter()
+        predict(trip)
+        seconds.append(time.perf_counter() - start)
+    return np.array(seconds) * 1000
+
+
+def bench_batch(pipeline, scorer: TripScorer, df) -> None:
+    start = time.perf_counter()
+    # the pipeline needs the feature dicts of all the trips
+    expected = pipeline.predict(
+        get_features(add_time_features(df.copy()), pipeline[0])
+    )
+    pipeline_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    scored = scorer.predict_frame(df)
+    scorer_seconds = time.perf_counter() - start
+    np.testing.assert_allclose(scored, expected, rtol=1e-5)
+    for name, seconds in [
+        ('pipeline', pipeline_seconds),
+        ('TripScorer', scorer_seconds),
+    ]:
+        print(f'{name:>10} batch: {len(df) / seconds:,.0f} rows/s')
+
+
+def bench_single_trip(pipeline, scorer: TripScorer, df) -> None:
+    trips = df[get_categorical_features() + ['started_at']].iloc[:SINGLE_TRIPS]
+    for name, predict in [
+        ('pipeline', lambda trip: pipeline.predict([trip_features(trip)])),
+        ('TripScorer', scorer.predict_trip),
+    ]:
+        ms = latencies(predict, trips.to_dict('records'))
+        print(
+            f'{name:>10} single trip: p50 {np.percentile(ms, 50):.3f}ms, '
+            f'p99 {np.percentile(ms, 99):.3f}ms'
+        )
+
+
+def main(rows: int):
+    df = make_trips(rows)
+    dv = DictVectorizer()
+    X = dv.fit_transform(get_features(add_time_features(df.copy()), dv))
+    model = xgb.XGBRegressor(n_estimators=100, max_depth=8, nthread=4)
+    pipeline = make_pipeline(dv, model.fit(X, df[TARGET_COL]))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pipeline_path = Path(tmp_dir) / 'pipeline.pkl'
+        write_pickle(pipeline, pipeline_path)
+        start = time.perf_counter()
+        scorer = TripScorer(pipeline_path)
+        print(f'loaded scorer in {time.perf_counter() - start:.3f}s')
+
+    bench_batch(pipeline, scorer, df)
+    bench_single_trip(pipeline, scorer, df)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    main(parser.parse_args().rows)
@@ -0,0 +1,123 @@
+"""Compare the training backends by their time to reach a target val RMSE.
+
+Every backend trains the same model on the same synthetic trips and the
+validation RMSE is recorded after every round. The target is the best RMSE
+reached by any backend plus `--tolerance`.
+
+    python -m benchmarks.bench_tree_method --rows 2000000 --max-depth 12
+"""
+import time
+import argparse
+
+import numpy as np
+import xgboost as xgb
+
+from src.data.prepare import preprocess
+from src.features.encoding import CategoricalVectorizer
+from benchmarks.bench_serving import make_trips
+
+# name, tree method, max_bin (None for exact) and whether to use
+# a QuantileDMatrix
+BACKENDS = [
+    ('exact', 'exact', None, False),
+    ('approx', 'approx', 256, False),
+    ('hist DMatrix', 'hist', 256, False),
+    ('hist Quantile 256', 'hist', 256, True),
+    ('hist Quantile 64', 'hist', 64, True),
+]
+
+
+class RmseTimer(xgb.callback.TrainingCallback):
+    """Records the time since the start and the val RMSE of every round."""
+
+    def __init__(self, start: float):
+        super().__init__()
+        self.start = start
+        self.history = []
+
+    def after_iteration(self, model, epoch, evals_log) -> bool:
+        self.history.append(
+            (time.perf_counter() - self.start, evals_log['val']['rmse'][-1])
+        )
+        return False
+
+
+def make_splits(rows: int) -> (tuple, tuple):
+    """Train and val splits of synthetic trips.
+
+    The synthetic durations don't depend on the features, so the target is
+    a random effect of every feature plus noise instead.
+    """
+    df = make_trips(rows)
+    X, _ = preprocess(df, CategoricalVectorizer(), fit_dv=True)
+    rng = np.random.default_rng(42)
+    y = X @ rng.gamma(2.0, 2.0, X.shape[1]) + rng.normal(0, 3, X.shape[0])
+    n_train = int(X.shape[0] * 0.8)
+    return (X[:n_train], y[:n_train]), (X[n_train:], y[n_train:])
+
+
+def train(
+    train_split: tuple, val_split: tuple, backend: tuple, params: dict
+) -> [(float, float)]:
+    """Seconds since the start and val RMSE after every round."""
+    _, tree_method, max_bin, quantile = backend
+    start = time.perf_counter()
+    if quantile:
+        dtrain = xgb.QuantileDMatrix(*train_split, max_bin=max_bin)
+    else:
+        dtrain = xgb.DMatrix(*train_split)
+    # evaluating on a QuantileDMatrix is much slower with XGBoost 1.7
+    dval = xgb.DMatrix(*val_split)
+    timer = RmseTimer(start)
+    params = {**params, 'tree_method': tree_method}
+    if max_bin is not None:
+        params['max_bin'] = max_bin
+    xgb.train(
+        params,
+        dtrain,
+        num_boost_round=params.pop('rounds'),
+        evals=[(dval, 'val')],
+        callbacks=[timer],
+        verbose_eval=False,
+    )
+    return timer.history
+
+
+def print_time_to_target(histories: dict, tolerance: float) -> None:
+    target = min(rmse for h in histories.values() for _, rmse in h) + tolerance
+    print(f'time to val rmse <= {target:.4f}')
+    for name, history in histories.items():
+        reached = [seconds for seconds, rmse in history if rmse <= target]
+        result = f'{reached[0]:.2f}s' if reached else 'not reached'
+        print(f'{name:>18}: {result}')
+
+
+def main(rows: int, rounds: int, max_depth: int, nthread: int, tolerance):
+    train_split, val_split = make_splits(rows)
+    params = {
+        'max_depth': max_depth,
+        'learning_rate': 0.3,
+        'nthread': nthread,
+        'seed': 42,
+        'rounds': rounds,
+    }
+    histories = {}
+    for backend in BACKENDS:
+        name = backend[0]
+        histories[name] = train(train_split, val_split, backend, params)
+        seconds, rmse = histories[name][-1]
+        print(
+            f'{name:>18}: {seconds:.2f}s for {rounds} rounds, rmse {rmse:.4f}'
+        )
+    print_time_to_target(histories, tolerance)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--rounds', type=int, default=100)
+    parser.add_argument('--max-depth', type=int, default=12)
+    parser.add_argument('--nthread', type=int, default=8)
+    parser.add_argument('--tolerance', type=float, default=0.01)
+    args = parser.parse_args()
+    main(args.rows, args.rounds, args.max_depth, args.nthread, args.tolerance)
@@ -0,0 +1,159 @@
+"""Offline benchmark of the data and training pipeline on synthetic trips.
+
+Times every stage from the monthly archives to a trained booster at each
+scale and compares the profile with the saved baseline of that scale,
+exiting with 1 if any stage regressed. Needs no W&B or S3 access.
+
+    python -m benchmarks.suite --rows 1000000 10000000 50000000
+    python -m benchmarks.suite --rows 1000000 --save-baseline
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import date
+
+# nothing is sent to W&B
+os.environ.setdefault('WANDB_MODE', 'offline')
+# the stages are timed, not their memoized results
+os.environ.setdefault('TASK_CACHE_GB', '0')
+
+# pylint: disable=wrong-import-position
+import xgboost as xgb
+
+from src.profiling import profiled, diff_reports, profile_stage
+from src.data.interim import read_interim
+from src.data.prepare import preprocess, dataset_split, split_by_dates
+from benchmarks.synthetic import write_months
+from src.data.combine_raw import process_data, combine_save_data
+from src.features.encoding import CategoricalVectorizer
+
+BASELINE_DIR = Path(__file__).parent / 'baselines'
+YEAR_MONTHS = [(2023, 4), (2023, 5), (2023, 6)]
+# train, val and test months
+SPLIT_DATES = [
+    date(1970, 1, 1),
+    date(2023, 5, 1),
+    date(2023, 6, 1),
+    date(2023, 7, 1),
+]
+
+
+def run_data_stages(archive_dir: Path, work_dir: Path) -> (list, object):
+    dfs = [
+        process_data.fn(zip_path)
+        for zip_path in sorted(archive_dir.glob('*.zip'))
+    ]
+    combine_save_data.fn(dfs, work_dir / 'trips.parquet')
+    del dfs
+    df = read_interim(work_dir / 'trips.parquet')
+
+    with profile_stage('preprocess', rows_in=len(df)) as stage:
+        X, dv = preprocess(df.copy(), CategoricalVectorizer(), fit_dv=True)
+        stage.rows_out = X.shape[0]
+    del X
+    # the split preparation used before split_by_dates, for comparison
+    with profile_stage('dataset_split', rows_in=len(df)):
+        dataset_split.fn(df, SPLIT_DATES[1], dv)
+    return split_by_dates.fn(df, SPLIT_DATES, dv)
+
+
+def run_training_stages(splits: list, dv, rounds: int, nthread: int) -> None:
+    feature_names = list(dv.get_feature_names_out())
+    with profile_stage('build_dmatrix', rows_in=splits[0][0].shape[0]):
+        train, val = (
+            xgb.DMatrix(X, y, feature_names=feature_names)
+            for X, y in splits[:2]
+        )
+    with profile_stage('train', rows_in=train.num_row()):
+        xgb.train(
+            {'tree_method': 'hist', 'nthread': nthread, 'seed': 42},
+            train,
+            num_boost_round=rounds,
+            evals=[(val, 'validation')],
+            verbose_eval=False,
+        )
+
+
+def run_stages(
+    archive_dir: Path, work_dir: Path, rounds: int, nthread: int
+) -> None:
+    splits, dv = run_data_stages(archive_dir, work_dir)
+    run_training_stages(splits, dv, rounds, nthread)
+
+
+def run(
+    rows: int, rounds: int = 50, nthread: int = 8, data_dir: Path = None
+) -> dict:
+    """Profile report of the pipeline stages on `rows` synthetic trips.
+
+    The generated monthly archives are kept in `data_dir` for the next runs,
+    if given.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(tmp_dir)
+        archive_dir = Path(data_dir) / str(rows) if data_dir else work_dir
+        if not any(archive_dir.glob('*.zip')):
+            print(f'generating {rows:,} trips...')
+            archive_dir.mkdir(parents=True, exist_ok=True)
+            write_months(archive_dir, rows, YEAR_MONTHS)
+        profiled(f'suite-{rows}', report=True, report_dir=work_dir)(run_stages)(
+            archive_dir, work_dir, rounds, nthread
+        )
+        (report_path,) = work_dir.glob(f'suite-{rows}-*.json')
+        return json.loads(report_path.read_text())
+
+
+def print_report(report: dict) -> None:
+    for stage in report['stages']:
+        print(
+            f"{stage['name']:<20} {stage['wall_seconds']:>8.2f}s"
+            f" {stage['peak_rss_bytes'] / 2**20:>10,.0f}MiB peak"
+        )
+
+
+def main(argv: [str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000])
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--nthread', type=int, default=8)
+    parser.add_argument('--baseline-dir', type=Path, default=BASELINE_DIR)
+    parser.add_argument(
+        '--data-dir',
+        type=Path,
+        help='keep the generated trips there to reuse them in the next runs',
+    )
+    parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        help='save the results as the new baselines instead of comparing',
+    )
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    regressed = False
+    for rows in args.rows:
+        report = run(rows, args.rounds, args.nthread, args.data_dir)
+        print_report(report)
+        baseline_path = args.baseline_dir / f'{rows}.json'
+        if args.save_baseline:
+            args.baseline_dir.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(report, indent=2))
+            print(f'baseline saved to {baseline_path}')
+        elif baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())
+            for row in diff_reports(baseline, report, args.threshold):
+                if row['regression']:
+                    regressed = True
+                    print(
+                        f"REGRESSION {row['stage']} {row['metric']}:"
+                        f" {row['old']:.4g} -> {row['new']:.4g}"
+                        f" ({row['change']:+.1%})"
+                    )
+    return int(regressed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
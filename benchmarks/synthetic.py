@@ -0,0 +1,130 @@
+"""Synthetic Capital Bikeshare trip data for offline benchmarks."""
+import io
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import numpy as np
+import pandas as pd
+
+RIDEABLE_TYPES = ['classic_bike', 'electric_bike', 'docked_bike']
+MEMBER_TYPES = ['member', 'casual']
+
+
+def format_timestamps(timestamps: pd.DatetimeIndex) -> np.ndarray:
+    """'%Y-%m-%d %H:%M:%S' strings, faster than strftime."""
+    return np.char.replace(
+        np.datetime_as_string(timestamps.to_numpy(), unit='s'), 'T', ' '
+    )
+
+
+def generate_month(
+    n_rows: int,
+    year: int = 2023,
+    month: int = 5,
+    n_stations: int = 700,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """Generate one month of trips in the raw monthly CSV schema.
+
+    Around 1% of the station IDs are not numeric, 2% of the end stations are
+    missing (dockless e-bikes) and 1% of the durations are negative or longer
+    than the 100 minutes `process_data` keeps.
+    """
+    rng = np.random.default_rng(seed)
+    month_start = pd.Timestamp(year=year, month=month, day=1)
+    month_seconds = int(
+        (month_start + pd.offsets.MonthBegin(1) - month_start).total_seconds()
+    )
+
+    started_at = month_start + pd.to_timedelta(
+        rng.integers(0, month_seconds, n_rows), unit='s'
+    )
+    duration_seconds = rng.lognormal(np.log(12 * 60), 0.8, n_rows).astype(int)
+    outliers = rng.random(n_rows) < 0.01
+    duration_seconds[outliers] = rng.integers(-3600, 24 * 3600, outliers.sum())
+    ended_at = started_at + pd.to_timedelta(duration_seconds, unit='s')
+
+    stations = np.arange(31000, 31000 + n_stations).astype(str)
+    stations[rng.random(n_stations) < 0.01] = 'WS-DC-01'
+    start_station_id = rng.choice(stations, n_rows)
+    end_station_id = rng.choice(stations, n_rows).astype(object)
+    end_station_id[rng.random(n_rows) < 0.02] = np.nan
+
+    return pd.DataFrame(
+        {
+            'ride_id': pd.Series(rng.integers(0, 2**62, n_rows)).map(
+                lambda i: f'{i:016X}'
+            ),
+            'rideable_type': rng.choice(RIDEABLE_TYPES, n_rows),
+            'started_at': format_timestamps(started_at),
+            'ended_at': format_timestamps(ended_at),
+            'start_station_id': start_station_id,
+            'end_station_id': end_station_id,
+            'member_casual': rng.choice(MEMBER_TYPES, n_rows, p=[0.7, 0.3]),
+        }
+    )
+
+
+def write_month_csvs(
+    dest_dir: Path, n_rows: int, months: int, year: int = 2023
+) -> [Path]:
+    """Write `n_rows` trips of each of the first `months` months as csv."""
+    csv_paths = []
+    for month in range(1, months + 1):
+        csv_path = (
+            Path(dest_dir) / f'{year}{month:02}-capitalbikeshare-tripdata.csv'
+        )
+        generate_month(n_rows, year, month, seed=month).to_csv(
+            csv_path, index=False
+        )
+        csv_paths.append(csv_path)
+    return csv_paths
+
+
+# pylint: disable=too-many-arguments
+def write_month_archive(
+    dest_dir: Path,
+    n_rows: int,
+    year: int = 2023,
+    month: int = 5,
+    chunk_rows: int = 1_000_000,
+    seed: int = 42,
+) -> Path:
+    """Write a month of trips as the zipped csv the bucket serves.
+
+    The trips are generated and written in chunks, so any number of rows
+    fits in memory.
+    """
+    name = f'{year}{month:02}-capitalbikeshare-tripdata'
+    zip_path = Path(dest_dir) / f'{name}.zip'
+    with ZipFile(zip_path, 'w', ZIP_DEFLATED) as zip_ref, zip_ref.open(
+        f'{name}.csv', 'w', force_zip64=True
+    ) as csv_file, io.TextIOWrapper(csv_file, newline='') as text_file:
+        for i, start in enumerate(range(0, n_rows, chunk_rows)):
+            generate_month(
+                min(chunk_rows, n_rows - start),
+                year,
+                month,
+                seed=seed * 1000 + i,
+            ).to_csv(text_file, index=False, header=i == 0)
+    return zip_path
+
+
+def write_months(
+    dest_dir: Path,
+    n_rows: int,
+    year_months: [(int, int)],
+    chunk_rows: int = 1_000_000,
+) -> [Path]:
+    """Split n_rows trips evenly between monthly archives."""
+    return [
+        write_month_archive(
+            dest_dir,
+            n_rows // len(year_months) + (i < n_rows % len(year_months)),
+            year,
+            month,
+            chunk_rows,
+            seed=42 + i,
+        )
+        for i, (year, month) in enumerate(year_months)
+    ]
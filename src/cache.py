@@ -0,0 +1,280 @@
+"""Local on-disk cache with least recently used eviction by disk budget.
+
+`memoized` caches the results of the pipeline steps in it, keyed by the
+content of their inputs, so a rerun resumes from the last completed step.
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import inspect
+import tempfile
+import functools
+from typing import Callable
+from pathlib import Path
+
+import joblib
+import pandas as pd
+import pyarrow as pa
+
+from src.utils import get_data_dir
+
+
+def get_cache_dir() -> Path:
+    return Path(os.getenv('CACHE_DIR', get_data_dir() / 'cache'))
+
+
+def get_task_cache_bytes() -> int:
+    return int(float(os.getenv('TASK_CACHE_GB', '10')) * 2**30)
+
+
+def get_dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+
+class DiskCache:
+    """Directory of cache entries, one sub-directory per key.
+
+    Reading an entry marks it as recently used, adding one evicts the least
+    recently used entries until the cache fits into `max_bytes`.
+    Entries are built in a temporary directory and moved in place when
+    complete, so concurrent processes never see a partial entry.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> Path | None:
+        entry_dir = self.cache_dir / key
+        if not entry_dir.is_dir():
+            return None
+        os.utime(entry_dir)
+        return entry_dir
+
+    def put(self, key: str, build: Callable[[Path], None]) -> Path:
+        """Build the entry for `key` with `build(entry_dir)` and store it."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry_dir = self.cache_dir / key
+        tmp_dir = Path(tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-'))
+        try:
+            build(tmp_dir)
+            tmp_dir.rename(entry_dir)
+        except OSError:
+            # another process has stored the same entry in the meantime
+            if not entry_dir.is_dir():
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict(keep=key)
+        return self.get(key)
+
+    def get_or_put(self, key: str, build: Callable[[Path], None]) -> Path:
+        entry_dir = self.get(key)
+        if entry_dir is None:
+            entry_dir = self.put(key, build)
+        return entry_dir
+
+    def evict(self, keep: str = None) -> None:
+        """Remove least recently used entries until the budget is met."""
+        entries = sorted(
+            (
+                entry
+                for entry in self.cache_dir.iterdir()
+                if entry.is_dir() and not entry.name.startswith('.')
+            ),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        sizes = {entry: get_dir_size(entry) for entry in entries}
+        total = sum(sizes.values())
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry.name == keep:
+                continue
+            print(f'evicting {entry} from cache')
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+
+# content digest of every file by (path, size, modification time, inode)
+_file_digests = {}
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's content, only read again when the file changes."""
+    stat = path.stat()
+    signature = (
+        str(path.resolve()),
+        stat.st_size,
+        stat.st_mtime_ns,
+        stat.st_ino,
+    )
+    if signature not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f_in:
+            for block in iter(lambda: f_in.read(2**20), b''):
+                digest.update(block)
+        _file_digests[signature] = digest.hexdigest()
+    return _file_digests[signature]
+
+
+def file_signature(path: Path) -> str:
+    """Digest of a file's path, size and modification time.
+
+    Input files aren't read again on every run, a rewritten file gets a
+    new signature even if its content is the same.
+    """
+    stat = path.stat()
+    return joblib.hash((str(path.resolve()), stat.st_size, stat.st_mtime_ns))
+
+
+def dir_digest(path: Path) -> str:
+    """Digest of the names and signatures of a directory's files.
+
+    Hidden files and directories, e.g. XGBoost's page cache, are left out.
+    """
+    files = sorted(
+        f
+        for f in path.rglob('*')
+        if f.is_file()
+        and not any(part.startswith('.') for part in f.relative_to(path).parts)
+    )
+    return joblib.hash(
+        [(str(f.relative_to(path)), file_signature(f)) for f in files]
+    )
+
+
+def fingerprint(value) -> str:
+    """Digest of an argument, of the signatures of files and directories.
+
+    Objects with a `content_digest` method (e.g. zip archive members) are
+    fingerprinted by it, dataframes by their hashed rows.
+    """
+    if isinstance(value, Path) and value.is_file():
+        return file_signature(value)
+    if isinstance(value, Path) and value.is_dir():
+        return dir_digest(value)
+    if hasattr(value, 'content_digest'):
+        return value.content_digest()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        dtypes = (
+            value.dtypes if isinstance(value, pd.DataFrame) else value.dtype
+        )
+        return joblib.hash(
+            (pd.util.hash_pandas_object(value).to_numpy(), repr(dtypes))
+        )
+    return joblib.hash(value)
+
+
+@functools.lru_cache
+def project_modules(module_name: str) -> [str]:
+    """Modules of the project a module imports, directly or not, and itself.
+
+    Modules are found through the module-level names of the modules, so
+    the ones only imported inside functions are left out.
+    """
+    package = module_name.split('.')[0]
+    modules, stack = set(), [module_name]
+    while stack:
+        name = stack.pop()
+        if name in modules or name not in sys.modules:
+            continue
+        modules.add(name)
+        for value in vars(sys.modules[name]).values():
+            dependency = (
+                value.__name__
+                if inspect.ismodule(value)
+                else getattr(value, '__module__', None)
+            )
+            if isinstance(dependency, str) and (
+                dependency.split('.')[0] == package
+            ):
+                stack.append(dependency)
+    return sorted(modules)
+
+
+def code_digest(fn: Callable) -> str:
+    """Digest of the source files of a function and the modules it uses.
+
+    That's every project module its module imports, so changing a helper
+    in another module also changes the code version.
+    """
+    return joblib.hash(
+        [
+            (name, file_digest(Path(inspect.getsourcefile(sys.modules[name]))))
+            for name in project_modules(fn.__module__)
+        ]
+    )
+
+
+def save_result(result, entry_dir: Path) -> None:
+    """Dataframes as Arrow IPC files, everything else with joblib."""
+    if isinstance(result, pd.DataFrame):
+        table = pa.Table.from_pandas(result)
+        with pa.OSFile(
+            str(entry_dir / 'result.arrow'), 'wb'
+        ) as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        joblib.dump(result, entry_dir / 'result.joblib')
+
+
+def load_result(entry_dir: Path):
+    arrow_path = entry_dir / 'result.arrow'
+    if arrow_path.exists():
+        with pa.memory_map(str(arrow_path)) as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+    return joblib.load(entry_dir / 'result.joblib')
+
+
+def memoized(version: str = None, max_bytes: int = None, ignore: [str] = ()):
+    """Decorator caching the results of a function on disk.
+
+    Results are keyed by the function's name and code version (see
+    `code_digest`, plus `version`) and the fingerprints of the arguments
+    but the `ignore` ones, so changing an input file, a parameter or the
+    code computes them again. Ignore arguments whose content another one
+    identifies, e.g. a data directory and the digest of its version.
+    The cache is in `<CACHE_DIR>/tasks`, bounded by `TASK_CACHE_GB`
+    (default 10, 0 turns memoization off). Wrap a task function with it
+    below the Prefect and `profiled` decorators.
+    """
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            budget = get_task_cache_bytes() if max_bytes is None else max_bytes
+            if budget <= 0:
+                return fn(*args, **kwargs)
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            key = hashlib.sha256(
+                json.dumps(
+                    [
+                        fn.__qualname__,
+                        code_digest(fn),
+                        version,
+                        {
+                            name: fingerprint(value)
+                            for name, value in arguments.arguments.items()
+                            if name not in ignore
+                        },
+                    ]
+                ).encode()
+            ).hexdigest()
+            cache = DiskCache(get_cache_dir() / 'tasks', budget)
+            entry_dir = cache.get(key)
+            if entry_dir is not None:
+                print(f'{fn.__name__}: cached result {key[:12]}')
+                return load_result(entry_dir)
+            result = fn(*args, **kwargs)
+            cache.put(key, functools.partial(save_result, result))
+            return result
+
+        return wrapper
+
+    return decorator
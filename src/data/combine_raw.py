@@ -1,90 +1,447 @@
 import os
+import shutil
+import resource
+import tempfile
+import multiprocessing
+from typing import BinaryIO
 from pathlib import Path
 from zipfile import ZipFile
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 from dotenv import find_dotenv, load_dotenv
-from prefect import flow, task
+from prefect import flow, task, unmapped
 
-import wandb
 from src import wandb_params
+from src.cache import memoized
 from src.utils import (
     TARGET_COL,
-    get_data_dir,
+    memory_note,
     feature_dtypes,
     get_year_months,
     set_wandb_api_key,
     get_categorical_features,
 )
+from src.profiling import profiled
+from src.data.interim import (
+    MANIFEST_FILE_NAME,
+    read_manifest,
+    remove_source,
+    write_interim,
+    sample_interim,
+    write_manifest,
+    get_interim_store_dir,
+)
+from src.data.zip_reader import (
+    TripsSource,
+    open_trips_csv,
+    get_source_stem,
+    get_archive_sources,
+)
 
 load_dotenv(find_dotenv())
 
+CSV_READERS = ['pandas', 'pyarrow']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
 
 @task
-def process_data(
-    file_path: Path,
+@profiled()
+@memoized()
+def process_data(  # pylint: disable=too-many-arguments
+    file_path: TripsSource,
     categorical: [str] = None,
     target: str = TARGET_COL,
     keep: [str] = None,
     date_columns: [str] = None,
+    compact: bool = False,
+    reader: str = 'pandas',
 ) -> pd.DataFrame:
-    """Process data for modeling."""
+    """Process data for modeling.
+
+    With `compact` the categorical features are pandas categoricals and
+    the target is float32, see `clean_trips`. `reader` is the csv parser,
+    see `read_trips`.
+    """
 
     if keep is None:
         keep = ['started_at']
+    if categorical is None:
+        categorical = get_categorical_features()
+
+    print(f'processing {file_path}')
+    with open_trips_csv(file_path) as csv_file:
+        df = read_trips(
+            csv_file, categorical, date_columns, compact=compact, reader=reader
+        )
+
+    df = clean_trips(df, categorical, target, keep, compact)
+    print(f'{len(df):,} trips kept{memory_note([df], compact)}')
+    return df
+
+
+def init_process_worker(memory_limit_mb: int = None) -> None:
+    """Cap the address space of a process pool worker.
+
+    A worker going over the cap gets a `MemoryError`, which is raised again
+    in the parent, instead of the whole machine running out of memory.
+    """
+    if memory_limit_mb:
+        limit = memory_limit_mb * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def process_to_arrow(
+    file_path: TripsSource,
+    ipc_dir: Path,
+    compact: bool = False,
+    reader: str = 'pandas',
+) -> Path:
+    """Process a monthly file in a pool worker into an Arrow IPC file."""
+    df = process_data.fn(file_path, compact=compact, reader=reader)
+    ipc_path = Path(ipc_dir) / f'{get_source_stem(file_path)}.arrow'
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(str(ipc_path), 'wb') as sink, pa.ipc.new_file(
+        sink, table.schema
+    ) as writer:
+        writer.write_table(table)
+    return ipc_path
+
+
+def read_arrow(ipc_path: Path) -> pd.DataFrame:
+    """Trips written by `process_to_arrow`, read from a memory map."""
+    with pa.memory_map(str(ipc_path)) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+@task
+@profiled()
+def process_data_in_pool(
+    file_paths: [TripsSource],
+    n_workers: int,
+    memory_limit_mb: int = None,
+    compact: bool = False,
+    reader: str = 'pandas',
+) -> [pd.DataFrame]:
+    """`process_data` of every file, in a pool of `n_workers` processes.
+
+    Unlike Prefect's thread pool task runner, the processes parse and clean
+    the files in parallel without contending for the GIL. Each worker's
+    address space is capped at `memory_limit_mb`, about 800MB of which are
+    taken by the imported libraries before any file is read. Workers hand the trips
+    back as Arrow IPC files in `POOL_IPC_DIR` (the temp dir by default,
+    `/dev/shm` keeps them in shared memory), which the parent memory-maps
+    instead of unpickling DataFrames. The frames have a fresh index.
+    """
+    print(f'processing {len(file_paths)} files in {n_workers} processes')
+    with tempfile.TemporaryDirectory(
+        dir=os.getenv('POOL_IPC_DIR')
+    ) as ipc_dir, ProcessPoolExecutor(
+        max_workers=n_workers,
+        # spawn, because forking copies the parent's pyarrow thread pools
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_process_worker,
+        initargs=(memory_limit_mb,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                process_to_arrow, file_path, ipc_dir, compact, reader
+            )
+            for file_path in file_paths
+        ]
+        return [read_arrow(future.result()) for future in futures]
+
+
+@task
+@profiled()
+def stream_process_data(
+    file_path: TripsSource,
+    store_dir: Path,
+    sampler: 'ReservoirSampler' = None,
+    chunksize: int = 1_000_000,
+    compact: bool = False,
+) -> int:
+    """Process a monthly file chunk by chunk straight into the interim store.
+
+    Only one chunk is held in memory at a time, the cleaned chunks replace
+    whatever was stored for the same file before.
+    """
+    print(f'streaming {file_path} to {store_dir}')
+    categorical = get_categorical_features()
+    source = get_source_stem(file_path)
+    remove_source(store_dir, source)
+
+    n_rows = 0
+    with open_trips_csv(file_path) as csv_file, read_trips(
+        csv_file, chunksize=chunksize, compact=compact
+    ) as chunks:
+        for i, chunk in enumerate(chunks):
+            df = clean_trips(chunk, categorical, compact=compact)
+            if df.empty:
+                continue
+            write_interim(df, store_dir, f'{source}-{i}')
+            if sampler is not None:
+                sampler.update(df)
+            n_rows += len(df)
+    return n_rows
+
+
+def read_trips(  # pylint: disable=too-many-arguments
+    csv_file: Path | BinaryIO,
+    categorical: [str] = None,
+    date_columns: [str] = None,
+    chunksize: int = None,
+    compact: bool = False,
+    reader: str = 'pandas',
+) -> pd.DataFrame | pd.io.parsers.TextFileReader:
+    """Read the columns needed for modelling from a monthly trips csv.
+
+    `reader` is one of `CSV_READERS`: the pandas C parser or the
+    multi-threaded pyarrow one, which only reads whole files.
+    """
+    if reader not in CSV_READERS:
+        raise ValueError(f'reader must be one of {CSV_READERS}, not {reader!r}')
     if date_columns is None:
         date_columns = ['started_at', 'ended_at']
     if categorical is None:
         categorical = get_categorical_features()
 
-    print(f'processing {file_path}')
-    df = pd.read_csv(
-        file_path,
+    if reader == 'pyarrow':
+        if chunksize is not None:
+            raise ValueError('the pyarrow reader does not read in chunks')
+        return read_trips_pyarrow(csv_file, categorical, date_columns, compact)
+    return pd.read_csv(
+        csv_file,
         parse_dates=date_columns,
         usecols=categorical + date_columns,
-        dtype=feature_dtypes(),
+        dtype=feature_dtypes(compact),
+        chunksize=chunksize,
     )
 
-    # Drop rows with missing values - they tend to be outliers
-    df = df.dropna()
 
-    # Calculate duration in minutes
-    df['duration'] = df.ended_at - df.started_at
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
+def read_trips_pyarrow(
+    csv_file: Path | BinaryIO,
+    categorical: [str],
+    date_columns: [str],
+    compact: bool = False,
+) -> pd.DataFrame:
+    """`read_trips` with pyarrow's multi-threaded csv parser.
+
+    Timestamps are parsed with the `TIMESTAMP_FORMAT` of the raw files
+    (ISO 8601 as a fallback) instead of having their format inferred.
+    The frame is the same as pandas': empty strings are missing values and
+    the categories of the compact categoricals are sorted.
+    """
+    string_type = pa.dictionary(pa.int32(), pa.string()) if compact else None
+    table = pa_csv.read_csv(
+        csv_file,
+        read_options=pa_csv.ReadOptions(use_threads=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=categorical + date_columns,
+            column_types={
+                **{c: string_type or pa.string() for c in categorical},
+                **{c: pa.timestamp('ns') for c in date_columns},
+            },
+            timestamp_parsers=[TIMESTAMP_FORMAT, pa_csv.ISO8601],
+            strings_can_be_null=True,
+        ),
+    )
+    df = table.to_pandas()
+    if compact:
+        for column in categorical:
+            df[column] = df[column].cat.reorder_categories(
+                sorted(df[column].cat.categories)
+            )
+    return df
 
-    # Drop rows with duration < 0 or > 100 minutes
-    df = df[(df.duration >= 0) & (df.duration <= 100)]
 
-    # Drop rows with start_station_id not a number
-    df = df[df.start_station_id.str.contains('^[0-9]*$', regex=True, na=False)]
-    df = df[df.end_station_id.str.contains('^[0-9]*$', regex=True, na=False)]
+class ReservoirSampler:
+    """Uniform random sample of fixed size over a stream of dataframes.
+
+    Vectorized Algorithm R: the t-th row seen replaces a random slot with
+    probability size / t.
+    """
+
+    def __init__(self, size: int, seed: int = 42):
+        self.size = size
+        self.n_seen = 0
+        self.sample = pd.DataFrame()
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, df: pd.DataFrame) -> None:
+        n_fill = min(max(self.size - self.n_seen, 0), len(df))
+        if n_fill:
+            self.sample = pd.concat([self.sample, df.iloc[:n_fill]])
+            self.n_seen += n_fill
+        rest = df.iloc[n_fill:]
+        if rest.empty:
+            return
+
+        seen = self.n_seen + np.arange(1, len(rest) + 1)
+        slots = self.rng.integers(0, seen)
+        accepted = np.flatnonzero(slots < self.size)
+        # when a slot is drawn more than once the latest row wins,
+        # as it would if the rows were processed one by one
+        _, last = np.unique(slots[accepted][::-1], return_index=True)
+        accepted = accepted[len(accepted) - 1 - last]
+
+        positions = np.arange(self.size)
+        positions[slots[accepted]] = self.size + np.arange(len(accepted))
+        self.sample = pd.concat([self.sample, rest.iloc[accepted]]).iloc[
+            positions
+        ]
+        self.n_seen += len(rest)
+
+
+def valid_station_ids(station_ids: pd.Series) -> np.ndarray:
+    """Mask of rows whose station ID is made of digits only.
+
+    Only the distinct IDs (a few hundred stations) are checked against the
+    pattern, the result is broadcast back to the rows with the factorized codes.
+    """
+    codes, uniques = pd.factorize(station_ids)
+    valid = pd.Series(uniques).str.contains('^[0-9]*$', regex=True, na=False)
+    return np.append(valid.to_numpy(dtype=bool), False)[codes]
+
+
+def duration_minutes(started_at: pd.Series, ended_at: pd.Series) -> np.ndarray:
+    """Vectorized equivalent of `Timedelta.total_seconds() / 60`.
+
+    Works on the int64 nanoseconds and mirrors how pandas builds the seconds
+    from the normalized whole seconds and microseconds, so the resulting floats
+    are bit-for-bit the same as with the per-row `apply`.
+    """
+    started = started_at.to_numpy(dtype='datetime64[ns]').view('i8')
+    ended = ended_at.to_numpy(dtype='datetime64[ns]').view('i8')
+    seconds, microseconds = np.divmod((ended - started) // 1000, 1_000_000)
+    return (seconds + microseconds / 1_000_000) / 60
+
+
+def clean_trips(
+    df: pd.DataFrame,
+    categorical: [str],
+    target: str = TARGET_COL,
+    keep: [str] = None,
+    compact: bool = False,
+) -> pd.DataFrame:
+    """Drop incomplete, outlier and non-numeric station trips in one pass.
+
+    With `compact`, `ended_at` is dropped from `df` as soon as the duration
+    is computed, the duration is float32 and the categories of the dropped
+    rows (e.g. non-numeric stations) are removed from the categoricals.
+    """
+    if keep is None:
+        keep = ['started_at']
+
+    # Rows with missing values tend to be outliers
+    mask = df.notna().all(axis=1).to_numpy()
+
+    # Duration in minutes, NaT rows are already masked out
+    duration = duration_minutes(df.started_at, df.ended_at)
+    mask &= (duration >= 0) & (duration <= 100)
+    if compact:
+        del df['ended_at']
+        duration = duration.astype(np.float32)
+
+    # Station IDs that are not a number
+    mask &= valid_station_ids(df.start_station_id)
+    mask &= valid_station_ids(df.end_station_id)
+
+    df = df.loc[mask, categorical + keep]
+    df.insert(len(categorical), target, duration[mask])
+    if compact:
+        for column in categorical:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].cat.remove_unused_categories()
+    return df
+
+
+def concat_trips(dfs: [pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate trips keeping the categorical columns categorical.
 
-    return df[categorical + [target] + keep]
+    `pd.concat` falls back to object columns when the categories differ,
+    so the categoricals are first given the union of all their categories.
+    """
+    dfs = list(dfs)
+    if not dfs:
+        return pd.DataFrame()
+    dtypes = {}
+    for column in dfs[0].columns:
+        columns = [df[column] for df in dfs]
+        if all(isinstance(c.dtype, pd.CategoricalDtype) for c in columns):
+            categories = pd.api.types.union_categoricals(
+                columns, ignore_order=True
+            ).categories
+            dtypes[column] = pd.CategoricalDtype(categories)
+    return pd.concat([df.astype(dtypes) for df in dfs])
 
 
 @task
-def combine_save_data(dfs: [pd.DataFrame], file_path: Path) -> pd.DataFrame:
-    """Combine and save data."""
-    print(f'combining and saving data to {file_path}')
-    df = pd.concat(dfs)
-    df.to_csv(file_path, index=False)
-    return df
+@profiled()
+def combine_save_data(
+    dfs: [pd.DataFrame],
+    store_dir: Path,
+    sources: [str] = None,
+    compact: bool = False,
+) -> None:
+    """Save data to the partitioned Parquet interim store.
+
+    Every dataframe is written under its source (monthly file) name so that
+    an incremental run can later replace it, they're never concatenated.
+    `compact` tells that the trips have the compact dtypes, for their memory
+    per row to be logged.
+    """
+    print(f'combining and saving data to {store_dir}')
+    if sources is None:
+        sources = [f'part{i}' for i in range(len(dfs))]
+    shutil.rmtree(store_dir, ignore_errors=True)
+    for df, source in zip(dfs, sources):
+        write_interim(df, store_dir, source)
+    n_rows = sum(len(df) for df in dfs)
+    print(f'{n_rows:,} trips saved{memory_note(dfs, compact)}')
+
+
+@task
+@profiled()
+def append_data(dfs: [pd.DataFrame], store_dir: Path, sources: [str]) -> None:
+    """Add new monthly data to the interim store, replacing older versions."""
+    for df, source in zip(dfs, sources):
+        print(f'appending {source} to {store_dir}')
+        remove_source(store_dir, source)
+        write_interim(df, store_dir, source)
 
 
-def get_latest_data_year_month(data_dir: Path) -> (int, int):
-    """Get latest data year and month."""
-    latest_file_name = (sorted(data_dir.glob("*.csv"))[-1]).name
-    prefix = latest_file_name.split('-')[0]
+def year_month_from_file_name(file_name: str) -> (int, int):
+    prefix = file_name.split('-')[0]
     return int(prefix[:4]), int(prefix[4:6])
 
 
-@task
-def extract_zip(artifact_dir: Path) -> None:
-    zip_file_path = artifact_dir / 'all_raw_data.zip'
-    print(f'unzipping {zip_file_path}')
+def get_zip_fingerprints(zip_file_path: Path) -> dict:
+    """Size and CRC-32 of every monthly csv or zip archive in the archive.
+
+    Both are read from the zip central directory, nothing gets extracted.
+    """
     with ZipFile(zip_file_path, 'r') as zip_ref:
-        zip_ref.extractall(artifact_dir)
-    os.remove(zip_file_path)
+        return {
+            info.filename: {'size': info.file_size, 'crc32': info.CRC}
+            for info in zip_ref.infolist()
+            if info.filename[0].isdigit()
+            and info.filename.endswith(('.csv', '.zip'))
+        }
+
+
+def get_changed_file_paths(
+    file_paths: [TripsSource], fingerprints: dict, manifest: dict
+) -> [TripsSource]:
+    """Files that are new or changed since they were added to the store."""
+    return [
+        file_path
+        for file_path in file_paths
+        if manifest.get(file_path.name) != fingerprints[file_path.name]
+    ]
 
 
 def get_file_paths_to_process(
@@ -106,9 +463,71 @@ def get_file_paths_to_process(
     return file_paths_to_process
 
 
+def restore_interim_store(wandb_run, base_artifact: str, store_dir: Path):
+    """Seed the local interim store from a previously logged interim artifact.
+
+    Only artifacts with a Parquet store can be restored, not the older ones
+    with the combined csv.
+    """
+    print(f'restoring interim store from {base_artifact}')
+    artifact_dir = Path(
+        wandb_run.use_artifact(base_artifact, type='interim_data').download()
+    )
+    stores = list(artifact_dir.glob('*-interim.parquet'))
+    if not stores:
+        raise ValueError(
+            f'{base_artifact} has no Parquet interim store to restore'
+            ' (*-interim.parquet), it may be a csv interim artifact'
+        )
+    shutil.copytree(stores[0], store_dir)
+
+
+def can_append(store_dir: Path) -> bool:
+    """The store has the manifest of the monthly files written to it.
+
+    Without it the monthly files already in the store can't be told apart
+    from the new ones, appending them would duplicate their trips.
+    """
+    return (store_dir / MANIFEST_FILE_NAME).exists()
+
+
 @flow(name="prepare and combine raw data", log_prints=True)
-def combine_raw_data():
-    """Prepare data for modelling."""
+@profiled(report=True)
+# pylint: disable=too-many-locals,too-many-arguments
+def combine_raw_data(
+    incremental: bool = False,
+    base_artifact: str = None,
+    streaming: bool = False,
+    chunksize: int = 1_000_000,
+    compact: bool = False,
+    n_workers: int = None,
+    worker_memory_mb: int = None,
+    reader: str = 'pandas',
+):
+    """Prepare data for modelling.
+
+    With `incremental` only the monthly files that are new or changed since
+    the last run are processed and added to the local interim store.
+    If there is no local store yet it gets restored from `base_artifact`
+    (an interim artifact logged by this flow, with a Parquet store) or fully
+    rebuilt, like a store without the manifest of its monthly files.
+
+    With `streaming` the monthly files are processed one `chunksize` chunk
+    at a time instead of being all loaded and concatenated in memory.
+
+    With `compact` the trips are held in memory with categorical features
+    and a float32 target, several times smaller than with str columns.
+
+    With `n_workers` the monthly files are processed in that many processes,
+    each capped at `worker_memory_mb` of memory, instead of Prefect's threads.
+
+    `reader` is the csv parser of the monthly files, `pandas` or the
+    multi-threaded `pyarrow`, which can't be used with `streaming`.
+    """
+    import wandb  # pylint: disable=import-outside-toplevel
+
+    if streaming and reader != 'pandas':
+        raise ValueError('streaming reads the files with the pandas reader')
     set_wandb_api_key()
 
     with wandb.init(
@@ -120,38 +539,98 @@ def combine_raw_data():
             ).download()
         )
 
-        extract_zip(artifact_dir)
+        # monthly files are read straight from the archive, not extracted
+        zip_file_path = artifact_dir / 'all_raw_data.zip'
+        fingerprints = get_zip_fingerprints(zip_file_path)
+        archive_sources = get_archive_sources(zip_file_path)
 
         # hardcode start year and month for now cause before this date
         # the data is not in the same format
         start_year, start_month = 2020, 4
-        end_year, end_month = get_latest_data_year_month(artifact_dir)
-
-        file_paths_to_process = get_file_paths_to_process(
-            start_year,
-            start_month,
-            end_year,
-            end_month,
-            artifact_dir,
+        end_year, end_month = year_month_from_file_name(max(fingerprints))
+
+        file_paths_to_process = [
+            archive_sources[get_source_stem(file_path)]
+            for file_path in get_file_paths_to_process(
+                start_year,
+                start_month,
+                end_year,
+                end_month,
+                artifact_dir,
+            )
+        ]
+
+        interim_store_dir = get_interim_store_dir()
+        if incremental and not interim_store_dir.exists() and base_artifact:
+            restore_interim_store(wandb_run, base_artifact, interim_store_dir)
+        if incremental and not can_append(interim_store_dir):
+            if interim_store_dir.exists():
+                print(f'no manifest in {interim_store_dir}, rebuilding it')
+            incremental = False
+
+        manifest = read_manifest(interim_store_dir) if incremental else {}
+        file_paths_to_process = get_changed_file_paths(
+            file_paths_to_process, fingerprints, manifest
         )
-
-        dfs = process_data.map(file_paths_to_process)
-
-        result_prefix = f'{start_year}{start_month:02}-{end_year}{end_month:02}'
-
-        interim_data_path = (
-            get_data_dir() / 'interim' / f'{result_prefix}-interim.tar.gz'
+        print(f'{len(file_paths_to_process)} monthly files to process')
+
+        sampler = None
+        if streaming:
+            if not incremental:
+                # the W&B table sample can be built on the fly
+                sampler = ReservoirSampler(200_000)
+                shutil.rmtree(interim_store_dir, ignore_errors=True)
+            for file_path in file_paths_to_process:
+                stream_process_data(
+                    file_path, interim_store_dir, sampler, chunksize, compact
+                )
+        else:
+            if n_workers:
+                dfs = process_data_in_pool(
+                    file_paths_to_process,
+                    n_workers,
+                    worker_memory_mb,
+                    compact,
+                    reader,
+                )
+            else:
+                dfs = process_data.map(
+                    file_paths_to_process,
+                    compact=unmapped(compact),
+                    reader=unmapped(reader),
+                )
+            sources = [get_source_stem(path) for path in file_paths_to_process]
+
+            if incremental:
+                append_data(dfs, interim_store_dir, sources, wait_for=[dfs])
+            else:
+                combine_save_data(
+                    dfs, interim_store_dir, sources, compact, wait_for=[dfs]
+                )
+
+        manifest.update(
+            {
+                path.name: fingerprints[path.name]
+                for path in file_paths_to_process
+            }
         )
+        write_manifest(interim_store_dir, manifest)
 
-        all_data_df = combine_save_data(dfs, interim_data_path, wait_for=[dfs])
+        result_prefix = f'{start_year}{start_month:02}-{end_year}{end_month:02}'
 
         artifact = wandb.Artifact(
             f'{result_prefix}-{wandb_params.INTERIM_DATA}', type='interim_data'
         )
-        artifact.add_file(interim_data_path)
+        artifact.add_dir(
+            interim_store_dir, name=f'{result_prefix}-interim.parquet'
+        )
 
         # Add random sample of data to wandb table cause it has 200k row limit
-        interim_data_table = wandb.Table(dataframe=all_data_df.sample(200_000))
+        interim_data_table = wandb.Table(
+            dataframe=sampler.sample
+            if sampler is not None
+            else sample_interim(interim_store_dir, 200_000)
+        )
         artifact.add(interim_data_table, name='interim_data_table')
 
         wandb_run.log_artifact(artifact)
@@ -1,37 +1,53 @@
 import os
-import shutil
 from pathlib import Path
-from zipfile import ZipFile
+from zipfile import ZIP_STORED, ZIP_DEFLATED, ZipFile
 from datetime import datetime
 
-import requests
 from dotenv import find_dotenv, load_dotenv
 from prefect import flow, task
 
-import wandb
 from src import wandb_params
 from src.utils import get_data_dir, get_year_months, set_wandb_api_key
+from src.profiling import profiled
+from src.data.downloader import DOWNLOADED, download_files
+from src.data.zip_reader import find_trips_csv_member
 
 BASE_URL = 'https://s3.amazonaws.com/capitalbikeshare-data/'
 
 load_dotenv(find_dotenv())
 
 
+def is_downloaded(zip_file_path: Path) -> bool:
+    """The archive or the csv extracted from it is there.
+
+    Months downloaded before the download state was kept are up to date,
+    only their validators are fetched.
+    """
+    return zip_file_path.exists() or zip_file_path.with_suffix('.csv').exists()
+
+
 @task(retries=3)
-def download_locally(file_name: str) -> Path:
-    """Download files locally to process and concatenate."""
-    print(f'downloading {file_name}')
-    dir_path = get_data_dir()
-    filepath = Path(dir_path / 'raw' / file_name)
-    if not filepath.exists():
-        url = BASE_URL + file_name
-        response = requests.get(url, timeout=100)
-        if response.status_code != 200:
-            return None
-        with filepath.open('wb') as f:
-            f.write(response.content)
-            print(f'downloaded {file_name}')
-    return filepath
+@profiled()
+def download_locally(file_names: [str], max_workers: int = 8) -> [Path]:
+    """Download files locally to process and concatenate.
+
+    Returns the files that were (re)downloaded, files that haven't changed
+    since the last download are skipped.
+    """
+    print(f'downloading {len(file_names)} files')
+    dir_path = get_data_dir() / 'raw'
+    statuses = download_files(
+        file_names,
+        BASE_URL,
+        dir_path,
+        max_workers=max_workers,
+        is_present=is_downloaded,
+    )
+    return [
+        dir_path / file_name
+        for file_name, status in statuses.items()
+        if status == DOWNLOADED
+    ]
 
 
 @task
@@ -40,10 +56,7 @@ def unzip_file(zip_file_path: Path) -> None:
     if zip_file_path:
         print(f'unzipping {zip_file_path}')
         with ZipFile(zip_file_path, 'r') as zip_ref:
-            csv_filename = list(
-                filter(lambda x: x.startswith('2'), zip_ref.namelist())
-            )[0]
-            extracted_csv_path = zip_ref.extract(csv_filename)
+            extracted_csv_path = zip_ref.extract(find_trips_csv_member(zip_ref))
         # needed because some zipped cvs files are named incorrectly
         print(f'extracted {extracted_csv_path}')
         Path(extracted_csv_path).rename(zip_file_path.with_suffix('.csv'))
@@ -51,16 +64,34 @@ def unzip_file(zip_file_path: Path) -> None:
 
 
 @task
+@profiled()
 def zip_the_folder() -> str:
-    """Zip the raw data folder."""
+    """Zip the raw data folder.
+
+    The monthly archives are stored as they are: they are already compressed
+    and the combine flow reads them without extracting anything. Csv files
+    are only added for months without an archive (extracted by older runs).
+    """
     print('creating zip archive with all the raw data')
-    return shutil.make_archive(
-        get_data_dir() / 'all_raw_data', 'zip', get_data_dir() / 'raw'
-    )
+    raw_dir = get_data_dir() / 'raw'
+    archive_path = get_data_dir() / 'all_raw_data.zip'
+    with ZipFile(archive_path, 'w') as zip_ref:
+        for file_path in sorted(raw_dir.glob('[0-9]*')):
+            if file_path.suffix == '.zip':
+                zip_ref.write(file_path, file_path.name, ZIP_STORED)
+            elif (
+                file_path.suffix == '.csv'
+                and not file_path.with_suffix('.zip').exists()
+            ):
+                zip_ref.write(file_path, file_path.name, ZIP_DEFLATED)
+    return str(archive_path)
 
 
 @flow(name="download and unzip all the data")
-def download_and_unzip_all_the_data() -> None:
+@profiled()
+def download_and_unzip_all_the_data(
+    max_workers: int = 8, extract: bool = False
+) -> None:
     cur_date = datetime.now()
     years, year_months = get_year_months(2018, 1, cur_date.year, cur_date.month)
     zip_file_names = []
@@ -69,19 +100,23 @@ def download_and_unzip_all_the_data() -> None:
             zip_file_name = f'{year}{month:02}-capitalbikeshare-tripdata.zip'
             zip_file_names.append(zip_file_name)
     print('start downloading all the data')
-    local_zips = download_locally.map(zip_file_names)
-    unzip_file.map(local_zips)
+    local_zips = download_locally(zip_file_names, max_workers)
+    if extract:
+        unzip_file.map(local_zips)
     print('finished downloading all the data')
 
 
 @flow(name="download raw data", log_prints=True)
-def download_raw_data():
+@profiled(report=True)
+def download_raw_data(max_workers: int = 8):
     """Download all available raw data starting from Jan 2018 up till the current date."""
+    import wandb  # pylint: disable=import-outside-toplevel
+
     set_wandb_api_key()
     with wandb.init(
         project=wandb_params.WANDB_PROJECT, job_type="upload"
     ) as wandb_run:
-        all_downloaded = download_and_unzip_all_the_data()
+        all_downloaded = download_and_unzip_all_the_data(max_workers)
 
         artifact = wandb.Artifact(wandb_params.RAW_DATA, type='raw_data')
         all_zip = zip_the_folder(wait_for=[all_downloaded])
@@ -0,0 +1,190 @@
+"""Concurrent, resumable downloads of the monthly trip data archives.
+
+All requests share one pooled session. Files are streamed to a `.part` file
+in chunks, an interrupted download is resumed with an HTTP Range request and
+the ETag/Last-Modified validators of every downloaded file are kept in a
+state file next to the downloads, so unchanged files are skipped with a
+conditional request. Files downloaded before the state was kept are left
+as they are, only their validators are recorded.
+"""
+import json
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+STATE_FILE_NAME = '.download_state.json'
+CHUNK_SIZE = 1024 * 1024
+
+DOWNLOADED = 'downloaded'
+NOT_MODIFIED = 'not_modified'
+MISSING = 'missing'
+
+
+def create_session(pool_size: int = 8) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504]
+        ),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def read_state(dest_dir: Path) -> dict:
+    state_path = dest_dir / STATE_FILE_NAME
+    if not state_path.exists():
+        return {}
+    return json.loads(state_path.read_text())
+
+
+def write_state(dest_dir: Path, state: dict) -> None:
+    (dest_dir / STATE_FILE_NAME).write_text(
+        json.dumps(state, indent=2, sort_keys=True)
+    )
+
+
+def request_headers(
+    validators: dict, is_present: bool, part_size: int, part_validators: dict
+) -> dict:
+    headers = {}
+    if is_present and validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    elif part_size:
+        # Only resume if the remote file hasn't changed in the meantime,
+        # otherwise the server sends the whole new file. Without a validator
+        # the partial file is downloaded again.
+        validator = part_validators.get('etag') or part_validators.get(
+            'last_modified'
+        )
+        if validator:
+            headers['Range'] = f'bytes={part_size}-'
+            headers['If-Range'] = validator
+    return headers
+
+
+def response_validators(response: requests.Response) -> dict:
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+
+# pylint: disable=too-many-arguments
+def download_file(
+    session: requests.Session,
+    url: str,
+    file_path: Path,
+    validators: dict = None,
+    is_present: bool = None,
+    timeout: int = 100,
+) -> (str, dict):
+    """Download `url` to `file_path` unless the local copy is up to date.
+
+    `validators` are the ETag/Last-Modified of the previous download of an
+    up to date local copy. A local copy without them is kept and the remote
+    file's validators are fetched with a HEAD request. A partial download is
+    resumed if the remote file still has the validators it was started with,
+    or downloaded again if it can't be resumed. Returns the download status
+    and the validators of the remote file.
+    """
+    if is_present is None:
+        is_present = file_path.exists()
+    if is_present and not validators:
+        response = session.head(url, timeout=timeout)
+        if response.status_code != 200:
+            return NOT_MODIFIED, validators
+        return NOT_MODIFIED, response_validators(response)
+    part_path = file_path.with_name(file_path.name + '.part')
+    part_validators_path = file_path.with_name(file_path.name + '.part.json')
+    part_size = part_path.stat().st_size if part_path.exists() else 0
+    part_validators = (
+        json.loads(part_validators_path.read_text())
+        if part_validators_path.exists()
+        else {}
+    )
+
+    with session.get(
+        url,
+        headers=request_headers(
+            validators, is_present, part_size, part_validators
+        ),
+        stream=True,
+        timeout=timeout,
+    ) as response:
+        if response.status_code == 304:
+            return NOT_MODIFIED, validators
+        if response.status_code == 416 and part_size:
+            # the partial file can't be resumed (e.g. it is already complete
+            # but wasn't renamed), download the whole file again
+            part_path.unlink()
+            part_validators_path.unlink(missing_ok=True)
+            return download_file(
+                session, url, file_path, validators, is_present, timeout
+            )
+        if response.status_code not in (200, 206):
+            return MISSING, validators
+
+        if response.status_code == 206:
+            # continue the partial file
+            mode, remote_validators = 'ab', part_validators
+        else:
+            mode = 'wb'
+            remote_validators = response_validators(response)
+            part_validators_path.write_text(json.dumps(remote_validators))
+        with part_path.open(mode) as f_out:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f_out.write(chunk)
+
+    part_path.replace(file_path)
+    part_validators_path.unlink()
+    return DOWNLOADED, remote_validators
+
+
+def download_files(
+    file_names: [str],
+    base_url: str,
+    dest_dir: Path,
+    max_workers: int = 8,
+    is_present=None,
+) -> dict:
+    """Download files concurrently, skipping the ones that haven't changed.
+
+    `is_present(file_path)` tells whether an up to date local copy exists,
+    by default the downloaded file itself has to be there.
+    Returns the download status of every file.
+    """
+    if is_present is None:
+        is_present = Path.exists
+    state = read_state(dest_dir)
+    state_lock = threading.Lock()
+    session = create_session(pool_size=max_workers)
+
+    def download(file_name):
+        file_path = dest_dir / file_name
+        status, validators = download_file(
+            session,
+            base_url + file_name,
+            file_path,
+            state.get(file_name),
+            is_present(file_path),
+        )
+        print(f'{file_name}: {status}')
+        if validators and validators != state.get(file_name):
+            with state_lock:
+                state[file_name] = validators
+                write_state(dest_dir, state)
+        return status
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(file_names, executor.map(download, file_names)))
@@ -0,0 +1,137 @@
+"""Columnar storage of the interim (combined and cleaned) trip data.
+
+The trips are kept as a Parquet dataset partitioned by the year and month of
+`started_at`, categorical features are dictionary encoded and timestamps are
+stored natively, so reading a date range only touches the months it needs and
+nothing has to be re-parsed.
+"""
+import json
+from pathlib import Path
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.utils import get_data_dir, get_categorical_features
+
+PARTITION_COLS = ['year', 'month']
+# Files starting with an underscore are ignored when reading the dataset
+MANIFEST_FILE_NAME = '_manifest.json'
+
+
+def get_interim_store_dir() -> Path:
+    return get_data_dir() / 'interim' / 'trips.parquet'
+
+
+def to_interim_table(df: pd.DataFrame) -> pa.Table:
+    df = df.assign(
+        **{
+            feature: df[feature].astype('category')
+            for feature in get_categorical_features()
+            if feature in df
+        },
+        year=df.started_at.dt.year,
+        month=df.started_at.dt.month,
+    )
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def write_interim(
+    df: pd.DataFrame, store_dir: Path, source: str = 'part'
+) -> None:
+    """Write trips to the store, one file per month touched by `df`.
+
+    Files are named after `source`, writing the same source again replaces
+    its files.
+    """
+    pq.write_to_dataset(
+        to_interim_table(df),
+        store_dir,
+        partition_cols=PARTITION_COLS,
+        basename_template=f'{source}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+
+def remove_source(store_dir: Path, source: str) -> None:
+    """Remove the files written for `source` from every partition."""
+    for file_path in store_dir.glob(f'year=*/month=*/{source}-*.parquet'):
+        file_path.unlink()
+
+
+def read_manifest(store_dir: Path) -> dict:
+    """Read the fingerprints of the source files already in the store."""
+    manifest_path = store_dir / MANIFEST_FILE_NAME
+    if not manifest_path.exists():
+        return {}
+    return json.loads(manifest_path.read_text())
+
+
+def write_manifest(store_dir: Path, manifest: dict) -> None:
+    store_dir.mkdir(parents=True, exist_ok=True)
+    (store_dir / MANIFEST_FILE_NAME).write_text(
+        json.dumps(manifest, indent=2, sort_keys=True)
+    )
+
+
+def started_at_filter(
+    start_date: date = None, end_date: date = None
+) -> ds.Expression | None:
+    """Filter for trips started in [start_date, end_date).
+
+    The year/month part prunes whole partitions, the `started_at` part is
+    pushed down to the row groups and makes the bounds exact.
+    """
+    year, month = ds.field('year'), ds.field('month')
+    started_at = ds.field('started_at')
+    conditions = []
+    if start_date is not None:
+        conditions.append(
+            (year > start_date.year)
+            | ((year == start_date.year) & (month >= start_date.month))
+        )
+        conditions.append(started_at >= pd.Timestamp(start_date))
+    if end_date is not None:
+        conditions.append(
+            (year < end_date.year)
+            | ((year == end_date.year) & (month <= end_date.month))
+        )
+        conditions.append(started_at < pd.Timestamp(end_date))
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression &= condition
+    return expression
+
+
+def read_interim(
+    store_dir: Path,
+    start_date: date = None,
+    end_date: date = None,
+    columns: [str] = None,
+) -> pd.DataFrame:
+    """Read trips started in [start_date, end_date) from the store."""
+    table = pq.read_table(
+        store_dir,
+        columns=columns,
+        filters=started_at_filter(start_date, end_date),
+    )
+    table = table.drop(
+        [column for column in PARTITION_COLS if column in table.column_names]
+    )
+    return table.to_pandas()
+
+
+def sample_interim(store_dir: Path, n: int, seed: int = 42) -> pd.DataFrame:
+    """Uniform random sample of `n` trips without loading the whole store."""
+    dataset = ds.dataset(store_dir, partitioning='hive')
+    n_rows = dataset.count_rows()
+    indices = np.random.default_rng(seed).choice(
+        n_rows, size=min(n, n_rows), replace=False
+    )
+    table = dataset.take(np.sort(indices))
+    return table.drop(PARTITION_COLS).to_pandas()
@@ -8,50 +8,157 @@ from dotenv import find_dotenv, load_dotenv
 from prefect import flow, task
 from sklearn.feature_extraction import DictVectorizer
 
-import wandb
 from src import wandb_params
+from src.cache import memoized
 from src.utils import (
     TARGET_COL,
-    dump_pickle,
+    memory_note,
     get_data_dir,
     feature_dtypes,
     set_wandb_api_key,
+    to_compact_dtypes,
     get_categorical_features,
 )
+from src.profiling import profiled
+from src.data.interim import read_interim
+from src.data.processed import write_processed
+from src.features.encoding import CategoricalVectorizer
+from src.features.station_pairs import (
+    PAIR_FEATURES,
+    update_features,
+    add_pair_features,
+)
 
 load_dotenv(find_dotenv())
 
 
-# pylint: disable=too-many-locals
-def preprocess(
-    df: pd.DataFrame,
-    dv: DictVectorizer,
-    fit_dv: bool = False,
-) -> (sp.sparse.csr_matrix, DictVectorizer):
+def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     # Create ride start hour of day feature
     df['hour'] = df.started_at.dt.hour
     df['month'] = df.started_at.dt.month
     df['year'] = df.started_at.dt.year
+    return df
+
+
+def get_features(
+    df: pd.DataFrame, dv: DictVectorizer | CategoricalVectorizer
+) -> pd.DataFrame | list[dict]:
+    columns = get_categorical_features() + ['hour', 'year', 'month']
+    features = df[columns + [c for c in PAIR_FEATURES if c in df]]
+    if isinstance(dv, DictVectorizer):
+        return features.to_dict(orient="records")
+    return features
+
+
+# pylint: disable=too-many-locals
+def preprocess(
+    df: pd.DataFrame,
+    dv: DictVectorizer | CategoricalVectorizer,
+    fit_dv: bool = False,
+) -> (sp.sparse.csr_matrix, DictVectorizer | CategoricalVectorizer):
+    df = add_time_features(df)
 
     if fit_dv:
-        print("Fitting DictVectorizer...")
+        print(f"Fitting {type(dv).__name__}...")
     else:
         print("Transforming data...")
-    dicts = df[get_categorical_features() + ['hour', 'year', 'month']].to_dict(
-        orient="records"
-    )
-    X = dv.fit_transform(dicts) if fit_dv else dv.transform(dicts)
+    features = get_features(df, dv)
+    X = dv.fit_transform(features) if fit_dv else dv.transform(features)
     return X, dv
 
 
+def assign_splits(started_at: pd.Series, split_dates: [date]) -> np.ndarray:
+    """Index i of the [split_dates[i], split_dates[i + 1]) period of every trip.
+
+    Trips before the first date get -1, trips from the last date on get
+    len(split_dates) - 1.
+    """
+    boundaries = np.array(split_dates, dtype='datetime64[ns]')
+    return (
+        np.searchsorted(
+            boundaries,
+            started_at.to_numpy(dtype='datetime64[ns]'),
+            side='right',
+        )
+        - 1
+    )
+
+
+def csr_row_blocks(
+    X: sp.sparse.csr_matrix, bounds: np.ndarray
+) -> [sp.sparse.csr_matrix]:
+    """Split a CSR matrix into consecutive row blocks sharing its buffers."""
+    blocks = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        first, last = X.indptr[start], X.indptr[end]
+        blocks.append(
+            sp.sparse.csr_matrix(
+                (
+                    X.data[first:last],
+                    X.indices[first:last],
+                    X.indptr[start : end + 1] - first,
+                ),
+                shape=(end - start, X.shape[1]),
+                copy=False,
+            )
+        )
+    return blocks
+
+
+@task
+@profiled()
+@memoized()
+def split_by_dates(
+    df: pd.DataFrame,
+    split_dates: [date],
+    dv: DictVectorizer | CategoricalVectorizer,
+    fit_dv: bool = False,
+) -> (
+    [(sp.sparse.csr_matrix, np.ndarray)],
+    DictVectorizer | CategoricalVectorizer,
+):
+    """Split trips into the [split_dates[i], split_dates[i + 1]) periods.
+
+    The split of every row comes from a single searchsorted over the split
+    boundaries, features are derived and encoded once for all the splits,
+    so any number of splits (e.g. rolling monthly backtests) costs the same
+    as one. When fitting, the vectorizer is fitted on the first split only.
+    """
+    print(f"Split data at {', '.join(map(str, split_dates))}")
+    n_splits = len(split_dates) - 1
+    labels = assign_splits(df.started_at, split_dates)
+    in_splits = (labels >= 0) & (labels < n_splits)
+    if not in_splits.all():
+        df, labels = df[in_splits].copy(), labels[in_splits]
+    df = add_time_features(df)
+
+    if fit_dv:
+        print(f"Fitting {type(dv).__name__}...")
+        dv.fit(get_features(df[labels == 0], dv))
+    print("Transforming data...")
+    X = dv.transform(get_features(df, dv))
+
+    # Group the rows by split keeping their order within a split
+    order = np.argsort(labels.astype(np.int16), kind='stable')
+    X, y = X[order], df[TARGET_COL].to_numpy()[order]
+    bounds = np.searchsorted(labels[order], np.arange(n_splits + 1))
+    splits = [
+        (X_split, y[start:end])
+        for X_split, start, end in zip(
+            csr_row_blocks(X, bounds), bounds[:-1], bounds[1:]
+        )
+    ]
+    return splits, dv
+
+
 @task
 def dataset_split(
     df: pd.DataFrame,
     end_split_date: date,
-    dv: DictVectorizer,
+    dv: DictVectorizer | CategoricalVectorizer,
     fit_dv: bool = False,
     start_split_date: date = date(1970, 1, 1),
-) -> (sp.sparse.csr_matrix, np.ndarray, DictVectorizer):
+) -> (sp.sparse.csr_matrix, np.ndarray, DictVectorizer | CategoricalVectorizer):
     print(
         f"Extract split from {start_split_date} to {end_split_date} and target {TARGET_COL}"
     )
@@ -64,6 +171,38 @@ def dataset_split(
     return X, y, dv
 
 
+@profiled()
+def load_interim_data(
+    artifact_dir: Path,
+    start_date: date = None,
+    end_date: date = None,
+    compact: bool = False,
+) -> pd.DataFrame:
+    """Load trips started in [start_date, end_date) from the interim artifact.
+
+    Falls back to the CSV that older interim artifacts contain.
+    With `compact` the categorical features are categoricals and the target
+    is float32.
+    """
+    store_dir = artifact_dir / '202004-202306-interim.parquet'
+    if store_dir.exists():
+        df = read_interim(store_dir, start_date, end_date)
+    else:
+        df = pd.read_csv(
+            artifact_dir / '202004-202306-interim.tar.gz',
+            parse_dates=['started_at'],
+            dtype=feature_dtypes(compact),
+        )
+        if start_date is not None:
+            df = df[df.started_at >= pd.Timestamp(start_date)]
+        if end_date is not None:
+            df = df[df.started_at < pd.Timestamp(end_date)]
+    if compact:
+        df = to_compact_dtypes(df)
+    print(f'{len(df):,} trips loaded{memory_note([df], compact)}')
+    return df
+
+
 # to make preparation parametrized
 # @click.command()
 # @click.option('--start_year', help='start year for modelling data', type=int)
@@ -71,6 +210,7 @@ def dataset_split(
 # @click.option('--end_year', default=2023, help='end year for modelling data')
 # @click.option('--end_month', default=5, help='end month for modelling data')
 @flow(name="prepare and split into train, val, test", log_prints=True)
+@profiled(report=True)
 # pylint: disable=too-many-arguments
 def prepare_data(
     train_split_year: int = 2023,
@@ -79,7 +219,17 @@ def prepare_data(
     val_split_month: int = 5,
     test_split_year: int = 2023,
     test_split_month: int = 6,
+    compact: bool = False,
+    pair_features: bool = False,
 ):
+    """Encode and split the interim trips into the processed data.
+
+    With `pair_features` the trips get the station pair aggregates of the
+    months before their own (see `src.features.station_pairs`), from the
+    feature store brought up to date with the interim artifact first.
+    """
+    import wandb  # pylint: disable=import-outside-toplevel
+
     print("Preparing data...")
     set_wandb_api_key()
     with wandb.init(
@@ -91,35 +241,39 @@ def prepare_data(
             ).download()
         )
 
-        print(f'Loading data from {artifact_dir}')
-        df = pd.read_csv(
-            artifact_dir / '202004-202306-interim.tar.gz',
-            parse_dates=['started_at'],
-            dtype=feature_dtypes(),
-        )
-
         train_split_date = date(train_split_year, train_split_month, 1)
         val_split_date = date(val_split_year, val_split_month, 1)
         test_split_date = date(test_split_year, test_split_month, 1)
 
-        dv = DictVectorizer()
-        X_train, y_train, dv = dataset_split(
-            df, train_split_date, dv, fit_dv=True
-        )
-        X_val, y_val, _ = dataset_split(
-            df, val_split_date, dv, start_split_date=train_split_date
+        print(f'Loading data from {artifact_dir}')
+        df = load_interim_data(
+            artifact_dir, end_date=test_split_date, compact=compact
         )
-        X_test, y_test, _ = dataset_split(
-            df, test_split_date, dv, start_split_date=val_split_date
+        if pair_features:
+            update_features(artifact_dir / '202004-202306-interim.parquet')
+            df = add_pair_features(df)
+
+        split_dates = [
+            date(1970, 1, 1),
+            train_split_date,
+            val_split_date,
+            test_split_date,
+        ]
+        splits, dv = split_by_dates(
+            df, split_dates, CategoricalVectorizer(), fit_dv=True
         )
 
-        print('Saving DictVectorizer and datasets')
+        print('Saving vectorizer and datasets')
         dest_path = get_data_dir() / "processed"
-
-        dump_pickle(dv, dest_path / "dv.pkl")
-        dump_pickle((X_train, y_train), dest_path / "train.pkl")
-        dump_pickle((X_val, y_val), dest_path / "val.pkl")
-        dump_pickle((X_test, y_test), dest_path / "test.pkl")
+        write_processed(
+            dest_path,
+            dv,
+            [
+                (split, X, y)
+                for split, (X, y) in zip(['train', 'val', 'test'], splits)
+            ],
+            split_dates,
+        )
 
         # pylint: disable=line-too-long
         prefix = f'{train_split_date.strftime("%Y%m")}-{val_split_date.strftime("%Y%m")}-{test_split_date.strftime("%Y%m")}'
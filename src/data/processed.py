@@ -0,0 +1,96 @@
+"""Storage of the processed (encoded and split) data.
+
+Every split is stored as the raw `.npy` arrays of its CSR matrix and labels,
+`<split>_data.npy`, `<split>_indices.npy`, `<split>_indptr.npy` and
+`<split>_y.npy`, which load memory-mapped, without unpickling or copying.
+They sit next to the fitted vectorizer `dv.pkl` and `manifest.json`, with the
+shape of every split, its dates and the feature names.
+
+Data processed before this format has a `<split>.pkl` pickle of `(X, y)`
+instead, `load_processed_split` reads both.
+"""
+import json
+from pathlib import Path
+from datetime import date
+
+import numpy as np
+import scipy as sp
+
+from src.utils import read_pickle, write_pickle
+
+FORMAT_VERSION = 1
+MANIFEST_FILE_NAME = 'manifest.json'
+CSR_COMPONENTS = ['data', 'indices', 'indptr']
+
+
+def save_split(
+    X: sp.sparse.csr_matrix, y: np.ndarray, dest_dir: Path, split: str
+) -> dict:
+    """Write the arrays of a split, returns its manifest entry."""
+    for component in CSR_COMPONENTS:
+        np.save(dest_dir / f'{split}_{component}.npy', getattr(X, component))
+    np.save(dest_dir / f'{split}_y.npy', y)
+    return {'shape': list(X.shape), 'nnz': int(X.nnz)}
+
+
+def write_processed(
+    dest_dir: Path,
+    dv,
+    splits: [(str, sp.sparse.csr_matrix, np.ndarray)],
+    split_dates: [date] = None,
+) -> dict:
+    """Write the vectorizer, the `(name, X, y)` splits and their manifest.
+
+    Split `i` covers `[split_dates[i], split_dates[i + 1])`. The pickles of
+    the older format are removed, so the directory holds a single copy of
+    the data.
+    """
+    dest_dir = Path(dest_dir)
+    write_pickle(dv, dest_dir / 'dv.pkl')
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'feature_names': list(dv.get_feature_names_out()),
+        'splits': {},
+    }
+    for i, (split, X, y) in enumerate(splits):
+        manifest['splits'][split] = save_split(X, y, dest_dir, split)
+        if split_dates is not None:
+            manifest['splits'][split]['dates'] = [
+                split_dates[i].isoformat(),
+                split_dates[i + 1].isoformat(),
+            ]
+        (dest_dir / f'{split}.pkl').unlink(missing_ok=True)
+    (dest_dir / MANIFEST_FILE_NAME).write_text(json.dumps(manifest))
+    return manifest
+
+
+def read_manifest(data_dir: Path) -> dict | None:
+    """Manifest of the processed data, None for the older format."""
+    manifest_path = Path(data_dir) / MANIFEST_FILE_NAME
+    if not manifest_path.exists():
+        return None
+    return json.loads(manifest_path.read_text())
+
+
+def load_split(
+    data_dir: Path, split: str, mmap: bool = True
+) -> (sp.sparse.csr_matrix, np.ndarray):
+    """CSR matrix and labels of a split, memory-mapped unless `mmap=False`."""
+    mmap_mode = 'r' if mmap else None
+    data, indices, indptr = (
+        np.load(data_dir / f'{split}_{component}.npy', mmap_mode=mmap_mode)
+        for component in CSR_COMPONENTS
+    )
+    shape = tuple(read_manifest(data_dir)['splits'][split]['shape'])
+    X = sp.sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+    return X, np.load(data_dir / f'{split}_y.npy', mmap_mode=mmap_mode)
+
+
+def load_processed_split(
+    data_dir: Path, split: str, mmap: bool = True
+) -> (sp.sparse.csr_matrix, np.ndarray):
+    """`(X, y)` of a split in either format, in place of `read_pickle`."""
+    data_dir = Path(data_dir)
+    if read_manifest(data_dir) is None:
+        return read_pickle(data_dir / f'{split}.pkl')
+    return load_split(data_dir, split, mmap)
@@ -0,0 +1,79 @@
+"""Read the monthly trip csv files straight out of their zip archives.
+
+A trips source is either a file (csv or monthly zip archive) or a member of
+the aggregated raw data archive, which in turn is a csv or a monthly zip
+archive. Nothing gets extracted to disk.
+"""
+from pathlib import Path
+from zipfile import ZipFile
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ArchiveMember:
+    """A file inside a zip archive."""
+
+    archive: Path
+    name: str
+
+    def __str__(self) -> str:
+        return f'{self.archive}/{self.name}'
+
+    def content_digest(self) -> str:
+        """CRC-32 and size of the member, from the zip central directory."""
+        with ZipFile(self.archive) as zip_ref:
+            info = zip_ref.getinfo(self.name)
+        return f'{info.CRC:08x}-{info.file_size}'
+
+    @contextmanager
+    def open(self, mode: str = 'rb'):
+        with ZipFile(self.archive) as zip_ref, zip_ref.open(
+            self.name, mode.rstrip('b')
+        ) as file_obj:
+            yield file_obj
+
+
+TripsSource = Path | ArchiveMember
+
+
+def find_trips_csv_member(zip_ref: ZipFile) -> str:
+    """Root level csv of a monthly archive.
+
+    The first csv whose name starts with a year, whatever the rest of its
+    name, because some zipped csv files are named incorrectly.
+    """
+    return [
+        name
+        for name in zip_ref.namelist()
+        if name.startswith('2') and name.endswith('.csv')
+    ][0]
+
+
+def get_source_stem(source: TripsSource) -> str:
+    """Stem of a source file name, e.g. 202306-capitalbikeshare-tripdata."""
+    return Path(str(source)).stem
+
+
+@contextmanager
+def open_trips_csv(source: TripsSource):
+    """Binary file object of the trips csv of a source."""
+    with ExitStack() as stack:
+        file_obj = stack.enter_context(source.open('rb'))
+        if str(source).endswith('.zip'):
+            zip_ref = stack.enter_context(ZipFile(file_obj))
+            file_obj = stack.enter_context(
+                zip_ref.open(find_trips_csv_member(zip_ref))
+            )
+        yield file_obj
+
+
+def get_archive_sources(zip_file_path: Path) -> {str: ArchiveMember}:
+    """Monthly sources of the aggregated archive by their stem."""
+    with ZipFile(zip_file_path) as zip_ref:
+        names = zip_ref.namelist()
+    return {
+        get_source_stem(name): ArchiveMember(zip_file_path, name)
+        for name in names
+        if name[0].isdigit() and name.endswith(('.csv', '.zip'))
+    }
@@ -0,0 +1,108 @@
+import numpy as np
+import scipy as sp
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from src.utils import get_categorical_features
+
+
+class CategoricalVectorizer(TransformerMixin, BaseEstimator):
+    """Drop-in replacement of DictVectorizer for dataframes.
+
+    Categorical columns are one-hot encoded as `column=value` features and all
+    the other columns are used as numeric features, with the same sorted
+    feature order as a DictVectorizer fitted on the dataframe records.
+    Instead of going through a dict per row, the CSR matrix is built directly
+    from the pandas categorical codes, so only the distinct values of every
+    column are ever handled in Python.
+    Values unseen during fit are ignored, as DictVectorizer does.
+    """
+
+    def __init__(self, categorical: [str] = None, dtype=np.float64):
+        self.categorical = categorical
+        self.dtype = dtype
+
+    def _categorical(self) -> [str]:
+        if self.categorical is None:
+            return get_categorical_features()
+        return self.categorical
+
+    @staticmethod
+    def _to_frame(X) -> pd.DataFrame:
+        if isinstance(X, pd.DataFrame):
+            return X
+        if isinstance(X, dict):
+            X = [X]
+        return pd.DataFrame.from_records(X)
+
+    # pylint: disable=unused-argument,attribute-defined-outside-init
+    def fit(self, X, y=None):
+        X = self._to_frame(X)
+        categorical = [c for c in self._categorical() if c in X]
+        numeric = [c for c in X.columns if c not in categorical]
+
+        categories = {
+            column: pd.Index(pd.unique(X[column].dropna()).astype(str))
+            for column in categorical
+        }
+        feature_names = sorted(
+            numeric
+            + [
+                f'{column}={value}'
+                for column, values in categories.items()
+                for value in values
+            ]
+        )
+        self.feature_names_ = feature_names
+        self.vocabulary_ = {name: i for i, name in enumerate(feature_names)}
+        self.categories_ = categories
+        self.category_indices_ = {
+            column: np.array(
+                [self.vocabulary_[f'{column}={value}'] for value in values],
+                dtype=np.int32,
+            )
+            for column, values in categories.items()
+        }
+        self.numeric_indices_ = {
+            column: self.vocabulary_[column] for column in numeric
+        }
+        return self
+
+    def feature_indices(self, column: str, values: pd.Series) -> np.ndarray:
+        """Feature index of every value of a categorical column, -1 if unseen."""
+        codes, uniques = pd.factorize(values)
+        positions = self.categories_[column].get_indexer(
+            np.asarray(uniques).astype(str)
+        )
+        # -1 (unseen category, missing value) picks the appended -1
+        indices = np.append(self.category_indices_[column], -1)[positions]
+        return np.append(indices, -1).astype(np.int32)[codes]
+
+    def transform(self, X) -> sp.sparse.csr_matrix:
+        X = self._to_frame(X)
+        n_rows = len(X)
+        columns, values = [], []
+        for column in self.categories_:
+            columns.append(self.feature_indices(column, X[column]))
+            values.append(np.ones(n_rows, dtype=self.dtype))
+        for column, index in self.numeric_indices_.items():
+            columns.append(np.full(n_rows, index, dtype=np.int32))
+            values.append(X[column].to_numpy(dtype=self.dtype))
+        columns, values = np.column_stack(columns), np.column_stack(values)
+
+        # Order the entries of every row by feature index, unseen (-1) first
+        order = np.argsort(columns, axis=1, kind='stable')
+        columns = np.take_along_axis(columns, order, axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+
+        seen = columns >= 0
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(seen.sum(axis=1), out=indptr[1:])
+        return sp.sparse.csr_matrix(
+            (values[seen], columns[seen], indptr),
+            shape=(n_rows, len(self.feature_names_)),
+        )
+
+    def get_feature_names_out(self, input_features=None) -> np.ndarray:
+        # pylint: disable=unused-argument
+        return np.asarray(self.feature_names_, dtype=object)
@@ -0,0 +1,303 @@
+"""Station pair aggregates of the trip durations, kept in a feature store.
+
+For every (start_station_id, end_station_id, member_casual) key the store
+has the number of trips, their mean and their median duration, joined to
+the trips as the `PAIR_FEATURES` numeric features.
+
+The store (`data/features/station_pairs` by default) holds
+- `months/<year>-<month>.npz`: the duration histogram (1 minute bins, count
+  and sum of durations per bin) of every key in a month of the interim store,
+- `keys.npy`, `trips.npy`, `mean.npy` and `median.npy`: the index of all the
+  months, sorted by key and memory-mapped for vectorized lookups,
+- `manifest.json`: the fingerprint of the interim partition of every month.
+
+Histograms add up, so when months are added or rewritten only their
+histograms are recomputed and the index is merged again from all of them.
+Medians are interpolated within their histogram bin.
+The store is updated by the `update_station_pair_features` flow of
+`src.features.update_station_pairs`.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src.utils import TARGET_COL, get_data_dir
+
+PAIR_FEATURES = ['pair_trips', 'pair_mean_duration', 'pair_median_duration']
+KEY_COLUMNS = ['start_station_id', 'end_station_id', 'member_casual']
+MEMBER_TYPES = ['member', 'casual']
+BIN_MINUTES = 1
+# durations are between 0 and 100 minutes
+N_BINS = 100 // BIN_MINUTES + 1
+STATION_BITS = 24
+INDEX_ARRAYS = ['keys', 'trips', 'mean', 'median']
+MANIFEST_FILE_NAME = 'manifest.json'
+
+
+def get_pair_features_dir() -> Path:
+    return get_data_dir() / 'features' / 'station_pairs'
+
+
+def station_numbers(station_ids: pd.Series) -> np.ndarray:
+    """Station IDs as integers, -1 if not a number or out of range."""
+    codes, uniques = pd.factorize(station_ids)
+    numbers = pd.to_numeric(
+        pd.Series(np.asarray(uniques, dtype=object)), errors='coerce'
+    ).to_numpy()
+    valid = (numbers >= 0) & (numbers < 2**STATION_BITS)
+    numbers = np.where(valid, numbers, -1).astype(np.int64)
+    return np.append(numbers, -1)[codes]
+
+
+def pair_keys(df: pd.DataFrame) -> np.ndarray:
+    """int64 key of every trip's station pair and member type, -1 if none.
+
+    Only the distinct values of every column are parsed.
+    """
+    start = station_numbers(df.start_station_id)
+    end = station_numbers(df.end_station_id)
+    member = pd.Index(MEMBER_TYPES).get_indexer(
+        np.asarray(df.member_casual, dtype=object)
+    )
+    keys = ((start << STATION_BITS) + end) * len(MEMBER_TYPES) + member
+    return np.where((start >= 0) & (end >= 0) & (member >= 0), keys, -1)
+
+
+def aggregate_cells(
+    cells: np.ndarray, counts: np.ndarray, sums: np.ndarray
+) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Sorted distinct histogram cells with their counts and sums added."""
+    cells, inverse = np.unique(cells, return_inverse=True)
+    return (
+        cells,
+        np.bincount(inverse, weights=counts).astype(np.int64),
+        np.bincount(inverse, weights=sums),
+    )
+
+
+def month_histogram(df: pd.DataFrame) -> dict:
+    """Duration histogram cells (`key * N_BINS + bin`) of the trips."""
+    keys = pair_keys(df)
+    duration = df[TARGET_COL].to_numpy(dtype=np.float64)
+    valid = keys >= 0
+    bins = np.clip(duration[valid] // BIN_MINUTES, 0, N_BINS - 1)
+    cells, counts, sums = aggregate_cells(
+        keys[valid] * N_BINS + bins.astype(np.int64),
+        np.ones(valid.sum()),
+        duration[valid],
+    )
+    return {'cells': cells, 'counts': counts, 'sums': sums}
+
+
+def merge_histograms(histograms: [dict]) -> dict:
+    if not histograms:
+        return {
+            'cells': np.empty(0, np.int64),
+            'counts': np.empty(0, np.int64),
+            'sums': np.empty(0),
+        }
+    cells, counts, sums = aggregate_cells(
+        *(
+            np.concatenate([h[name] for h in histograms])
+            for name in ['cells', 'counts', 'sums']
+        )
+    )
+    return {'cells': cells, 'counts': counts, 'sums': sums}
+
+
+class StationPairIndex:
+    """Trips, mean and median duration of every key, sorted by key."""
+
+    def __init__(
+        self,
+        keys: np.ndarray,
+        trips: np.ndarray,
+        mean: np.ndarray,
+        median: np.ndarray,
+    ):
+        self.keys = keys
+        self.trips = trips
+        self.mean = mean
+        self.median = median
+
+    @classmethod
+    def from_histogram(cls, histogram: dict) -> 'StationPairIndex':
+        cells, counts = histogram['cells'], histogram['counts']
+        if cells.size == 0:
+            return cls(
+                np.empty(0, np.int64),
+                np.empty(0, np.int32),
+                np.empty(0, np.float32),
+                np.empty(0, np.float32),
+            )
+        keys = cells // N_BINS
+        starts = np.flatnonzero(np.diff(keys, prepend=-1))
+        trips = np.add.reduceat(counts, starts)
+        sums = np.add.reduceat(histogram['sums'], starts)
+
+        # the median is in the first cell where the cumulative count of its
+        # key reaches half the key's trips
+        cumulative = np.cumsum(counts)
+        half = cumulative[starts] - counts[starts] + trips / 2
+        median_cells = np.searchsorted(cumulative, half)
+        below = cumulative[median_cells] - counts[median_cells]
+        median = (
+            cells[median_cells] % N_BINS + (half - below) / counts[median_cells]
+        ) * BIN_MINUTES
+        return cls(
+            keys[starts],
+            trips.astype(np.int32),
+            (sums / trips).astype(np.float32),
+            median.astype(np.float32),
+        )
+
+    def save(self, features_dir: Path) -> None:
+        for name in INDEX_ARRAYS:
+            np.save(features_dir / f'{name}.npy', getattr(self, name))
+
+    @classmethod
+    def load(cls, features_dir: Path = None) -> 'StationPairIndex':
+        """Memory-mapped index of the feature store."""
+        features_dir = Path(features_dir or get_pair_features_dir())
+        return cls(
+            *(
+                np.load(features_dir / f'{name}.npy', mmap_mode='r')
+                for name in INDEX_ARRAYS
+            )
+        )
+
+    def lookup(self, df: pd.DataFrame) -> pd.DataFrame:
+        """`PAIR_FEATURES` of the trips, no trips and NaN for unseen keys."""
+        return pd.DataFrame(
+            dict(zip(PAIR_FEATURES, self.lookup_keys(pair_keys(df)))),
+            index=df.index,
+        )
+
+    def lookup_keys(
+        self, keys: np.ndarray
+    ) -> (np.ndarray, np.ndarray, np.ndarray):
+        """Trips, mean and median of `pair_keys` by binary search."""
+        trips = np.zeros(len(keys), np.int32)
+        mean = np.full(len(keys), np.nan, np.float32)
+        median = np.full(len(keys), np.nan, np.float32)
+        if len(self.keys):
+            positions = np.minimum(
+                np.searchsorted(self.keys, keys), len(self.keys) - 1
+            )
+            found = np.flatnonzero((keys >= 0) & (self.keys[positions] == keys))
+            positions = positions[found]
+            trips[found] = self.trips[positions]
+            mean[found] = self.mean[positions]
+            median[found] = self.median[positions]
+        return trips, mean, median
+
+
+def partition_fingerprint(partition_dir: Path) -> str:
+    """Names, sizes and modification times of a partition's files."""
+    return repr(
+        [
+            (p.name, p.stat().st_size, p.stat().st_mtime_ns)
+            for p in sorted(partition_dir.glob('*.parquet'))
+        ]
+    )
+
+
+def interim_partitions(store_dir: Path) -> {str: Path}:
+    """Month partitions of the interim store by `<year>-<month>` name."""
+    return {
+        f"{path.parent.name.split('=')[1]}-{path.name.split('=')[1]}": path
+        for path in store_dir.glob('year=*/month=*')
+    }
+
+
+def month_number(month: str) -> int:
+    """Months since year 0 of a `<year>-<month>` name."""
+    year, month_of_year = month.split('-')
+    return int(year) * 12 + int(month_of_year) - 1
+
+
+def load_month_histograms(features_dir: Path) -> {str: dict}:
+    return {
+        path.stem: dict(np.load(path))
+        for path in (features_dir / 'months').glob('*.npz')
+    }
+
+
+def update_features(store_dir: Path, features_dir: Path = None) -> dict:
+    """Bring the feature store up to date with the interim store.
+
+    Only the months whose partition changed since the last update are read,
+    the months that left the interim store are dropped. Returns the manifest.
+    """
+    if not Path(store_dir).exists():
+        raise FileNotFoundError(f'no interim store at {store_dir}')
+    features_dir = Path(features_dir or get_pair_features_dir())
+    (features_dir / 'months').mkdir(parents=True, exist_ok=True)
+    manifest_path = features_dir / MANIFEST_FILE_NAME
+    manifest = (
+        json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    )
+
+    partitions = interim_partitions(Path(store_dir))
+    changed = not (features_dir / 'keys.npy').exists()
+    for month in set(manifest) - set(partitions):
+        (features_dir / 'months' / f'{month}.npz').unlink(missing_ok=True)
+        del manifest[month]
+        changed = True
+    for month, partition_dir in sorted(partitions.items()):
+        fingerprint = partition_fingerprint(partition_dir)
+        if manifest.get(month) == fingerprint:
+            continue
+        changed = True
+        print(f'aggregating station pairs of {month}')
+        df = pq.read_table(
+            partition_dir, columns=KEY_COLUMNS + [TARGET_COL]
+        ).to_pandas()
+        np.savez(
+            features_dir / 'months' / f'{month}.npz', **month_histogram(df)
+        )
+        manifest[month] = fingerprint
+
+    if not changed:
+        print('station pair features are up to date')
+        return manifest
+    histograms = load_month_histograms(features_dir)
+    index = StationPairIndex.from_histogram(
+        merge_histograms(list(histograms.values()))
+    )
+    index.save(features_dir)
+    manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    print(f'{len(index.keys):,} station pairs from {len(histograms)} months')
+    return manifest
+
+
+def add_pair_features(
+    df: pd.DataFrame, features_dir: Path = None
+) -> pd.DataFrame:
+    """Trips with the `PAIR_FEATURES` of the months before their own.
+
+    Every trip only sees the aggregates of the earlier months, so no trip's
+    duration is ever part of its own features, in training or evaluation.
+    """
+    features_dir = Path(features_dir or get_pair_features_dir())
+    histograms = {
+        month_number(month): histogram
+        for month, histogram in load_month_histograms(features_dir).items()
+    }
+    months = (
+        df.started_at.dt.year.to_numpy() * 12 + df.started_at.dt.month - 1
+    ).to_numpy()
+    keys = pair_keys(df)
+    features = np.full((len(PAIR_FEATURES), len(df)), np.nan)
+    earlier = merge_histograms([])
+    for month in sorted(set(histograms) | set(np.unique(months))):
+        rows = months == month
+        if rows.any():
+            index = StationPairIndex.from_histogram(earlier)
+            features[:, rows] = index.lookup_keys(keys[rows])
+        if month in histograms:
+            earlier = merge_histograms([earlier, histograms[month]])
+    return df.assign(**dict(zip(PAIR_FEATURES, features)))
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+from prefect import flow
+
+from src.profiling import profiled
+from src.data.interim import get_interim_store_dir
+from src.features.station_pairs import update_features
+
+
+@flow(name="update station pair features", log_prints=True)
+@profiled(report=True)
+def update_station_pair_features(
+    store_dir: Path = None, features_dir: Path = None
+):
+    """Station pair aggregates of the interim store, see `update_features`.
+
+    Run after `combine_raw_data`, on its local interim store by default.
+    """
+    update_features(store_dir or get_interim_store_dir(), features_dir)
+
+
+if __name__ == '__main__':
+    update_station_pair_features()
@@ -0,0 +1,269 @@
+"""Successive halving and Hyperband search of the XGBoost hyperparameters.
+
+Successive halving trains many sampled configurations for a few rounds,
+keeps the best `1 / eta` of them by validation RMSE and continues those for
+`eta` times more rounds, warm started from their boosters, until one is
+left. Hyperband runs several such brackets, from many configurations with
+few rounds to a few configurations trained for all the rounds from the
+start. All the trials train on the same loaded DMatrices.
+
+The results are written to `SWEEP_DIR` (default `reports/sweeps`) as
+`<sweep_id>.json` and, with `log_results`, to a W&B run: the best trial in
+its summary, the results in a `sweep_results` artifact named after the sweep.
+`register_best_model` reads the best configuration from the artifact, or
+from the local file of a sweep that ran without the W&B server.
+"""
+import os
+import json
+import math
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import mean_squared_error
+
+from src import wandb_params
+from src.utils import get_project_root
+from src.profiling import profiled
+
+MODES = ['halving', 'hyperband']
+RESULTS_ARTIFACT_TYPE = 'sweep_results'
+
+
+def get_sweep_dir() -> Path:
+    return Path(
+        os.getenv('SWEEP_DIR', get_project_root() / 'reports' / 'sweeps')
+    )
+
+
+def sample_config(parameters: dict, rng: np.random.Generator) -> dict:
+    """Sample a configuration from W&B sweep `parameters` distributions."""
+    config = {}
+    for name, spec in parameters.items():
+        distribution = spec.get('distribution')
+        if 'values' in spec:
+            config[name] = spec['values'][rng.integers(len(spec['values']))]
+        elif distribution == 'int_uniform':
+            config[name] = int(rng.integers(spec['min'], spec['max'] + 1))
+        elif distribution == 'uniform':
+            config[name] = float(rng.uniform(spec['min'], spec['max']))
+        elif distribution == 'log_uniform':
+            # W&B's log_uniform bounds are natural logarithms
+            config[name] = float(np.exp(rng.uniform(spec['min'], spec['max'])))
+        else:
+            raise ValueError(f'unsupported distribution {distribution!r}')
+    return config
+
+
+def count_rungs(n_configs: int, eta: int) -> int:
+    """Rungs needed to get from `n_configs` configurations down to one."""
+    rungs = 1
+    while n_configs > 1:
+        n_configs = math.ceil(n_configs / eta)
+        rungs += 1
+    return rungs
+
+
+def continue_training(
+    params: dict, data: {str: xgb.DMatrix}, booster: xgb.Booster, rounds: int
+) -> (xgb.Booster, float):
+    """Train `rounds` more rounds from `booster`, with the val RMSE."""
+    evals_result = {}
+    booster = xgb.train(
+        params,
+        data['train'],
+        num_boost_round=rounds,
+        evals=[(data['val'], 'validation')],
+        evals_result=evals_result,
+        xgb_model=booster,
+        verbose_eval=False,
+    )
+    return booster, evals_result['validation']['rmse'][-1]
+
+
+def successive_halving(  # pylint: disable=too-many-arguments
+    params: dict,
+    data: {str: xgb.DMatrix},
+    configs: [dict],
+    min_rounds: int = 8,
+    eta: int = 3,
+    max_rounds: int = None,
+) -> ([dict], dict, xgb.Booster):
+    """Trials of all the configurations, the best survivor and its booster.
+
+    Halves the configurations until one is left or, with `max_rounds`, until
+    the survivors have been trained for `max_rounds` rounds.
+    """
+    trials = [
+        {'config': config, 'rounds': [], 'val_rmse': []} for config in configs
+    ]
+    boosters = [None] * len(trials)
+    survivors = list(range(len(trials)))
+    rounds = min_rounds
+    while True:
+        for i in survivors:
+            trial = trials[i]
+            done = trial['rounds'][-1] if trial['rounds'] else 0
+            boosters[i], rmse = continue_training(
+                {**params, **trial['config']}, data, boosters[i], rounds - done
+            )
+            trial['rounds'].append(rounds)
+            trial['val_rmse'].append(rmse)
+        survivors.sort(key=lambda i: trials[i]['val_rmse'][-1])
+        print(
+            f'{len(survivors)} configurations after {rounds} rounds,'
+            f" best val rmse {trials[survivors[0]]['val_rmse'][-1]:.4f}"
+        )
+        if len(survivors) == 1 or rounds == max_rounds:
+            return trials, trials[survivors[0]], boosters[survivors[0]]
+        survivors = survivors[: math.ceil(len(survivors) / eta)]
+        # only the survivors' boosters are kept
+        boosters = [
+            b if i in survivors else None for i, b in enumerate(boosters)
+        ]
+        rounds = min(rounds * eta, max_rounds or math.inf)
+
+
+def get_max_rounds(n_configs: int, min_rounds: int, eta: int) -> int:
+    """Rounds the last survivor of `n_configs` configurations is trained for."""
+    return min_rounds * eta ** (count_rungs(n_configs, eta) - 1)
+
+
+def hyperband_brackets(n_configs: int, min_rounds: int, eta: int) -> [tuple]:
+    """Configurations and first rung rounds of every Hyperband bracket.
+
+    The first bracket is successive halving of `n_configs` configurations,
+    the last one trains a few configurations for all the rounds. Every
+    bracket stops at the rounds of the first one, see `get_max_rounds`.
+    """
+    s_max = count_rungs(n_configs, eta) - 1
+    return [
+        (
+            math.ceil((s_max + 1) / (s + 1) * eta**s),
+            min_rounds * eta ** (s_max - s),
+        )
+        for s in range(s_max, -1, -1)
+    ]
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+@profiled()
+def run_search(
+    params: dict,
+    data: {str: xgb.DMatrix},
+    parameters: dict,
+    mode: str = 'halving',
+    n_configs: int = 27,
+    min_rounds: int = 8,
+    eta: int = 3,
+    seed: int = 42,
+) -> dict:
+    """Search the hyperparameters in `parameters` and save the results.
+
+    `params` are the fixed booster parameters, `data` the train, val and test
+    DMatrices. Returns the results, with the `sweep_id` they're saved under.
+    """
+    if mode not in MODES:
+        raise ValueError(f'mode must be one of {MODES}, not {mode!r}')
+    rng = np.random.default_rng(seed)
+    if mode == 'halving':
+        brackets = [(n_configs, min_rounds)]
+    else:
+        brackets = hyperband_brackets(n_configs, min_rounds, eta)
+
+    max_rounds = get_max_rounds(n_configs, min_rounds, eta)
+
+    trials, bracket_bests = [], []
+    for bracket_configs, bracket_rounds in brackets:
+        configs = [
+            sample_config(parameters, rng) for _ in range(bracket_configs)
+        ]
+        bracket_trials, survivor, booster = successive_halving(
+            params, data, configs, bracket_rounds, eta, max_rounds
+        )
+        trials.extend(bracket_trials)
+        bracket_bests.append((survivor, booster))
+    trial, booster = min(bracket_bests, key=lambda b: b[0]['val_rmse'][-1])
+    test = data['test']
+    results = {
+        'sweep_id': f'{mode}-{datetime.now():%Y%m%d-%H%M%S-%f}',
+        'mode': mode,
+        'best': {
+            'config': {**params, **trial['config']},
+            'num_boost_round': trial['rounds'][-1],
+            'val_rmse': trial['val_rmse'][-1],
+            'test_rmse': float(
+                mean_squared_error(
+                    test.get_label(), booster.predict(test), squared=False
+                )
+            ),
+        },
+        'trials': trials,
+    }
+    save_results(results)
+    return results
+
+
+def save_results(results: dict, sweep_dir: Path = None) -> Path:
+    sweep_dir = Path(sweep_dir or get_sweep_dir())
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    results_path = sweep_dir / f"{results['sweep_id']}.json"
+    results_path.write_text(json.dumps(results, indent=2))
+    print(f'Sweep results written to {results_path}')
+    return results_path
+
+
+def is_halving_sweep(sweep_id: str) -> bool:
+    return sweep_id.split('-')[0] in MODES
+
+
+def log_results(results: dict):
+    """Log the results to a W&B run named after the sweep."""
+    import wandb  # pylint: disable=import-outside-toplevel
+
+    with wandb.init(
+        project=wandb_params.WANDB_PROJECT,
+        job_type='halving_sweep',
+        name=results['sweep_id'],
+        config={'mode': results['mode']},
+    ) as wandb_run:
+        best = results['best']
+        wandb_run.summary.update(
+            {
+                'best_config': best['config'],
+                'best_num_boost_round': best['num_boost_round'],
+                'best_val_rmse': best['val_rmse'],
+                'best_test_rmse': best['test_rmse'],
+            }
+        )
+        artifact = wandb.Artifact(
+            results['sweep_id'], type=RESULTS_ARTIFACT_TYPE
+        )
+        with artifact.new_file(f"{results['sweep_id']}.json") as file:
+            json.dump(results, file, indent=2)
+        wandb_run.log_artifact(artifact)
+
+
+def download_results(sweep_id: str) -> dict | None:
+    """Results logged to W&B by `log_results`, None if there are none."""
+    import wandb  # pylint: disable=import-outside-toplevel
+
+    try:
+        artifact = wandb.Api().artifact(
+            f'{wandb_params.WANDB_PROJECT}/{sweep_id}:latest',
+            type=RESULTS_ARTIFACT_TYPE,
+        )
+    except (ValueError, wandb.errors.CommError):
+        return None
+    return json.loads(
+        (Path(artifact.download()) / f'{sweep_id}.json').read_text()
+    )
+
+
+def load_results(sweep_id: str, sweep_dir: Path = None) -> dict | None:
+    """Results of a local sweep, None if there's none with this ID."""
+    results_path = Path(sweep_dir or get_sweep_dir()) / f'{sweep_id}.json'
+    if not results_path.exists():
+        return None
+    return json.loads(results_path.read_text())
@@ -0,0 +1,130 @@
+"""Incremental retraining of the registered model on the newest months.
+
+The encoder of the staging pipeline is kept as it is, the processed data is
+mapped to its vocabulary (features it hasn't seen, e.g. new stations, are
+dropped as the encoder itself does) and the model keeps boosting from its
+trees on the rows of the newest months of the training split.
+"""
+from pathlib import Path
+
+import numpy as np
+import scipy as sp
+import xgboost as xgb
+from sklearn.metrics import mean_squared_error
+from sklearn.pipeline import Pipeline, make_pipeline
+
+from src.models.backend import regressor_from_booster
+from src.models.data_cache import load_split, load_vectorizer
+
+
+def remap_columns(
+    X: sp.sparse.csr_matrix, from_names: [str], to_names: [str]
+) -> sp.sparse.csr_matrix:
+    """Columns of X named `from_names` reordered to `to_names`.
+
+    Columns missing from `to_names` are dropped, the ones missing from
+    `from_names` are left empty.
+    """
+    if list(from_names) == list(to_names):
+        return X
+    positions = {name: i for i, name in enumerate(to_names)}
+    mapping = np.array([positions.get(name, -1) for name in from_names])
+    columns = mapping[X.indices]
+    keep = columns >= 0
+    kept = np.concatenate([[0], np.cumsum(keep)])
+    # both vocabularies are sorted, so the kept columns stay sorted
+    return sp.sparse.csr_matrix(
+        (X.data[keep], columns[keep].astype(np.int32), kept[X.indptr]),
+        shape=(X.shape[0], len(to_names)),
+    )
+
+
+def newest_month_rows(
+    X: sp.sparse.csr_matrix, feature_names: [str], n_months: int = 1
+) -> np.ndarray:
+    """Mask of the rows of the `n_months` newest months of trips in X."""
+    names = list(feature_names)
+    year, month = (
+        X[:, names.index(name)].toarray().ravel() for name in ['year', 'month']
+    )
+    year_month = year * 12 + month
+    newest = np.unique(year_month)[-n_months:]
+    return np.isin(year_month, newest)
+
+
+def load_split_for(
+    dv, data_dir: Path, split: str
+) -> (sp.sparse.csr_matrix, np.ndarray):
+    """Split of the training data cache encoded with the vocabulary of `dv`."""
+    X, y = load_split(data_dir, split)
+    X = remap_columns(
+        X,
+        load_vectorizer(data_dir).get_feature_names_out(),
+        dv.get_feature_names_out(),
+    )
+    return X, np.asarray(y)
+
+
+def val_rmse(booster: xgb.Booster, val: xgb.DMatrix) -> float:
+    """RMSE of the booster up to its best iteration, if early stopped."""
+    best_iteration = booster.attr('best_iteration')
+    iteration_range = (
+        (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+    )
+    return mean_squared_error(
+        val.get_label(),
+        booster.predict(val, iteration_range=iteration_range),
+        squared=False,
+    )
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def fit_incremental(
+    pipeline: Pipeline,
+    data_dir: Path,
+    backend: dict = None,
+    new_months: int = 1,
+    rounds: int = 100,
+    tolerance: float = 0.0,
+) -> Pipeline | None:
+    """Pipeline with the model boosted further on the newest months.
+
+    Boosting stops early when the val RMSE stops improving. Returns None
+    if the val RMSE got worse than the original model's by more than
+    `tolerance` (relative), so that the caller can retrain from scratch.
+    `backend` are the backend parameters, e.g. `nthread`.
+    """
+    dv, model = pipeline[0], pipeline[-1]
+    feature_names = list(dv.get_feature_names_out())
+    X_train, y_train = load_split_for(dv, data_dir, 'train')
+    rows = newest_month_rows(X_train, feature_names, new_months)
+    train = xgb.DMatrix(
+        X_train[rows], label=y_train[rows], feature_names=feature_names
+    )
+    X_val, y_val = load_split_for(dv, data_dir, 'val')
+    val = xgb.DMatrix(X_val, label=y_val, feature_names=feature_names)
+
+    params = {
+        **{k: v for k, v in model.get_xgb_params().items() if v is not None},
+        **(backend or {}),
+    }
+    booster = model.get_booster()
+    old_rmse = val_rmse(booster, val)
+    print(
+        f'Boosting the staging model on {train.num_row():,} trips'
+        f' of the newest {new_months} month(s)...'
+    )
+    booster = xgb.train(
+        params,
+        train,
+        num_boost_round=rounds,
+        evals=[(val, 'validation')],
+        early_stopping_rounds=10,
+        xgb_model=booster,
+        verbose_eval=False,
+    )
+    new_rmse = val_rmse(booster, val)
+    print(f'val rmse {old_rmse:.4f} -> {new_rmse:.4f}')
+    if new_rmse > old_rmse * (1 + tolerance):
+        return None
+    return make_pipeline(dv, regressor_from_booster(booster, params))
@@ -1,99 +1,267 @@
+# import click
+from typing import TYPE_CHECKING
 from pathlib import Path
 
-# import click
 import xgboost as xgb
 from dotenv import find_dotenv, load_dotenv
 from prefect import flow
-from wandb.xgboost import WandbCallback
 from sklearn.pipeline import (  # pylint: disable=wrong-import-order
     Pipeline,
     make_pipeline,
 )
 
-import wandb
 from src import wandb_params
+from src.cache import memoized
+from src.tasks import dump_pickle
 from src.utils import (
-    dump_pickle,
-    load_pickle,
+    read_pickle,
     calculate_rmse,
     get_models_dir,
     set_wandb_api_key,
     log_val_preds_table,
 )
+from src.models import halving
+from src.profiling import profiled, profile_stage
+from src.serving.trees import TreeEnsemble
+from src.models.backend import (
+    MAX_BIN,
+    TREE_METHOD,
+    backend_params,
+    load_training_data,
+    regressor_from_booster,
+)
+from src.models.data_cache import (
+    CHUNK_ROWS,
+    load_split,
+    load_vectorizer,
+    get_training_data,
+)
+from src.models.incremental import load_split_for, fit_incremental
+
+if TYPE_CHECKING:
+    import wandb
 
 load_dotenv(find_dotenv())
 
+REGISTERED_MODEL = 'model-registry/capitalbikeshare-dv-model-pipeline'
+
 
 def get_best_run_config(sweep_id: str) -> dict:
+    """Config of the best run of a W&B sweep or a halving one.
+
+    The results of a halving sweep are read from W&B, or from the local
+    file if it ran without the W&B server.
+    """
+    import wandb  # pylint: disable=import-outside-toplevel
+
+    if halving.is_halving_sweep(sweep_id):
+        results = halving.download_results(sweep_id)
+        if results is None:
+            results = halving.load_results(sweep_id)
+        if results is None:
+            raise ValueError(f'no results of the {sweep_id} sweep')
+        return results['best']['config']
     sweep = wandb.Api().sweep(f'{wandb_params.WANDB_PROJECT}/{sweep_id}')
     return sweep.best_run().config
 
 
 def save_and_log_pipeline(
-    pipeline: Pipeline, wandb_run: wandb.sdk.wandb_run.Run
+    pipeline: Pipeline, wandb_run: 'wandb.sdk.wandb_run.Run'
 ):
+    import wandb  # pylint: disable=import-outside-toplevel
+
     print("Saving pipeline locally...")
     pipeline_path = get_models_dir() / "pipeline.pkl"
     dump_pickle(pipeline, pipeline_path)
+    # flattened trees of the model, to score without XGBoost
+    trees_path = get_models_dir() / "trees.npz"
+    TreeEnsemble.from_booster(pipeline[-1].get_booster()).save(trees_path)
 
     print("Uploading pipeline to W&B...")
     pipeline_artifact = wandb.Artifact('dv-model-pipeline', type="model")
     pipeline_artifact.add_file(pipeline_path)
+    pipeline_artifact.add_file(trees_path)
     wandb.log_artifact(pipeline_artifact)
 
     # Link the model to the Model Registry
     wandb_run.link_artifact(
-        pipeline_artifact,
-        'model-registry/capitalbikeshare-dv-model-pipeline',
-        aliases=['staging'],
+        pipeline_artifact, REGISTERED_MODEL, aliases=['staging']
+    )
+
+
+def load_staging_pipeline(wandb_run: 'wandb.sdk.wandb_run.Run') -> Pipeline:
+    artifact_dir = Path(
+        wandb_run.use_artifact(
+            f'{REGISTERED_MODEL}:staging', type='model'
+        ).download()
     )
+    return read_pickle(artifact_dir / 'pipeline.pkl')
+
+
+def fit_external_memory(
+    params: dict, data_dir, chunk_rows: int = CHUNK_ROWS
+) -> xgb.XGBRegressor:
+    """Regressor fitted on the splits streamed from the training data cache.
+
+    The scikit-learn API only takes in-memory data, so the booster is trained
+    with `xgb.train` and loaded into a regressor with the same parameters.
+    """
+    data = load_training_data(
+        data_dir,
+        params['tree_method'],
+        params.get('max_bin', MAX_BIN),
+        params['nthread'],
+        chunk_rows,
+    )
+    train, val = data['train'], data['val']
+    evals_result = {}
+    booster = xgb.train(
+        params,
+        train,
+        num_boost_round=500,
+        evals=[(val, 'validation_0'), (train, 'validation_1')],
+        evals_result=evals_result,
+        early_stopping_rounds=50,
+        verbose_eval=False,
+    )
+    model = regressor_from_booster(booster, {**params, 'n_estimators': 500})
+    model.evals_result_ = evals_result
+    return model
+
+
+@memoized(ignore=['data_dir'])
+def fit_full(
+    params: dict,
+    data_dir: Path,
+    data_version: str,  # pylint: disable=unused-argument
+    external_memory: bool = False,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Pipeline:
+    """Pipeline of the processed data's encoder and a model fitted on it.
+
+    Memoized by `data_version`, the digest of the processed-data artifact
+    `data_dir` is the training data cache entry of.
+    """
+    if external_memory:
+        model = fit_external_memory(params, data_dir, chunk_rows)
+    else:
+        model = xgb.XGBRegressor(
+            **params,
+            n_estimators=500,
+            early_stopping_rounds=50,
+        )
+        X_train, y_train = load_split(data_dir, 'train')
+        X_val, y_val = load_split(data_dir, 'val')
+        model.fit(
+            X_train,
+            y_train,
+            eval_set=[(X_val, y_val), (X_train, y_train)],
+        )
+    return make_pipeline(load_vectorizer(data_dir), model)
+
+
+def log_training_curves(model: xgb.XGBRegressor) -> None:
+    """Log the eval metrics of every round, as `WandbCallback` does.
+
+    They're read from the fitted model, so a memoized fit logs them too.
+    """
+    import wandb  # pylint: disable=import-outside-toplevel
+
+    curves = {
+        f'{data}-{metric}': values
+        for data, metrics in model.evals_result().items()
+        for metric, values in metrics.items()
+    }
+    for epoch in range(model.get_booster().num_boosted_rounds()):
+        wandb.log(
+            {name: values[epoch] for name, values in curves.items()}
+            | {'epoch': epoch}
+        )
+    if model.get_booster().attr('best_score') is not None:
+        wandb.log(
+            {
+                'best_score': model.best_score,
+                'best_iteration': model.best_iteration,
+            }
+        )
 
 
 @flow(name="register best model", log_prints=True)
 # @click.command()
 # @click.argument("sweep_id", nargs=1)
 # sweep_id povofsvd
-def register_best_model(sweep_id: str):
+@profiled(report=True)
+# pylint: disable=too-many-locals,too-many-arguments
+def register_best_model(
+    sweep_id: str,
+    external_memory: bool = False,
+    chunk_rows: int = CHUNK_ROWS,
+    tree_method: str = TREE_METHOD,
+    max_bin: int = MAX_BIN,
+    nthread: int = None,
+    incremental: bool = False,
+    new_months: int = 1,
+    incremental_rounds: int = 100,
+    tolerance: float = 0.0,
+):
+    """Fit the best model of the sweep and register its pipeline.
+
+    With `incremental` the staging pipeline keeps its encoder and its model
+    boosts up to `incremental_rounds` more rounds on the newest `new_months`
+    months of the training data instead. If that makes the val RMSE worse by
+    more than `tolerance` (relative) the model is retrained from scratch.
+    """
+    import wandb  # pylint: disable=import-outside-toplevel
+
     set_wandb_api_key()
     config = get_best_run_config(sweep_id)
+    backend = backend_params(tree_method, max_bin, nthread)
+    params = {**config, **backend}
 
     with wandb.init(
         project=wandb_params.WANDB_PROJECT,
         job_type="register_best_model",
-        config=config,
+        config=params,
     ) as wandb_run:
-        model = xgb.XGBRegressor(
-            **config,
-            n_estimators=500,
-            early_stopping_rounds=50,
-            callbacks=[WandbCallback(log_feature_importance=False)],
-        )
         data_artifact = wandb_run.use_artifact(
             '202304-202305-202306-processed-data:latest', type='processed_data'
         )
-        data_artifact_dir = Path(data_artifact.download())
-
-        print(f'Training model with best params from sweep {sweep_id}...')
-        X_train, y_train = load_pickle(data_artifact_dir / 'train.pkl')
-        X_val, y_val = load_pickle(data_artifact_dir / 'val.pkl')
-        X_test, y_test = load_pickle(data_artifact_dir / 'test.pkl')
+        data_dir = get_training_data(data_artifact)
 
-        model.fit(
-            X_train,
-            y_train,
-            eval_set=[(X_val, y_val), (X_train, y_train)],
-        )
+        pipeline = None
+        if incremental:
+            with profile_stage('fit_incremental'):
+                pipeline = fit_incremental(
+                    load_staging_pipeline(wandb_run),
+                    data_dir,
+                    backend,
+                    new_months,
+                    incremental_rounds,
+                    tolerance,
+                )
+            if pipeline is None:
+                print('Val RMSE got worse, retraining from scratch...')
+        if pipeline is None:
+            print(f'Training model with best params from sweep {sweep_id}...')
+            with profile_stage('fit'):
+                pipeline = fit_full(
+                    params,
+                    data_dir,
+                    data_artifact.digest,
+                    external_memory,
+                    chunk_rows,
+                )
+            log_training_curves(pipeline[-1])
 
+        dv, model = pipeline[0], pipeline[-1]
+        X_val, y_val = load_split_for(dv, data_dir, 'val')
+        X_test, y_test = load_split_for(dv, data_dir, 'test')
         log_val_preds_table('best_model_val_preds', model, X_val, y_val)
 
         wandb_run.log(
-            {'test-rmse': calculate_rmse(model, y_test, X_test, convert=False)}
+            {'test-rmse': calculate_rmse(model.get_booster(), y_test, X_test)}
         )
 
-        print("Creating pipeline...")
-        dv = load_pickle(data_artifact_dir / 'dv.pkl')
-        pipeline = make_pipeline(dv, model)
-
         save_and_log_pipeline(pipeline, wandb_run)
 
 
@@ -1,27 +1,33 @@
-from pathlib import Path
-
 import xgboost as xgb
 from dotenv import find_dotenv, load_dotenv
 from prefect import flow, task
-from wandb.xgboost import WandbCallback
 
-import wandb
 from src import wandb_params
+from src.tasks import dump_pickle
 from src.utils import (
-    dump_pickle,
-    load_pickle,
     calculate_rmse,
     get_models_dir,
     set_wandb_api_key,
-    convert_to_dmatrix,
     log_val_preds_table,
 )
+from src.profiling import profiled
+from src.models.backend import (
+    MAX_BIN,
+    TREE_METHOD,
+    backend_params,
+    load_training_data,
+)
+from src.models.data_cache import CHUNK_ROWS, get_training_data
 
 load_dotenv(find_dotenv())
 
 
 @task(log_prints=False)
+@profiled()
 def train_booster(params, train: xgb.DMatrix, val: xgb.DMatrix) -> xgb.Booster:
+    # pylint: disable-next=import-outside-toplevel
+    from wandb.xgboost import WandbCallback
+
     return xgb.train(
         params=params,
         dtrain=train,
@@ -34,12 +40,23 @@ def train_booster(params, train: xgb.DMatrix, val: xgb.DMatrix) -> xgb.Booster:
 
 
 @flow(name="train baseline model", log_prints=True)
-def train_xgboost():
+@profiled(report=True)
+# pylint: disable=too-many-arguments,too-many-locals
+def train_xgboost(
+    external_memory: bool = False,
+    chunk_rows: int = CHUNK_ROWS,
+    tree_method: str = TREE_METHOD,
+    max_bin: int = MAX_BIN,
+    nthread: int = None,
+):
+    """Train the baseline booster, on the backend of `src.models.backend`."""
+    import wandb  # pylint: disable=import-outside-toplevel
+
     print("Training model...")
     xgb_params = {
         'objective': 'reg:squarederror',
         'seed': 42,
-        'nthread': 4,
+        **backend_params(tree_method, max_bin, nthread),
     }
     set_wandb_api_key()
     with wandb.init(
@@ -51,23 +68,27 @@ def train_xgboost():
         artifact = wandb_run.use_artifact(
             '202304-202305-202306-processed-data:latest', type='processed_data'
         )
-        artifact_dir = Path(artifact.download())
+        data_dir = get_training_data(artifact)
 
-        dv = load_pickle(artifact_dir / 'dv.pkl')
-        feature_names = dv.get_feature_names_out()
-        train = convert_to_dmatrix(
-            *load_pickle(artifact_dir / 'train.pkl'), feature_names
+        data = load_training_data(
+            data_dir,
+            tree_method,
+            max_bin,
+            nthread,
+            chunk_rows if external_memory else None,
         )
-        X_val, y_val = load_pickle(artifact_dir / 'val.pkl')
-        val = convert_to_dmatrix(X_val, y_val, feature_names)
-        X_test, y_test = load_pickle(artifact_dir / 'test.pkl')
+        train, val, test = data['train'], data['val'], data['test']
+        y_val = val.get_label()
 
         print("Training model...")
         booster = train_booster(xgb_params, train, val)
 
         log_val_preds_table('baseline_booster_val_preds', booster, val, y_val)
 
-        wandb_run.log({'test-rmse': calculate_rmse(booster, y_test, X_test)})
+        test_rmse = calculate_rmse(
+            booster, test.get_label(), test, convert=False
+        )
+        wandb_run.log({'test-rmse': test_rmse})
 
         print("Saving model locally...")
         model_path = get_models_dir() / 'booster.pkl'
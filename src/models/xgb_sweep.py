@@ -1,24 +1,29 @@
+import multiprocessing
 from pathlib import Path
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 import xgboost as xgb
 from dotenv import find_dotenv, load_dotenv
 from prefect import flow
-from wandb.xgboost import WandbCallback
-from prefect.deployments import (  # pylint: disable=wrong-import-order
-    run_deployment,
-)
 
-import wandb
 from src import wandb_params
-from src.utils import (
-    load_pickle,
-    calculate_rmse,
-    set_wandb_api_key,
-    convert_to_dmatrix,
+from src.utils import calculate_rmse, set_wandb_api_key
+from src.models import halving
+from src.profiling import profiled
+from src.models.backend import (
+    MAX_BIN,
+    TREE_METHOD,
+    get_nthread,
+    backend_params,
+    load_training_data,
 )
+from src.models.data_cache import SPLITS, LocalArtifact, get_training_data
 
 load_dotenv(find_dotenv())
 
+PROCESSED_DATA_ARTIFACT = '202304-202305-202306-processed-data:latest'
+
 SWEEP_CONFIG = {
     "name": "XGBoost Sweep",
     "method": "bayes",
@@ -48,30 +53,47 @@ SWEEP_CONFIG = {
 }
 
 
-def train_xgb():
-    xgb_params = {
+def get_xgb_params(
+    nthread: int = None, tree_method: str = TREE_METHOD, max_bin: int = MAX_BIN
+) -> dict:
+    """Booster parameters not searched by the sweep."""
+    return {
         'objective': 'reg:squarederror',
         'seed': 42,
-        'nthread': 8,
+        **backend_params(tree_method, max_bin, nthread),
     }
 
+
+@profiled()
+# pylint: disable=too-many-locals,import-outside-toplevel
+def train_xgb(
+    data: {str: xgb.DMatrix} = None,
+    nthread: int = None,
+    tree_method: str = TREE_METHOD,
+    max_bin: int = MAX_BIN,
+):
+    """Run one sweep trial.
+
+    `data` are the train, val and test DMatrices already loaded by a parallel
+    sweep worker, by default they are loaded from the training data cache.
+    """
+    import wandb
+    from wandb.xgboost import WandbCallback
+
+    xgb_params = get_xgb_params(nthread, tree_method, max_bin)
+
     wandb.init(config=xgb_params)
     config = wandb.config
 
     artifact = wandb.use_artifact(
-        '202304-202305-202306-processed-data:latest', type='processed_data'
+        PROCESSED_DATA_ARTIFACT, type='processed_data'
     )
-    artifact_dir = Path(artifact.download())
-
-    dv = load_pickle.fn(artifact_dir / 'dv.pkl')
-    feature_names = dv.get_feature_names_out()
-
-    train = convert_to_dmatrix(
-        *load_pickle.fn(artifact_dir / 'train.pkl'), feature_names
-    )
-    X_val, y_val = load_pickle.fn(artifact_dir / 'val.pkl')
-    val = convert_to_dmatrix(X_val, y_val, feature_names)
-    X_test, y_test = load_pickle.fn(artifact_dir / 'test.pkl')
+    if data is None:
+        # only the first trial downloads, converts and bins the data,
+        # the following ones reuse the DMatrices of the first one
+        data_dir = get_training_data(artifact)
+        data = load_training_data(data_dir, tree_method, max_bin, nthread)
+    train, val, test = (data[split] for split in SPLITS)
 
     print("Training model...")
     optimized_hyperparams = {
@@ -91,11 +113,162 @@ def train_xgb():
         verbose_eval=50,
     )
 
-    wandb.log({'test-rmse': calculate_rmse(booster, y_test, X_test)})
+    test_rmse = calculate_rmse(booster, test.get_label(), test, convert=False)
+    wandb.log({'test-rmse': test_rmse})
+
+
+# DMatrices of a parallel sweep worker, shared by all its trials
+_worker_data = {}
+
+
+def init_sweep_worker(
+    data_dir: Path,
+    nthread: int,
+    tree_method: str = TREE_METHOD,
+    max_bin: int = MAX_BIN,
+) -> None:
+    """Build the worker's DMatrices once for all its trials.
+
+    XGBoost's matrices can't be shared between processes, so every worker
+    builds its own: the training QuantileDMatrix is sketched from the CSR
+    arrays memory-mapped from the training data cache, the val and test
+    DMatrices are loaded from their buffers. Only the cached files are
+    shared (through the page cache), the binned training split and the
+    evaluation DMatrices take memory and startup time in every worker.
+    """
+    _worker_data.update(
+        load_training_data(data_dir, tree_method, max_bin, nthread)
+    )
+
+
+def run_sweep_agent(
+    sweep_id: str,
+    count: int,
+    nthread: int,
+    tree_method: str = TREE_METHOD,
+    max_bin: int = MAX_BIN,
+) -> None:
+    import wandb  # pylint: disable=import-outside-toplevel
+
+    wandb.agent(
+        sweep_id,
+        function=partial(
+            train_xgb,
+            data=_worker_data,
+            nthread=nthread,
+            tree_method=tree_method,
+            max_bin=max_bin,
+        ),
+        count=count,
+        project=wandb_params.WANDB_PROJECT,
+    )
+
+
+def split_evenly(total: int, n_parts: int) -> [int]:
+    return [total // n_parts + (i < total % n_parts) for i in range(n_parts)]
+
+
+# pylint: disable=too-many-arguments
+def run_parallel_sweep(
+    sweep_id: str,
+    count: int,
+    n_workers: int,
+    nthread: int = None,
+    tree_method: str = TREE_METHOD,
+    max_bin: int = MAX_BIN,
+) -> None:
+    """Run `count` trials of a sweep in `n_workers` concurrent agents.
+
+    The data is downloaded and cached once before the workers start, then
+    every worker builds its own DMatrices from the cache (see
+    `init_sweep_worker`), so the memory taken by the data and the start-up
+    time grow with `n_workers`. The `nthread` threads (all cores by default)
+    are split between the workers.
+    """
+    import wandb  # pylint: disable=import-outside-toplevel
+
+    artifact = wandb.Api().artifact(
+        f'{wandb_params.WANDB_PROJECT}/{PROCESSED_DATA_ARTIFACT}',
+        type='processed_data',
+    )
+    data_dir = get_training_data(artifact)
+    worker_nthread = max(1, get_nthread(nthread) // n_workers)
+    counts = [c for c in split_evenly(count, n_workers) if c]
+    print(
+        f'Running {count} trials in {len(counts)} workers'
+        f' with {worker_nthread} threads each...'
+    )
+    # spawn, because XGBoost's OpenMP runtime isn't fork safe
+    with ProcessPoolExecutor(
+        max_workers=len(counts),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_sweep_worker,
+        initargs=(data_dir, worker_nthread, tree_method, max_bin),
+    ) as executor:
+        futures = [
+            executor.submit(
+                run_sweep_agent,
+                sweep_id,
+                c,
+                worker_nthread,
+                tree_method,
+                max_bin,
+            )
+            for c in counts
+        ]
+        for future in futures:
+            future.result()
+
+
+# pylint: disable=too-many-arguments
+def run_halving_sweep(
+    mode: str,
+    n_configs: int,
+    data_dir: Path = None,
+    min_rounds: int = 8,
+    eta: int = 3,
+    nthread: int = None,
+    tree_method: str = TREE_METHOD,
+    max_bin: int = MAX_BIN,
+) -> str:
+    """Successive halving or Hyperband search, see `src.models.halving`.
+
+    Trains on the processed data in `data_dir` (the output of `prepare_data`)
+    without the W&B server, or on the processed-data artifact by default,
+    then the results are also logged to W&B. Returns the ID of the sweep.
+    """
+    if data_dir is None:
+        import wandb  # pylint: disable=import-outside-toplevel
+
+        set_wandb_api_key()
+        artifact = wandb.Api().artifact(
+            f'{wandb_params.WANDB_PROJECT}/{PROCESSED_DATA_ARTIFACT}',
+            type='processed_data',
+        )
+    else:
+        artifact = LocalArtifact(data_dir)
+    data = load_training_data(
+        get_training_data(artifact), tree_method, max_bin, nthread
+    )
+    results = halving.run_search(
+        get_xgb_params(nthread, tree_method, max_bin),
+        data,
+        SWEEP_CONFIG['parameters'],
+        mode,
+        n_configs,
+        min_rounds,
+        eta,
+    )
+    if data_dir is None:
+        halving.log_results(results)
+    return results['sweep_id']
 
 
 # pylint: disable=unused-argument,redefined-outer-name
 def trigger_model_retraining(flow, flow_run, state):
+    # pylint: disable-next=import-outside-toplevel
+    from prefect.deployments import run_deployment
+
     print(
         f"hello from {flow_run.name}'s completion hook |"
         f" the return value was {(r := state.result())!r}"
@@ -112,10 +285,57 @@ def trigger_model_retraining(flow, flow_run, state):
     persist_result=True,
     on_completion=[trigger_model_retraining],
 )
-def train_sweep():
+@profiled(report=True)
+# pylint: disable=too-many-arguments
+def train_sweep(
+    count: int = 5,
+    n_workers: int = 1,
+    nthread: int = None,
+    tree_method: str = TREE_METHOD,
+    max_bin: int = MAX_BIN,
+    mode: str = 'bayes',
+    data_dir: Path = None,
+    min_rounds: int = 8,
+    eta: int = 3,
+):
+    """Optimize the hyperparameters in `count` trials.
+
+    The data is loaded once for all the trials of a process, see
+    `src.models.backend`.
+    With `mode` `halving` or `hyperband` `count` configurations are trained
+    for `min_rounds` rounds and the best `1 / eta` of them continued,
+    see `run_halving_sweep`.
+    """
+    if mode in halving.MODES:
+        return run_halving_sweep(
+            mode,
+            count,
+            data_dir,
+            min_rounds,
+            eta,
+            nthread,
+            tree_method,
+            max_bin,
+        )
+    import wandb  # pylint: disable=import-outside-toplevel
+
     set_wandb_api_key()
     sweep_id = wandb.sweep(SWEEP_CONFIG, project=wandb_params.WANDB_PROJECT)
-    wandb.agent(sweep_id, function=train_xgb, count=5)
+    if n_workers > 1:
+        run_parallel_sweep(
+            sweep_id, count, n_workers, nthread, tree_method, max_bin
+        )
+    else:
+        wandb.agent(
+            sweep_id,
+            function=partial(
+                train_xgb,
+                nthread=nthread,
+                tree_method=tree_method,
+                max_bin=max_bin,
+            ),
+            count=count,
+        )
     return sweep_id
 
 
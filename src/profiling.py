@@ -0,0 +1,334 @@
+"""Profile the pipeline stages and compare the profiles of two runs.
+
+Wrap a task or flow function with `profiled` (below the Prefect decorator)
+or a block of code with `profile_stage` to record per stage:
+wall and CPU time, peak RSS, rows in/out and bytes read/written.
+CPU time and I/O are the whole process's, so they include the work of
+stages running concurrently in other threads.
+
+A flow wrapped with `profiled(report=True)` writes the JSON report of its
+stages to `PROFILE_DIR` (default `reports/profiles`) when it finishes.
+With `PROFILE_WANDB=1` every stage is logged to the active W&B run too.
+
+Diff two reports, exits with 1 if any stage regressed:
+
+    python -m src.profiling reports/profiles/old.json new.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import functools
+import threading
+import contextvars
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+import psutil
+
+from src.utils import get_project_root
+
+SAMPLE_INTERVAL = 0.05
+METRICS = [
+    'wall_seconds',
+    'cpu_seconds',
+    'peak_rss_bytes',
+    'rows_in',
+    'rows_out',
+    'bytes_read',
+    'bytes_written',
+]
+
+# smallest increase of time or memory reported as a regression
+NOISE_FLOORS = {
+    'wall_seconds': 0.1,
+    'cpu_seconds': 0.1,
+    'peak_rss_bytes': 16 * 2**20,
+}
+
+# stages finished in this process while a report is open,
+# and the number of stages there were when each open report started
+_stages = []
+_open_reports = []
+_current_stage = contextvars.ContextVar('current_stage', default=None)
+
+
+@dataclass
+class StageStats:  # pylint: disable=too-many-instance-attributes
+    name: str
+    parent: str = None
+    started_at: str = None
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    rows_in: int = None
+    rows_out: int = None
+    bytes_read: int = 0
+    bytes_written: int = 0
+
+
+class RssSampler:
+    """Background thread updating the peak RSS of the running stages."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def sample(self) -> None:
+        rss = self.process.memory_info().rss
+        with self.lock:
+            for stage in self.stages.values():
+                stage.peak_rss_bytes = max(stage.peak_rss_bytes, rss)
+
+    def run(self) -> None:
+        while True:
+            self.sample()
+            time.sleep(self.interval)
+
+    def add(self, stage: StageStats) -> None:
+        with self.lock:
+            self.stages[id(stage)] = stage
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.sample()
+
+    def remove(self, stage: StageStats) -> None:
+        self.sample()
+        with self.lock:
+            self.stages.pop(id(stage), None)
+
+
+_sampler = RssSampler()
+
+
+def read_counters() -> dict:
+    process = psutil.Process()
+    cpu = process.cpu_times()
+    counters = {'wall': time.perf_counter(), 'cpu': cpu.user + cpu.system}
+    try:
+        io = process.io_counters()
+    except (AttributeError, psutil.Error):
+        # not available on every platform
+        return counters
+    # all the I/O of the process, including the reads served from page cache
+    counters['read'] = getattr(io, 'read_chars', io.read_bytes)
+    counters['write'] = getattr(io, 'write_chars', io.write_bytes)
+    return counters
+
+
+def count_rows(obj) -> int | None:
+    """Rows of a DataFrame, array, matrix or DMatrix.
+
+    A tuple counts as its first item, e.g. `(X, y)`,
+    a list as the sum of its items, e.g. `[(X, y), ...]`.
+    """
+    if hasattr(obj, 'num_row'):
+        return obj.num_row()
+    if hasattr(obj, 'shape') and len(obj.shape) > 0:
+        return obj.shape[0]
+    if isinstance(obj, tuple) and obj:
+        return count_rows(obj[0])
+    if isinstance(obj, list) and obj:
+        counts = [count_rows(item) for item in obj]
+        return None if None in counts else sum(counts)
+    if isinstance(obj, int) and not isinstance(obj, bool):
+        return obj
+    return None
+
+
+@contextmanager
+def profile_stage(name: str, rows_in: int = None):
+    """Profile the block, yields its stats to set e.g. `rows_out`."""
+    parent = _current_stage.get()
+    stage = StageStats(
+        name=name,
+        parent=parent.name if parent else None,
+        started_at=datetime.now().isoformat(timespec='seconds'),
+        rows_in=rows_in,
+    )
+    start = read_counters()
+    token = _current_stage.set(stage)
+    _sampler.add(stage)
+    try:
+        yield stage
+    finally:
+        _sampler.remove(stage)
+        _current_stage.reset(token)
+        end = read_counters()
+        stage.wall_seconds = end['wall'] - start['wall']
+        stage.cpu_seconds = end['cpu'] - start['cpu']
+        stage.bytes_read = end.get('read', 0) - start.get('read', 0)
+        stage.bytes_written = end.get('write', 0) - start.get('write', 0)
+        if _open_reports:
+            _stages.append(stage)
+        if os.getenv('PROFILE_WANDB') == '1':
+            log_to_wandb(stage)
+
+
+def profiled(name: str = None, report: bool = False, report_dir: Path = None):
+    """Decorator profiling every call of the function as a stage.
+
+    Rows in are counted from the first argument, rows out from the result.
+    With `report=True` the report of all the stages run during the call is
+    written at the end, even if it fails.
+    """
+
+    def decorator(fn):
+        stage_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rows_in = count_rows(args[0]) if args else None
+            if report:
+                _open_reports.append(len(_stages))
+            try:
+                with profile_stage(stage_name, rows_in) as stage:
+                    result = fn(*args, **kwargs)
+                    stage.rows_out = count_rows(result)
+            finally:
+                if report:
+                    first = _open_reports.pop()
+                    write_report(stage_name, _stages[first:], report_dir)
+                    del _stages[first:]
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_report_dir() -> Path:
+    return Path(
+        os.getenv('PROFILE_DIR', get_project_root() / 'reports' / 'profiles')
+    )
+
+
+def write_report(
+    name: str, stages: [StageStats], report_dir: Path = None
+) -> Path:
+    report = {
+        'name': name,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'host': socket.gethostname(),
+        'cpu_count': os.cpu_count(),
+        'stages': [asdict(stage) for stage in stages],
+    }
+    report_dir = Path(report_dir or get_report_dir())
+    report_dir.mkdir(parents=True, exist_ok=True)
+    report_path = report_dir / f'{name}-{datetime.now():%Y%m%d-%H%M%S-%f}.json'
+    report_path.write_text(json.dumps(report, indent=2))
+    print(f'Profile report written to {report_path}')
+    return report_path
+
+
+def log_to_wandb(stage: StageStats) -> None:
+    import wandb  # pylint: disable=import-outside-toplevel
+
+    if wandb.run is None:
+        return
+    wandb.log(
+        {
+            f'profile/{stage.name}/{metric}': getattr(stage, metric)
+            for metric in METRICS
+            if getattr(stage, metric) is not None
+        }
+    )
+
+
+def summarize(report: dict) -> {str: dict}:
+    """Metrics per stage name: summed over calls, peak RSS is the max."""
+    summary = {}
+    for stage in report['stages']:
+        totals = summary.setdefault(stage['name'], {'calls': 0})
+        totals['calls'] += 1
+        for metric in METRICS:
+            value = stage[metric]
+            if value is None:
+                continue
+            if metric == 'peak_rss_bytes':
+                totals[metric] = max(totals.get(metric, 0), value)
+            else:
+                totals[metric] = totals.get(metric, 0) + value
+    return summary
+
+
+def diff_reports(old: dict, new: dict, threshold: float = 0.1) -> [dict]:
+    """Relative change of every metric of the stages of both reports.
+
+    A change is a regression if time or memory grew by more than threshold
+    and by more than the noise floor of the metric.
+    """
+    old_summary, new_summary = summarize(old), summarize(new)
+    rows = []
+    for name, new_totals in new_summary.items():
+        old_totals = old_summary.get(name)
+        if old_totals is None:
+            continue
+        for metric in METRICS:
+            old_value = old_totals.get(metric)
+            new_value = new_totals.get(metric)
+            if old_value is None or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value if old_value else 0.0
+            rows.append(
+                {
+                    'stage': name,
+                    'metric': metric,
+                    'old': old_value,
+                    'new': new_value,
+                    'change': change,
+                    'regression': metric in NOISE_FLOORS
+                    and change > threshold
+                    and new_value - old_value > NOISE_FLOORS[metric],
+                }
+            )
+    return rows
+
+
+def format_value(metric: str, value: float) -> str:
+    if metric.endswith('_seconds'):
+        return f'{value:.2f}s'
+    if metric.endswith('_bytes') or metric.startswith('bytes_'):
+        return f'{value / 2**20:,.1f}MiB'
+    return f'{value:,}'
+
+
+def main(argv: [str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Compare two profile reports of the pipeline.'
+    )
+    parser.add_argument('old', type=Path)
+    parser.add_argument('new', type=Path)
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='relative increase of time or memory reported as regression',
+    )
+    args = parser.parse_args(argv)
+    rows = diff_reports(
+        json.loads(args.old.read_text()),
+        json.loads(args.new.read_text()),
+        args.threshold,
+    )
+    for row in rows:
+        print(
+            f"{row['stage']:<30} {row['metric']:<15}"
+            f" {format_value(row['metric'], row['old']):>14}"
+            f" {format_value(row['metric'], row['new']):>14}"
+            f" {row['change']:>+8.1%}"
+            f"{'  REGRESSION' if row['regression'] else ''}"
+        )
+    return int(any(row['regression'] for row in rows))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""Score trips with the registered dv-model pipeline.
+
+The pipeline is loaded once and the vectorizer's vocabulary is turned into
+lookup tables from station/rideable/member values to feature indices, so
+the sparse feature rows are built directly, without per-trip dicts.
+Models trained with the station pair features get them from the
+memory-mapped index of the feature store.
+"""
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import scipy as sp
+import pandas as pd
+import pyarrow.dataset as ds
+
+from src.utils import read_pickle, get_models_dir, get_categorical_features
+from src.features.station_pairs import PAIR_FEATURES, StationPairIndex
+
+TIME_FEATURES = ['hour', 'year', 'month']
+PREDICTION_COL = 'predicted_duration'
+
+
+def get_iteration_range(model) -> (int, int):
+    """Trees used by the model's predict, up to the best iteration if any."""
+    best_iteration = getattr(model, 'best_iteration', None)
+    return (0, 0) if best_iteration is None else (0, best_iteration + 1)
+
+
+def rows_to_csr(
+    indices: np.ndarray, values: np.ndarray, n_features: int
+) -> sp.sparse.csr_matrix:
+    """CSR matrix of rows of feature indices and values, -1 means absent."""
+    order = np.argsort(indices, axis=1)
+    indices = np.take_along_axis(indices, order, axis=1)
+    values = np.take_along_axis(values, order, axis=1)
+    present = indices >= 0
+    indptr = np.zeros(len(indices) + 1, np.int64)
+    np.cumsum(present.sum(axis=1), out=indptr[1:])
+    return sp.sparse.csr_matrix(
+        (values[present], indices[present], indptr),
+        shape=(len(indices), n_features),
+    )
+
+
+class TripScorer:  # pylint: disable=too-many-instance-attributes
+    """Predict trip durations with a `make_pipeline(dv, model)` pipeline.
+
+    Unseen categorical values are ignored, like the vectorizers do.
+    The station pair features, if the model has them, are looked up in the
+    feature store in `pair_features_dir` (`data/features/station_pairs`).
+    """
+
+    def __init__(
+        self, pipeline_path: Path = None, pair_features_dir: Path = None
+    ):
+        pipeline = read_pickle(
+            pipeline_path or get_models_dir() / 'pipeline.pkl'
+        )
+        dv, model = pipeline[0], pipeline[-1]
+        self.booster = model.get_booster()
+        self.iteration_range = get_iteration_range(model)
+        self.n_features = len(dv.vocabulary_)
+        self.categorical = get_categorical_features()
+        # value -> feature index of every categorical column
+        self.category_indices = {
+            column: {
+                name.split('=', 1)[1]: index
+                for name, index in dv.vocabulary_.items()
+                if name.startswith(f'{column}=')
+            }
+            for column in self.categorical
+        }
+        # vectorized version of the same lookup for batches
+        self.category_arrays = {
+            column: (
+                pd.Index(list(indices)),
+                np.fromiter(indices.values(), np.int64, len(indices)),
+            )
+            for column, indices in self.category_indices.items()
+        }
+        self.time_indices = [dv.vocabulary_[name] for name in TIME_FEATURES]
+        self.pair_index, self.pair_indices = None, []
+        if PAIR_FEATURES[0] in dv.vocabulary_:
+            self.pair_index = StationPairIndex.load(pair_features_dir)
+            self.pair_indices = [dv.vocabulary_[n] for n in PAIR_FEATURES]
+
+    # pylint: disable=too-many-locals
+    def transform(self, df: pd.DataFrame) -> sp.sparse.csr_matrix:
+        """Feature rows of trips with categorical columns and `started_at`."""
+        n_rows = len(df)
+        started_at = df['started_at'].dt
+        time_values = [started_at.hour, started_at.year, started_at.month]
+        numeric = list(zip(self.time_indices, time_values))
+        if self.pair_index is not None:
+            pair_values = self.pair_index.lookup(df)
+            numeric += [
+                (index, pair_values[name])
+                for index, name in zip(self.pair_indices, PAIR_FEATURES)
+            ]
+        indices = np.empty(
+            (n_rows, len(self.categorical) + len(numeric)), np.int64
+        )
+        values = np.ones(indices.shape)
+        for i, column in enumerate(self.categorical):
+            values_index, feature_indices = self.category_arrays[column]
+            positions = values_index.get_indexer(df[column].astype(str))
+            indices[:, i] = np.where(
+                positions >= 0, feature_indices[positions], -1
+            )
+        for i, (index, column_values) in enumerate(
+            numeric, len(self.categorical)
+        ):
+            indices[:, i] = index
+            values[:, i] = column_values
+        return rows_to_csr(indices, values, self.n_features)
+
+    def predict(self, X: sp.sparse.csr_matrix) -> np.ndarray:
+        return self.booster.inplace_predict(
+            X, iteration_range=self.iteration_range
+        )
+
+    def predict_frame(
+        self, df: pd.DataFrame, chunksize: int = 100_000
+    ) -> np.ndarray:
+        """Predicted durations of a DataFrame of trips, scored in chunks."""
+        return np.concatenate(
+            [
+                self.predict(self.transform(df.iloc[i : i + chunksize]))
+                for i in range(0, len(df), chunksize)
+            ]
+            or [np.empty(0, np.float32)]
+        )
+
+    def predict_parquet(
+        self, path: Path, chunksize: int = 100_000, columns: [str] = None
+    ) -> pd.DataFrame:
+        """Trips of a Parquet file or dataset with their predicted durations.
+
+        The trips come in the dataset's order, with their feature columns,
+        the extra `columns` (e.g. an ID) and a `PREDICTION_COL` column.
+        Only one chunk of trips is vectorized at a time.
+        """
+        columns = self.categorical + ['started_at'] + (columns or [])
+        dataset = ds.dataset(path, partitioning='hive')
+        scored = [
+            df.assign(**{PREDICTION_COL: self.predict_frame(df, chunksize)})
+            for df in (
+                batch.to_pandas()
+                for batch in dataset.to_batches(
+                    columns=columns, batch_size=chunksize
+                )
+            )
+        ]
+        if not scored:
+            return (
+                dataset.to_table(columns=columns)
+                .to_pandas()
+                .assign(**{PREDICTION_COL: np.empty(0, np.float32)})
+            )
+        return pd.concat(scored, ignore_index=True)
+
+    def transform_trip(self, trip: dict) -> sp.sparse.csr_matrix:
+        """Feature row of a single trip dict.
+
+        Built without pandas, unless there are station pair features.
+        """
+        started_at = trip['started_at']
+        if isinstance(started_at, str):
+            started_at = datetime.fromisoformat(started_at)
+        features = dict(
+            zip(
+                self.time_indices,
+                [started_at.hour, started_at.year, started_at.month],
+            )
+        )
+        for column in self.categorical:
+            index = self.category_indices[column].get(str(trip[column]))
+            if index is not None:
+                features[index] = 1.0
+        if self.pair_index is not None:
+            pair_values = self.pair_index.lookup(
+                pd.DataFrame([trip], columns=self.categorical)
+            )
+            for index, name in zip(self.pair_indices, PAIR_FEATURES):
+                features[index] = float(pair_values[name].iloc[0])
+        indices = sorted(features)
+        return sp.sparse.csr_matrix(
+            (
+                np.array([features[i] for i in indices], np.float64),
+                np.array(indices, np.int32),
+                np.array([0, len(indices)], np.int32),
+            ),
+            shape=(1, self.n_features),
+        )
+
+    def predict_trip(self, trip: dict) -> float:
+        return float(self.predict(self.transform_trip(trip))[0])
@@ -0,0 +1,162 @@
+"""XGBoost tree ensemble flattened into NumPy arrays.
+
+The nodes of all the trees are concatenated into one set of arrays and
+every row walks all the trees at once, one tree level per step, so
+prediction is a handful of vectorized NumPy operations per level.
+The arrays can be saved to a `.npz` file and scored without XGBoost.
+
+Rows are scored in chunks densified with NaN for the features absent from
+the CSR matrix, which are missing values, as in a DMatrix built from it.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import scipy as sp
+import xgboost as xgb
+
+NODE_ARRAYS = [
+    'left_children',
+    'right_children',
+    'split_indices',
+    'split_conditions',
+    'default_left',
+]
+
+
+def dense_rows(X: sp.sparse.csr_matrix) -> np.ndarray:
+    """Dense X with NaN for the absent (missing) values."""
+    dense = np.full(X.shape, np.nan, np.float32)
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+    dense[rows, X.indices] = X.data
+    return dense
+
+
+class TreeEnsemble:
+    """Flattened trees of a `reg:squarederror` XGBoost booster.
+
+    `x < split_condition` goes left, a missing value goes to the default
+    child. Leaves point to themselves, so rows stay in place once they've
+    reached one, and their leaf value is kept in `split_conditions`.
+    """
+
+    def __init__(self, arrays: {str: np.ndarray}):
+        self.arrays = arrays
+        # children of node i at 2 * i (left) and 2 * i + 1 (right)
+        self.children = np.stack(
+            [arrays['left_children'], arrays['right_children']], axis=1
+        ).ravel()
+        self.default_right = ~arrays['default_left']
+
+    @classmethod
+    def from_booster(cls, booster: xgb.Booster) -> 'TreeEnsemble':
+        """Trees of `booster`, up to its best iteration if early stopped.
+
+        Those are the trees the scikit-learn model of the pipeline predicts
+        with, the ones after the best iteration aren't exported.
+        """
+        best_iteration = booster.attr('best_iteration')
+        if best_iteration is not None:
+            booster = booster[: int(best_iteration) + 1]
+        model = json.loads(booster.save_raw('json'))['learner']
+        gbtree = model['gradient_booster']['model']
+        trees = gbtree['trees']
+        if any(any(tree['split_type']) for tree in trees):
+            raise ValueError('categorical splits are not supported')
+        offsets = np.cumsum(
+            [0] + [len(tree['left_children']) for tree in trees]
+        )
+        arrays = {
+            name: np.concatenate([tree[name] for tree in trees])
+            for name in NODE_ARRAYS
+        }
+        is_leaf = arrays['left_children'] == -1
+        node_offsets = np.repeat(offsets[:-1], np.diff(offsets))
+        nodes = np.arange(offsets[-1])
+        for name in ['left_children', 'right_children']:
+            arrays[name] = np.where(
+                is_leaf, nodes, arrays[name] + node_offsets
+            ).astype(np.int32)
+        arrays['split_indices'] = arrays['split_indices'].astype(np.int32)
+        arrays['split_conditions'] = arrays['split_conditions'].astype(
+            np.float32
+        )
+        arrays['default_left'] = arrays['default_left'].astype(bool)
+        arrays['roots'] = offsets[:-1].astype(np.int32)
+        arrays['base_score'] = np.array(
+            float(model['learner_model_param']['base_score'])
+        )
+        arrays['trees_per_iteration'] = np.array(
+            int(gbtree['gbtree_model_param']['num_parallel_tree'])
+        )
+        arrays['max_depth'] = np.array(
+            max(
+                tree_depth(tree['left_children'], tree['right_children'])
+                for tree in trees
+            )
+        )
+        return cls(arrays)
+
+    def save(self, path: Path) -> None:
+        np.savez(path, **self.arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> 'TreeEnsemble':
+        with np.load(path) as arrays:
+            return cls(dict(arrays))
+
+    def predict(
+        self,
+        X: sp.sparse.csr_matrix,
+        iteration_range: (int, int) = (0, 0),
+        chunksize: int = 2_000,
+    ) -> np.ndarray:
+        """Predictions of the trees in `iteration_range`, (0, 0) for all."""
+        roots = self.arrays['roots']
+        per_iteration = int(self.arrays['trees_per_iteration'])
+        start, end = iteration_range
+        roots = roots[start * per_iteration : end * per_iteration or len(roots)]
+        return np.concatenate(
+            [
+                self.predict_rows(X[i : i + chunksize], roots)
+                for i in range(0, X.shape[0], chunksize)
+            ]
+            or [np.empty(0, np.float32)]
+        )
+
+    def predict_rows(
+        self, X: sp.sparse.csr_matrix, roots: np.ndarray
+    ) -> np.ndarray:
+        split_indices = self.arrays['split_indices']
+        split_conditions = self.arrays['split_conditions']
+        n_rows, n_features = X.shape
+        dense = dense_rows(X).ravel()
+        # (row, tree) pairs flattened, the position of row's features in dense
+        row_offsets = np.repeat(np.arange(n_rows) * n_features, len(roots))
+        nodes = np.tile(roots, n_rows)
+        for _ in range(int(self.arrays['max_depth'])):
+            x = dense.take(row_offsets + split_indices.take(nodes))
+            # comparisons with NaN are False, so missing values only go right
+            # if that's their default
+            go_right = (x >= split_conditions.take(nodes)) | (
+                np.isnan(x) & self.default_right.take(nodes)
+            )
+            nodes = self.children.take(2 * nodes + go_right)
+        leaves = split_conditions.take(nodes).reshape(n_rows, len(roots))
+        return leaves.sum(axis=1, dtype=np.float32) + np.float32(
+            self.arrays['base_score']
+        )
+
+
+def tree_depth(left_children: [int], right_children: [int]) -> int:
+    depth, level = 0, [0]
+    while True:
+        level = [
+            child
+            for node in level
+            for child in (left_children[node], right_children[node])
+            if child != -1
+        ]
+        if not level:
+            return depth
+        depth += 1
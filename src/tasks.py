@@ -0,0 +1,19 @@
+"""Prefect tasks of the shared helpers, for the flows to run them as tasks.
+
+Kept out of `src.utils` so that importing the helpers doesn't import prefect.
+"""
+from pathlib import Path
+
+from prefect import task
+
+from src.utils import read_pickle, write_pickle
+
+
+@task
+def load_pickle(file_path: Path) -> object:
+    return read_pickle(file_path)
+
+
+@task
+def dump_pickle(obj, file_path: Path) -> None:
+    write_pickle(obj, file_path)
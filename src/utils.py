@@ -1,15 +1,20 @@
+"""Paths, feature names and small helpers shared by the whole package.
+
+Imported by every module, so it only imports numpy, pandas and joblib:
+xgboost, scikit-learn, wandb and the prefect blocks are imported by the
+helpers that use them, the prefect pickle tasks are in `src.tasks`.
+"""
 import os
+from typing import TYPE_CHECKING
 from pathlib import Path
 
 import numpy as np
-import scipy as sp
 import joblib
-import xgboost as xgb
-from prefect import task
-from sklearn.metrics import mean_squared_error
-from prefect.blocks.system import Secret  # pylint: disable=ungrouped-imports
+import pandas as pd
 
-import wandb
+if TYPE_CHECKING:
+    import scipy as sp
+    import xgboost as xgb
 
 TARGET_COL = 'duration'
 
@@ -35,13 +40,43 @@ def get_categorical_features() -> [str]:
     ]
 
 
-def feature_dtypes() -> dict:
-    return {
-        'start_station_id': 'str',
-        'end_station_id': 'str',
-        'rideable_type': 'str',
-        'member_casual': 'str',
-    }
+def feature_dtypes(compact: bool = False) -> dict:
+    """Dtypes of the categorical features when reading a trips csv.
+
+    With `compact` they are read as pandas categoricals: small integer codes
+    per row and every distinct value stored once, instead of a Python str.
+    """
+    dtype = 'category' if compact else 'str'
+    return {feature: dtype for feature in get_categorical_features()}
+
+
+def to_compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Categorical features as categoricals and the target as float32."""
+    return df.astype(
+        {
+            **{
+                feature: 'category'
+                for feature in get_categorical_features()
+                if feature in df
+            },
+            **({TARGET_COL: np.float32} if TARGET_COL in df else {}),
+        }
+    )
+
+
+def bytes_per_row(*dfs: pd.DataFrame) -> float:
+    """Memory taken by dataframes per row, including the Python strings."""
+    n_bytes = sum(df.memory_usage(deep=True).sum() for df in dfs)
+    return n_bytes / max(sum(len(df) for df in dfs), 1)
+
+
+def memory_note(dfs: [pd.DataFrame], compact: bool) -> str:
+    """`, <bytes per row> bytes per row` of compact dataframes, else ''.
+
+    Measuring str columns scans every Python string, only the compact
+    dtypes are measured cheaply enough to log it on every run.
+    """
+    return f', {bytes_per_row(*dfs):.0f} bytes per row' if compact else ''
 
 
 def get_year_months(
@@ -75,50 +110,65 @@ def get_year_months(
     ]
 
 
-@task
-def load_pickle(file_path: Path) -> object:
+def read_pickle(file_path: Path) -> object:
     with open(file_path, "rb") as f_in:
         return joblib.load(f_in)
 
 
-@task
-def dump_pickle(obj, file_path: Path) -> None:
+def write_pickle(obj, file_path: Path) -> None:
     with open(file_path, "wb") as f_out:
         joblib.dump(obj, f_out)
 
 
 def set_wandb_api_key():
     if not os.getenv('WANDB_API_KEY'):
+        # pylint: disable-next=import-outside-toplevel
+        from prefect.blocks.system import Secret
+
         os.environ['WANDB_API_KEY'] = Secret.load('wandb-api-key').get()
 
 
 def calculate_rmse(
-    booster: xgb.Booster,
+    booster: 'xgb.Booster',
     y_true: np.ndarray,
-    X: sp.sparse.csr_matrix,
+    X: 'sp.sparse.csr_matrix',
     convert: bool = True,
 ) -> float:
-    X = convert_to_dmatrix(X) if convert else X
-    y_pred = booster.predict(
-        X, validate_features=False, iteration_range=(0, booster.best_iteration)
-    )
+    # pylint: disable-next=import-outside-toplevel
+    from sklearn.metrics import mean_squared_error
+
+    iteration_range = (0, booster.best_iteration)
+    if convert:
+        # predict straight from the CSR matrix, without a DMatrix copy of it
+        y_pred = booster.inplace_predict(
+            X, validate_features=False, iteration_range=iteration_range
+        )
+    else:
+        y_pred = booster.predict(
+            X, validate_features=False, iteration_range=iteration_range
+        )
     return mean_squared_error(y_true, y_pred, squared=False)
 
 
 def convert_to_dmatrix(
-    X: sp.sparse.csr_matrix,
+    X: 'sp.sparse.csr_matrix',
     y: np.ndarray = None,
     feature_names: np.ndarray = None,
-) -> xgb.DMatrix:
+) -> 'xgb.DMatrix':
+    # pylint: disable-next=import-outside-toplevel,redefined-outer-name
+    import xgboost as xgb
+
     return xgb.DMatrix(X, label=y, feature_names=feature_names)
 
 
 def log_val_preds_table(
     table_name: str,
     booster,
-    val: sp.sparse.csr_matrix | xgb.DMatrix,
+    val: 'sp.sparse.csr_matrix | xgb.DMatrix',
     y_val: np.ndarray,
 ):
+    import wandb  # pylint: disable=import-outside-toplevel
+
     preds_artifact = wandb.Artifact(table_name, type='predictions')
     val_preds = booster.predict(
         val, iteration_range=(0, booster.best_iteration + 1)
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils import TARGET_COL, write_pickle
+
+RAW_CSV = """\
+ride_id,rideable_type,started_at,ended_at,start_station_id,end_station_id,member_casual
+A,docked_bike,2020-04-25 17:28:39,2020-04-25 17:35:04,31239,31251,casual
+B,docked_bike,2020-04-06 07:54:59,2020-04-06 07:57:24,31205,31224,member
+C,docked_bike,2020-04-22 17:06:18,2020-04-22 18:08:32,31313,31313,casual
+D,electric_bike,2020-04-22 17:06:18,2020-04-22 17:06:17,31313,31313,member
+E,electric_bike,2020-04-22 17:06:18,2020-04-22 18:46:19,31313,31313,member
+F,electric_bike,2020-04-22 17:06:18,2020-04-22 18:46:18,31313,31313,member
+G,electric_bike,2020-04-22 17:06:18,2020-04-22 17:10:00,WS-DC-01,31313,member
+H,electric_bike,2020-04-22 17:06:18,2020-04-22 17:10:00,31313,32.5,member
+I,electric_bike,2020-04-22 17:06:18,2020-04-22 17:10:00,31313,,member
+J,electric_bike,2020-04-22 17:06:18,,31313,31205,member
+K,,2020-04-22 17:06:18,2020-04-22 17:09:00,31313,31205,casual
+L,classic_bike,2020-04-30 23:59:59,2020-05-01 00:00:00,31205,31239,casual
+"""
+
+
+def make_trips(n_rows=200):
+    stations = [str(31000 + i) for i in range(10)]
+    return pd.DataFrame(
+        {
+            'start_station_id': [stations[i % 10] for i in range(n_rows)],
+            'end_station_id': [stations[i * 7 % 10] for i in range(n_rows)],
+            'rideable_type': ['classic_bike', 'electric_bike'] * (n_rows // 2),
+            'member_casual': ['member'] * (n_rows // 4) * 3
+            + ['casual'] * (n_rows // 4),
+            TARGET_COL: [float(i % 37) for i in range(n_rows)],
+            'started_at': pd.date_range(
+                '2023-04-01', periods=n_rows, freq='37min'
+            ),
+        }
+    )
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path_factory, monkeypatch):
+    """Memoized results of one test are never seen by another.
+
+    Memoization stays on even after the benchmarks turn it off.
+    """
+    monkeypatch.setenv('CACHE_DIR', str(tmp_path_factory.mktemp('cache')))
+    monkeypatch.setenv('TASK_CACHE_GB', '1')
+
+
+@pytest.fixture(name='raw_csv')
+def fixture_raw_csv():
+    """A month of raw trips, with every kind of row the cleaning drops."""
+    return RAW_CSV
+
+
+@pytest.fixture(name='processed_data')
+def fixture_processed_data(tmp_path):
+    """Processed-data artifact in the pickle format, same data in all splits.
+
+    Returns its directory, the vectorizer and the splits' X and y.
+    """
+    # pylint: disable=import-outside-toplevel
+    from src.features.encoding import CategoricalVectorizer
+    from src.models.data_cache import SPLITS
+
+    df = pd.DataFrame(
+        {
+            'start_station_id': ['1', '2', '3', '1'],
+            'end_station_id': ['2', '3', '1', '1'],
+            'rideable_type': ['classic_bike'] * 4,
+            'member_casual': ['member', 'casual', 'member', 'member'],
+            'hour': [0, 5, 10, 23],
+            'year': [2023] * 4,
+            'month': [4, 4, 5, 6],
+        }
+    )
+    dv = CategoricalVectorizer().fit(df)
+    X = dv.transform(df)
+    y = np.array([1.5, 2.5, 3.5, 4.5])
+    artifact_dir = tmp_path / 'artifact'
+    artifact_dir.mkdir()
+    write_pickle(dv, artifact_dir / 'dv.pkl')
+    for split in SPLITS:
+        write_pickle((X, y), artifact_dir / f'{split}.pkl')
+    return artifact_dir, dv, X, y
+
+
+@pytest.fixture(name='training_data_dir')
+def fixture_training_data_dir(processed_data, tmp_path):
+    """Training data cache entry of the `processed_data` artifact."""
+    # pylint: disable-next=import-outside-toplevel
+    from src.models.data_cache import build_entry
+
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    build_entry(processed_data[0], data_dir)
+    return data_dir
+
+
+@pytest.fixture(name='make_trips')
+def fixture_make_trips():
+    """Factory of `n_rows` interim trips between 10 stations."""
+    return make_trips
+
+
+@pytest.fixture(name='fit_pipeline')
+def fixture_fit_pipeline(tmp_path):
+    """Function fitting a small pipeline of `dv` on the trips `df`.
+
+    It returns the path the pipeline is saved to.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import xgboost as xgb
+    from sklearn.pipeline import make_pipeline
+
+    from src.data.prepare import get_features
+
+    def fit_pipeline(df, dv):
+        X = dv.fit_transform(get_features(df, dv))
+        model = xgb.XGBRegressor(n_estimators=10, max_depth=4)
+        model.fit(X, df[TARGET_COL])
+        pipeline_path = tmp_path / 'pipeline.pkl'
+        write_pickle(make_pipeline(dv, model), pipeline_path)
+        return pipeline_path
+
+    return fit_pipeline
@@ -0,0 +1,26 @@
+import pytest
+import xgboost as xgb
+
+from src.models import backend
+
+
+def test_hist_data_is_binned_once(training_data_dir):
+    data = backend.load_training_data(training_data_dir, max_bin=16, nthread=1)
+
+    assert isinstance(data['train'], xgb.QuantileDMatrix)
+    assert not isinstance(data['val'], xgb.QuantileDMatrix)
+    assert backend.load_training_data(training_data_dir, max_bin=16) is data
+    assert backend.load_training_data(training_data_dir, max_bin=32) is not data
+
+
+def test_other_tree_methods_load_dmatrix_buffers(training_data_dir):
+    data = backend.load_training_data(training_data_dir, 'approx')
+
+    assert not any(isinstance(d, xgb.QuantileDMatrix) for d in data.values())
+    assert data['train'].num_row() == 4
+    assert backend.backend_params('exact', nthread=2) == {
+        'tree_method': 'exact',
+        'nthread': 2,
+    }
+    with pytest.raises(ValueError):
+        backend.load_training_data(training_data_dir, 'approx', chunk_rows=2)
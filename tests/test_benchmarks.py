@@ -0,0 +1,34 @@
+from benchmarks import suite
+from benchmarks.synthetic import write_month_archive
+from src.data.combine_raw import process_data
+
+
+def test_synthetic_month_matches_raw_schema(tmp_path):
+    zip_path = write_month_archive(tmp_path, 3000, chunk_rows=1000)
+
+    df = process_data.fn(zip_path)
+
+    assert zip_path.name == '202305-capitalbikeshare-tripdata.zip'
+    assert 0.9 * 3000 < len(df) < 3000
+    assert df.duration.between(0, 100).all()
+    assert df.started_at.dt.month.eq(5).all()
+
+
+def test_suite_profiles_every_stage(tmp_path):
+    args = ['--rows', '3000', '--rounds', '2', '--nthread', '1']
+    args += ['--baseline-dir', str(tmp_path)]
+
+    assert suite.main(args + ['--save-baseline']) == 0
+
+    report = suite.run(3000, rounds=2, nthread=1)
+    assert [stage['name'] for stage in report['stages']] == [
+        *['process_data'] * 3,
+        'combine_save_data',
+        'preprocess',
+        'dataset_split',
+        'split_by_dates',
+        'build_dmatrix',
+        'train',
+        'suite-3000',
+    ]
+    assert (tmp_path / '3000.json').exists()
@@ -0,0 +1,179 @@
+import os
+
+import numpy as np
+import scipy as sp
+import pandas as pd
+import xgboost as xgb
+from numpy.testing import assert_allclose
+from pandas.testing import assert_frame_equal
+
+from src.cache import DiskCache, memoized, project_modules
+from src.models import data_cache
+from src.data.combine_raw import process_data
+from src.models.register_best_model import fit_full, log_training_curves
+
+
+def write_entry(size):
+    def build(entry_dir):
+        (entry_dir / 'data').write_bytes(b'x' * size)
+
+    return build
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=250)
+    for i, key in enumerate(['a', 'b']):
+        cache.put(key, write_entry(100))
+        os.utime(tmp_path / key, (i, i))
+
+    assert cache.get('a') is not None  # now the most recently used
+    cache.put('c', write_entry(100))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['a', 'c']
+
+
+def test_disk_cache_builds_entry_once(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=1000)
+    builds = []
+
+    def build(entry_dir):
+        builds.append(entry_dir)
+        write_entry(10)(entry_dir)
+
+    first = cache.get_or_put('key', build)
+    second = cache.get_or_put('key', build)
+
+    assert first == second == tmp_path / 'key'
+    assert len(builds) == 1
+
+
+class FakeArtifact:
+    def __init__(self, artifact_dir, digest):
+        self.artifact_dir = artifact_dir
+        self.digest = digest
+        self.downloads = 0
+
+    def download(self):
+        self.downloads += 1
+        return str(self.artifact_dir)
+
+
+def test_training_data_cache(processed_data, tmp_path, monkeypatch):
+    monkeypatch.setenv('CACHE_DIR', str(tmp_path / 'cache'))
+    artifact_dir, dv, X, y = processed_data
+    artifact = FakeArtifact(artifact_dir, 'digest')
+
+    data_dir = data_cache.get_training_data(artifact)
+    data_dir = data_cache.get_training_data(artifact)
+
+    assert artifact.downloads == 1
+    X_cached, y_cached = data_cache.load_split(data_dir, 'val')
+    assert isinstance(y_cached, np.memmap)
+    assert (X_cached != X).nnz == 0
+    np.testing.assert_array_equal(y_cached, y)
+    dmatrix = data_cache.load_dmatrix(data_dir, 'train')
+    assert dmatrix.feature_names == list(dv.get_feature_names_out())
+    np.testing.assert_array_equal(dmatrix.get_label(), y)
+    assert isinstance(data_cache.load_vectorizer(data_dir), type(dv))
+    assert sp.sparse.isspmatrix_csr(X_cached)
+
+
+def test_external_memory_dmatrix_streams_the_splits(
+    processed_data, training_data_dir
+):
+    _, dv, X, y = processed_data
+    params = {'tree_method': 'hist', 'max_depth': 2}
+    # the same data in both splits
+    in_memory = xgb.train(
+        params, xgb.DMatrix(sp.sparse.vstack([X, X]), np.tile(y, 2))
+    )
+
+    for quantile in [True, False]:
+        dmatrix = data_cache.external_memory_dmatrix(
+            training_data_dir,
+            ['train', 'val'],
+            chunk_rows=3,
+            quantile=quantile,
+        )
+        assert dmatrix.num_row() == 2 * X.shape[0]
+        assert dmatrix.feature_names == list(dv.get_feature_names_out())
+        np.testing.assert_array_equal(dmatrix.get_label(), np.tile(y, 2))
+        booster = xgb.train(params, dmatrix)
+        np.testing.assert_allclose(
+            booster.inplace_predict(X), in_memory.inplace_predict(X)
+        )
+
+
+def test_memoized_results_follow_inputs_and_code(tmp_path, monkeypatch):
+    calls = []
+
+    @memoized(max_bytes=2**20)
+    def scaled(csv_path, scale=1):
+        calls.append(csv_path)
+        return pd.read_csv(csv_path) * scale
+
+    csv_path = tmp_path / 'a.csv'
+    csv_path.write_text('x\n1\n2\n')
+    first = scaled(csv_path)
+    assert_frame_equal(scaled(csv_path), first)
+    assert len(calls) == 1
+
+    scaled(csv_path, scale=2)
+    csv_path.write_text('x\n1\n30\n')
+    assert scaled(csv_path).x.tolist() == [1, 30]
+    assert len(calls) == 3
+
+    # keyed by path, size and modification time, the file isn't read
+    mtime_ns = csv_path.stat().st_mtime_ns
+    os.utime(csv_path, ns=(mtime_ns, mtime_ns + 10**9))
+    scaled(csv_path)
+    assert len(calls) == 4
+
+    monkeypatch.setattr('src.cache.code_digest', lambda fn: 'new version')
+    scaled(csv_path)
+    assert len(calls) == 5
+
+
+def test_code_version_covers_the_imported_project_modules():
+    modules = project_modules(process_data.fn.__module__)
+
+    assert {'src.utils', 'src.data.zip_reader', 'src.data.interim'} <= set(
+        modules
+    )
+    assert not any(module.startswith('pandas') for module in modules)
+
+
+def test_final_fit_is_memoized_by_data_version(
+    training_data_dir, capsys, monkeypatch
+):
+    logged = []
+    monkeypatch.setattr('wandb.log', logged.append)
+    params = {'tree_method': 'hist', 'nthread': 1, 'max_depth': 2}
+
+    expected, model = (
+        fit_full(params, training_data_dir, 'v1').named_steps['xgbregressor']
+        for _ in range(2)
+    )
+    log_training_curves(model)
+
+    assert 'fit_full: cached result' in capsys.readouterr().out
+    assert_allclose(
+        model.evals_result()['validation_0']['rmse'],
+        expected.evals_result()['validation_0']['rmse'],
+    )
+    rounds = model.get_booster().num_boosted_rounds()
+    assert [log['epoch'] for log in logged if 'epoch' in log] == list(
+        range(rounds)
+    )
+    assert 'validation_0-rmse' in logged[0]
+
+
+def test_process_data_is_memoized(raw_csv, tmp_path, capsys):
+    csv_path = tmp_path / '202004-capitalbikeshare-tripdata.csv'
+    csv_path.write_text(raw_csv)
+
+    expected = process_data.fn(csv_path, compact=True)
+    result = process_data.fn(csv_path, compact=True)
+
+    assert 'process_data: cached result' in capsys.readouterr().out
+    assert_frame_equal(result, expected)
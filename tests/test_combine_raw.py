@@ -0,0 +1,198 @@
+import os
+from types import SimpleNamespace
+from zipfile import ZipFile
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from src.data import combine_raw
+from src.data.interim import read_interim, write_interim, write_manifest
+from benchmarks.bench_process_data import legacy_clean_trips
+
+os.environ["WANDB_MODE"] = "offline"
+
+
+def legacy_process_data(file_path):
+    categorical = combine_raw.get_categorical_features()
+    date_columns = ['started_at', 'ended_at']
+    df = pd.read_csv(
+        file_path,
+        parse_dates=date_columns,
+        usecols=categorical + date_columns,
+        dtype=combine_raw.feature_dtypes(),
+    )
+    return legacy_clean_trips(df)
+
+
+def test_process_data_matches_legacy_implementation(raw_csv, tmp_path):
+    csv_path = tmp_path / '202004-capitalbikeshare-tripdata.csv'
+    csv_path.write_text(raw_csv)
+
+    result = combine_raw.process_data.fn(csv_path)
+
+    assert list(result.index) == [0, 1, 2, 5, 11]
+    assert_frame_equal(result, legacy_process_data(csv_path))
+
+
+def test_duration_minutes_is_bit_exact():
+    rng = np.random.default_rng(42)
+    started_at = pd.Series(
+        pd.Timestamp('2023-05-01')
+        + pd.to_timedelta(rng.integers(0, 10**15, 10_000), unit='ns')
+    )
+    ended_at = started_at + pd.to_timedelta(
+        rng.integers(-(10**13), 10**13, 10_000), unit='ns'
+    )
+
+    expected = (ended_at - started_at).apply(lambda td: td.total_seconds() / 60)
+
+    np.testing.assert_array_equal(
+        combine_raw.duration_minutes(started_at, ended_at), expected.values
+    )
+
+
+def test_only_new_or_changed_months_are_processed(raw_csv, tmp_path):
+    zip_file_path = tmp_path / 'all_raw_data.zip'
+    with ZipFile(zip_file_path, 'w') as zip_ref:
+        zip_ref.writestr('.gitkeep', '')
+        zip_ref.writestr('202004-capitalbikeshare-tripdata.csv', raw_csv)
+        zip_ref.writestr('202005-capitalbikeshare-tripdata.csv', raw_csv * 2)
+        zip_ref.writestr('202006-capitalbikeshare-tripdata.csv', raw_csv)
+    fingerprints = combine_raw.get_zip_fingerprints(zip_file_path)
+    manifest = {
+        '202004-capitalbikeshare-tripdata.csv': fingerprints[
+            '202004-capitalbikeshare-tripdata.csv'
+        ],
+        '202005-capitalbikeshare-tripdata.csv': fingerprints[
+            '202004-capitalbikeshare-tripdata.csv'
+        ],
+    }
+    file_paths = combine_raw.get_file_paths_to_process(
+        2020, 4, 2020, 6, tmp_path
+    )
+
+    changed = combine_raw.get_changed_file_paths(
+        file_paths, fingerprints, manifest
+    )
+
+    assert sorted(fingerprints) == [path.name for path in file_paths]
+    assert [path.name for path in changed] == [
+        '202005-capitalbikeshare-tripdata.csv',
+        '202006-capitalbikeshare-tripdata.csv',
+    ]
+
+
+def test_stream_process_data_matches_process_data(raw_csv, tmp_path):
+    csv_path = tmp_path / '202004-capitalbikeshare-tripdata.csv'
+    csv_path.write_text(raw_csv)
+    store_dir = tmp_path / 'store'
+    sampler = combine_raw.ReservoirSampler(3)
+
+    n_rows = combine_raw.stream_process_data.fn(
+        csv_path, store_dir, sampler, chunksize=4
+    )
+
+    expected = combine_raw.process_data.fn(csv_path)
+    result = read_interim(store_dir).sort_values('started_at')
+    assert n_rows == len(result) == len(expected)
+    assert sorted(result.duration) == sorted(expected.duration)
+    assert len(sampler.sample) == 3
+    assert sampler.sample.index.isin(expected.index).all()
+
+
+def test_reservoir_sampler_is_uniform():
+    counts = np.zeros(1000)
+    for seed in range(100):
+        sampler = combine_raw.ReservoirSampler(100, seed=seed)
+        for start in range(0, 1000, 70):
+            sampler.update(
+                pd.DataFrame({'x': np.arange(start, min(start + 70, 1000))})
+            )
+        assert sampler.sample.x.is_unique
+        counts[sampler.sample.x] += 1
+
+    # every row is picked with probability 100 / 1000, 10 times on average
+    assert len(sampler.sample) == 100
+    assert abs(counts[:500].mean() - counts[500:].mean()) < 1
+    assert counts.min() > 0
+
+
+def test_compact_process_data_matches_default(raw_csv, tmp_path):
+    first_path = tmp_path / '202004-capitalbikeshare-tripdata.csv'
+    first_path.write_text(raw_csv)
+    second_path = tmp_path / '202005-capitalbikeshare-tripdata.csv'
+    second_path.write_text(raw_csv.replace('31205', '31400'))
+
+    dfs = [
+        combine_raw.process_data.fn(path) for path in [first_path, second_path]
+    ]
+    compact_dfs = [
+        combine_raw.process_data.fn(path, compact=True)
+        for path in [first_path, second_path]
+    ]
+    result = combine_raw.concat_trips(compact_dfs)
+
+    assert result.start_station_id.dtype == 'category'
+    assert '31205' in result.start_station_id.cat.categories
+    assert 'WS-DC-01' not in result.start_station_id.cat.categories
+    assert result.duration.dtype == np.float32
+    assert_frame_equal(
+        result.astype(
+            dict.fromkeys(combine_raw.get_categorical_features(), str)
+        ),
+        pd.concat(dfs).astype({'duration': np.float32}),
+    )
+
+
+def test_process_data_in_pool_matches_process_data(raw_csv, tmp_path):
+    paths = []
+    for month in [4, 5]:
+        csv_path = tmp_path / f'20200{month}-capitalbikeshare-tripdata.csv'
+        csv_path.write_text(raw_csv.replace('31205', f'3140{month}'))
+        paths.append(csv_path)
+
+    dfs = combine_raw.process_data_in_pool.fn(
+        paths, n_workers=2, memory_limit_mb=4096, compact=True
+    )
+
+    assert len(dfs) == 2
+    for df, path in zip(dfs, paths):
+        expected = combine_raw.process_data.fn(path, compact=True)
+        assert_frame_equal(df, expected.reset_index(drop=True))
+
+
+def test_pyarrow_reader_matches_pandas(raw_csv, tmp_path):
+    csv_path = tmp_path / '202004-capitalbikeshare-tripdata.csv'
+    csv_path.write_text(raw_csv)
+
+    for compact in [False, True]:
+        assert_frame_equal(
+            combine_raw.process_data.fn(
+                csv_path, compact=compact, reader='pyarrow'
+            ),
+            combine_raw.process_data.fn(csv_path, compact=compact),
+        )
+
+
+def test_only_parquet_stores_with_a_manifest_are_appended_to(raw_csv, tmp_path):
+    artifact_dir = tmp_path / 'artifact'
+    artifact_dir.mkdir()
+    (artifact_dir / '202004-202306-interim.tar.gz').write_text('')
+    wandb_run = SimpleNamespace(
+        use_artifact=lambda name, type: SimpleNamespace(
+            download=lambda: artifact_dir
+        )
+    )
+    store_dir = tmp_path / 'store'
+
+    with pytest.raises(ValueError, match='no Parquet interim store'):
+        combine_raw.restore_interim_store(wandb_run, 'csv:latest', store_dir)
+
+    csv_path = tmp_path / '202004-capitalbikeshare-tripdata.csv'
+    csv_path.write_text(raw_csv)
+    write_interim(combine_raw.process_data.fn(csv_path), store_dir)
+    assert not combine_raw.can_append(store_dir)
+    write_manifest(store_dir, {csv_path.name: {}})
+    assert combine_raw.can_append(store_dir)
@@ -0,0 +1,172 @@
+import json
+import threading
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from src.data import downloader
+
+
+class BucketHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the S3 bucket: ETag, conditional and Range GETs."""
+
+    files = {}
+    requests = []
+    truncate_next = False
+
+    def do_GET(self):
+        name = self.path.lstrip('/')
+        self.requests.append((name, dict(self.headers)))
+        if name not in self.files:
+            self.send_response(403)
+            self.end_headers()
+            return
+        content = self.files[name]
+        etag = f'"{hash(content)}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') == etag:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            if start >= len(content):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        body = content[start:]
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(usegmt=True))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if BucketHandler.truncate_next:
+            BucketHandler.truncate_next = False
+            body = body[: len(body) // 2]
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        name = self.path.lstrip('/')
+        self.requests.append((name, dict(self.headers)))
+        if name not in self.files:
+            self.send_response(403)
+        else:
+            self.send_response(200)
+            self.send_header('ETag', f'"{hash(self.files[name])}"')
+        self.end_headers()
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture(name='bucket')
+def fixture_bucket():
+    BucketHandler.files = {
+        '202305-capitalbikeshare-tripdata.zip': b'may' * 100_000,
+        '202306-capitalbikeshare-tripdata.zip': b'june' * 100_000,
+    }
+    BucketHandler.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BucketHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
+
+
+def test_download_skips_unchanged_files(bucket, tmp_path):
+    file_names = [
+        '202305-capitalbikeshare-tripdata.zip',
+        '202306-capitalbikeshare-tripdata.zip',
+        '202307-capitalbikeshare-tripdata.zip',
+    ]
+
+    statuses = downloader.download_files(file_names, bucket, tmp_path)
+
+    assert list(statuses.values()) == ['downloaded', 'downloaded', 'missing']
+    for file_name, content in BucketHandler.files.items():
+        assert (tmp_path / file_name).read_bytes() == content
+
+    BucketHandler.files['202306-capitalbikeshare-tripdata.zip'] = b'new' * 10
+    statuses = downloader.download_files(file_names, bucket, tmp_path)
+
+    assert list(statuses.values()) == ['not_modified', 'downloaded', 'missing']
+    assert (
+        tmp_path / '202306-capitalbikeshare-tripdata.zip'
+    ).read_bytes() == b'new' * 10
+
+
+def test_interrupted_download_is_resumed(bucket, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, 'CHUNK_SIZE', 1024)
+    file_name = '202305-capitalbikeshare-tripdata.zip'
+    BucketHandler.truncate_next = True
+
+    with pytest.raises(Exception):
+        downloader.download_files([file_name], bucket, tmp_path)
+    part_size = (tmp_path / f'{file_name}.part').stat().st_size
+    assert 0 < part_size < len(BucketHandler.files[file_name])
+
+    statuses = downloader.download_files([file_name], bucket, tmp_path)
+
+    assert statuses == {file_name: 'downloaded'}
+    assert (tmp_path / file_name).read_bytes() == BucketHandler.files[file_name]
+    assert not (tmp_path / f'{file_name}.part').exists()
+    _, headers = BucketHandler.requests[-1]
+    assert headers['Range'] == f'bytes={part_size}-'
+
+
+def test_complete_part_file_is_downloaded_again(bucket, tmp_path):
+    file_name = '202305-capitalbikeshare-tripdata.zip'
+    content = BucketHandler.files[file_name]
+    # interrupted after the last write, before the rename
+    (tmp_path / f'{file_name}.part').write_bytes(content)
+    (tmp_path / f'{file_name}.part.json').write_text(
+        json.dumps({'etag': f'"{hash(content)}"'})
+    )
+
+    statuses = downloader.download_files([file_name], bucket, tmp_path)
+
+    assert statuses == {file_name: 'downloaded'}
+    assert (tmp_path / file_name).read_bytes() == content
+    assert not (tmp_path / f'{file_name}.part').exists()
+    assert not (tmp_path / f'{file_name}.part.json').exists()
+    _, headers = BucketHandler.requests[-1]
+    assert 'Range' not in headers
+
+
+def test_files_downloaded_without_state_are_kept(bucket, tmp_path):
+    file_name = '202305-capitalbikeshare-tripdata.zip'
+    # downloaded before the validators were recorded
+    (tmp_path / file_name).write_bytes(b'old')
+
+    statuses = downloader.download_files([file_name], bucket, tmp_path)
+
+    assert statuses == {file_name: 'not_modified'}
+    assert (tmp_path / file_name).read_bytes() == b'old'
+    etag = f'"{hash(BucketHandler.files[file_name])}"'
+    assert downloader.read_state(tmp_path)[file_name]['etag'] == etag
+
+    BucketHandler.files[file_name] = b'new'
+    statuses = downloader.download_files([file_name], bucket, tmp_path)
+
+    assert statuses == {file_name: 'downloaded'}
+    assert (tmp_path / file_name).read_bytes() == b'new'
+
+
+def test_part_file_without_validators_is_downloaded_again(bucket, tmp_path):
+    file_name = '202305-capitalbikeshare-tripdata.zip'
+    (tmp_path / f'{file_name}.part').write_bytes(b'stale')
+    (tmp_path / f'{file_name}.part.json').write_text(
+        json.dumps({'etag': None, 'last_modified': None})
+    )
+
+    statuses = downloader.download_files([file_name], bucket, tmp_path)
+
+    assert statuses == {file_name: 'downloaded'}
+    assert (tmp_path / file_name).read_bytes() == BucketHandler.files[file_name]
+    _, headers = BucketHandler.requests[-1]
+    assert 'Range' not in headers and 'If-Range' not in headers
@@ -0,0 +1,87 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+from pandas import Timestamp
+from sklearn.pipeline import make_pipeline
+from sklearn.linear_model import LinearRegression
+from sklearn.feature_extraction import DictVectorizer
+
+from src.data import prepare
+from src.features.encoding import CategoricalVectorizer
+
+TRIPS = pd.DataFrame(
+    {
+        'start_station_id': ['31239', '31205', '31313'],
+        'end_station_id': ['31251', '31224', '31313'],
+        'rideable_type': ['docked_bike'] * 3,
+        'member_casual': ['casual', 'member', 'casual'],
+        'duration': [6.416666666666667, 2.4166666666666665, 62.23333333333333],
+        'started_at': [
+            Timestamp('2020-04-25 17:28:39'),
+            Timestamp('2020-04-06 00:54:59'),
+            Timestamp('2020-04-22 17:06:18'),
+        ],
+    }
+)
+
+
+def test_preprocess_matches_dict_vectorizer():
+    X_dv, dv = prepare.preprocess(TRIPS.copy(), DictVectorizer(), fit_dv=True)
+    X, cv = prepare.preprocess(
+        TRIPS.copy(), CategoricalVectorizer(), fit_dv=True
+    )
+
+    assert cv.feature_names_ == dv.feature_names_
+    assert cv.vocabulary_ == dv.vocabulary_
+    assert list(cv.get_feature_names_out()) == list(dv.get_feature_names_out())
+    assert X.shape == (3, 12)
+    # hour 0 is kept as an explicit zero, like DictVectorizer does
+    assert X.nnz == X_dv.nnz
+    np.testing.assert_array_equal(X.indices, X_dv.indices)
+    np.testing.assert_array_equal(X.indptr, X_dv.indptr)
+    np.testing.assert_array_equal(X.data, X_dv.data)
+
+
+def test_transform_ignores_unseen_values_and_accepts_dicts():
+    _, dv = prepare.preprocess(TRIPS.copy(), DictVectorizer(), fit_dv=True)
+    _, cv = prepare.preprocess(
+        TRIPS.copy(), CategoricalVectorizer(), fit_dv=True
+    )
+    trip = {
+        'start_station_id': '31205',
+        'end_station_id': '99999',
+        'rideable_type': 'electric_bike',
+        'member_casual': 'member',
+        'hour': 8,
+        'year': 2023,
+        'month': 6,
+    }
+
+    np.testing.assert_array_equal(
+        cv.transform(trip).toarray(), dv.transform([trip]).toarray()
+    )
+    np.testing.assert_array_equal(
+        cv.transform(pd.DataFrame([trip] * 2)).toarray(),
+        dv.transform([trip] * 2).toarray(),
+    )
+
+
+def test_vectorizer_is_picklable_in_pipeline():
+    X, cv = prepare.preprocess(
+        TRIPS.copy(), CategoricalVectorizer(), fit_dv=True
+    )
+    pipeline = make_pipeline(cv, LinearRegression())
+    pipeline.steps[-1][1].fit(X, TRIPS.duration)
+
+    features = TRIPS.assign(
+        hour=TRIPS.started_at.dt.hour,
+        month=TRIPS.started_at.dt.month,
+        year=TRIPS.started_at.dt.year,
+    ).drop(columns=['duration', 'started_at'])
+    restored = pickle.loads(pickle.dumps(pipeline))
+
+    np.testing.assert_allclose(
+        restored.predict(features.to_dict(orient='records')),
+        pipeline.predict(features),
+    )
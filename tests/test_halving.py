@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+import xgboost as xgb
+
+from src.models import halving
+from src.models.xgb_sweep import SWEEP_CONFIG
+from src.models.register_best_model import get_best_run_config
+
+
+def make_data(n_rows=200, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.random((n_rows, 5))
+    y = 3 * X[:, 0] + X[:, 1] ** 2 + rng.normal(0, 0.1, n_rows)
+    return {
+        split: xgb.DMatrix(X, label=y) for split in ['train', 'val', 'test']
+    }
+
+
+def test_sample_config_follows_the_sweep_distributions():
+    rng = np.random.default_rng(0)
+    parameters = SWEEP_CONFIG['parameters']
+
+    configs = [halving.sample_config(parameters, rng) for _ in range(100)]
+
+    assert {c['max_depth'] for c in configs} <= set(range(4, 31))
+    assert all(np.exp(-3) <= c['learning_rate'] <= 1 for c in configs)
+
+
+def test_hyperband_brackets(tmp_path, monkeypatch):
+    assert halving.count_rungs(27, 3) == 4
+    assert halving.get_max_rounds(27, 1, 3) == 27
+    assert halving.hyperband_brackets(27, 1, 3) == [
+        (27, 1),
+        (12, 3),
+        (6, 9),
+        (4, 27),
+    ]
+    monkeypatch.setenv('SWEEP_DIR', str(tmp_path))
+
+    results = halving.run_search(
+        {'nthread': 1},
+        make_data(),
+        SWEEP_CONFIG['parameters'],
+        'hyperband',
+        n_configs=9,
+        min_rounds=1,
+        eta=3,
+    )
+
+    # no configuration trains past the rounds of the first bracket
+    assert max(trial['rounds'][-1] for trial in results['trials']) == 9
+    # 9 configurations from 1 round, 5 from 3 rounds, 3 from 9 rounds
+    rungs = sorted(len(trial['rounds']) for trial in results['trials'])
+    assert rungs == [1] * 12 + [2] * 4 + [3]
+
+
+def test_warm_started_survivors_match_training_from_scratch():
+    data = make_data()
+    params = {'tree_method': 'hist', 'nthread': 1, 'seed': 42}
+    configs = [{'max_depth': depth} for depth in [1, 2, 3, 4]]
+
+    trials, winner, booster = halving.successive_halving(
+        params, data, configs, min_rounds=2, eta=2
+    )
+
+    assert sorted(len(trial['rounds']) for trial in trials) == [1, 1, 2, 3]
+    assert winner['rounds'] == [2, 4, 8]
+    assert booster.num_boosted_rounds() == 8
+    best = xgb.train(
+        {**params, **winner['config']}, data['train'], num_boost_round=8
+    )
+    np.testing.assert_allclose(
+        booster.predict(data['val']), best.predict(data['val'])
+    )
+
+
+def test_run_search_saves_the_best_config(tmp_path, monkeypatch):
+    monkeypatch.setenv('SWEEP_DIR', str(tmp_path))
+    params = {'objective': 'reg:squarederror', 'nthread': 1}
+
+    results = halving.run_search(
+        params,
+        make_data(),
+        SWEEP_CONFIG['parameters'],
+        'hyperband',
+        n_configs=4,
+        min_rounds=2,
+        eta=2,
+    )
+
+    assert halving.load_results(results['sweep_id']) == results
+    assert halving.load_results('unknown') is None
+    assert len(results['trials']) == 4 + 3 + 3
+    best = results['best']
+    # the best trial is a bracket's last survivor, scored with its booster,
+    # on the same rows in all the splits
+    assert best['test_rmse'] == pytest.approx(best['val_rmse'], rel=1e-5)
+    assert best['config']['nthread'] == 1
+
+
+def test_best_config_is_read_from_wandb_or_the_local_results(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setenv('SWEEP_DIR', str(tmp_path))
+    results = {'sweep_id': 'halving-1', 'best': {'config': {'max_depth': 4}}}
+    logged = {'sweep_id': 'halving-1', 'best': {'config': {'max_depth': 6}}}
+    halving.save_results(results)
+
+    monkeypatch.setattr(halving, 'download_results', lambda _: logged)
+    assert get_best_run_config('halving-1') == {'max_depth': 6}
+    monkeypatch.setattr(halving, 'download_results', lambda _: None)
+    assert get_best_run_config('halving-1') == {'max_depth': 4}
+    with pytest.raises(ValueError):
+        get_best_run_config('halving-2')
@@ -0,0 +1,29 @@
+import pytest
+
+from benchmarks.bench_import_time import (
+    HEAVY_PACKAGES,
+    IMPORT_BUDGETS,
+    import_times,
+    package_times,
+)
+
+# the budgets with headroom for slower or busy test machines, the benchmark
+# checks the budgets themselves
+BUDGET_FACTOR = 3
+
+
+@pytest.mark.parametrize(
+    'module, allowed',
+    [
+        ('src.utils', []),
+        ('src.serving.predict', []),
+        ('src.data.combine_raw', ['prefect']),
+        ('src.data.prepare', ['prefect', 'sklearn']),
+    ],
+)
+def test_imports_within_budget(module, allowed):
+    times = import_times(module)
+
+    imported = set(package_times(times)) & set(HEAVY_PACKAGES)
+    assert imported <= set(allowed)
+    assert times[module] < BUDGET_FACTOR * IMPORT_BUDGETS[module]
@@ -0,0 +1,60 @@
+import numpy as np
+import scipy as sp
+import pandas as pd
+import xgboost as xgb
+from sklearn.pipeline import make_pipeline
+
+from src.models import incremental
+from src.features.encoding import CategoricalVectorizer
+
+
+def test_remap_columns_drops_unseen_features():
+    X = sp.sparse.csr_matrix(np.array([[1, 2, 0], [0, 0, 3], [4, 0, 5]]))
+
+    result = incremental.remap_columns(X, ['a', 'b', 'c'], ['a', 'c', 'd'])
+
+    np.testing.assert_array_equal(
+        result.toarray(), [[1, 0, 0], [0, 3, 0], [4, 5, 0]]
+    )
+
+
+def test_newest_month_rows():
+    X = sp.sparse.csr_matrix(
+        np.array([[2023, 4, 1], [2023, 6, 0], [2022, 12, 1], [2023, 5, 1]])
+    )
+
+    mask = incremental.newest_month_rows(X, ['year', 'month', 'x'], 2)
+
+    np.testing.assert_array_equal(mask, [False, True, False, True])
+
+
+def test_fit_incremental_boosts_the_staging_model(
+    processed_data, training_data_dir
+):
+    _, _, X, y = processed_data
+    data_dir = training_data_dir
+    # the staging encoder hasn't seen station 3
+    staging_trips = pd.DataFrame(
+        {
+            'start_station_id': ['1', '2'],
+            'end_station_id': ['2', '1'],
+            'rideable_type': ['classic_bike'] * 2,
+            'member_casual': ['member', 'casual'],
+            'hour': [0, 5],
+            'year': [2023] * 2,
+            'month': [4, 4],
+        }
+    )
+    dv = CategoricalVectorizer().fit(staging_trips)
+    X_staging, _ = incremental.load_split_for(dv, data_dir, 'train')
+    model = xgb.XGBRegressor(n_estimators=2, max_depth=2, nthread=1)
+    pipeline = make_pipeline(dv, model.fit(X_staging, y))
+
+    boosted = incremental.fit_incremental(
+        pipeline, data_dir, rounds=5, tolerance=1.0
+    )
+
+    assert boosted[0] is dv
+    assert boosted[-1].get_booster().num_boosted_rounds() > 2
+    assert incremental.fit_incremental(pipeline, data_dir, tolerance=-1) is None
+    assert X_staging.shape == (X.shape[0], len(dv.feature_names_))
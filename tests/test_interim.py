@@ -0,0 +1,67 @@
+from datetime import date
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from src.utils import feature_dtypes
+from src.data.interim import (
+    read_interim,
+    remove_source,
+    write_interim,
+    sample_interim,
+)
+
+# around the month boundaries
+STARTED_AT = pd.to_datetime(
+    [
+        '2023-03-31 23:59:59',
+        '2023-04-01 00:00:00',
+        '2023-04-30 12:00:00',
+        '2023-05-02 08:00:00',
+    ]
+)
+
+
+def test_write_read_roundtrip(make_trips, tmp_path):
+    trips = make_trips(4).assign(started_at=STARTED_AT)
+    write_interim(trips, tmp_path)
+
+    assert sorted(
+        p.relative_to(tmp_path).as_posix() for p in tmp_path.rglob('*.parquet')
+    ) == [
+        'year=2023/month=3/part-0.parquet',
+        'year=2023/month=4/part-0.parquet',
+        'year=2023/month=5/part-0.parquet',
+    ]
+    result = read_interim(tmp_path).sort_values('started_at', ignore_index=True)
+    assert result.start_station_id.dtype == 'category'
+    assert result.started_at.dtype == 'datetime64[ns]'
+    assert_frame_equal(result.astype(feature_dtypes()), trips)
+
+
+def test_read_date_range(make_trips, tmp_path):
+    write_interim(make_trips(4).assign(started_at=STARTED_AT), tmp_path)
+
+    result = read_interim(tmp_path, date(2023, 4, 1), date(2023, 5, 1))
+
+    assert sorted(result.started_at.astype(str)) == [
+        '2023-04-01 00:00:00',
+        '2023-04-30 12:00:00',
+    ]
+
+
+def test_append_replaces_source(make_trips, tmp_path):
+    trips = make_trips(4).assign(started_at=STARTED_AT)
+    write_interim(trips.iloc[:2], tmp_path, '202303-capitalbikeshare-tripdata')
+    write_interim(trips.iloc[2:], tmp_path, '202304-capitalbikeshare-tripdata')
+
+    remove_source(tmp_path, '202303-capitalbikeshare-tripdata')
+    write_interim(trips.iloc[:1], tmp_path, '202303-capitalbikeshare-tripdata')
+
+    result = read_interim(tmp_path)
+    assert sorted(result.started_at.astype(str)) == [
+        '2023-03-31 23:59:59',
+        '2023-04-30 12:00:00',
+        '2023-05-02 08:00:00',
+    ]
+    assert len(sample_interim(tmp_path, 2)) == 2
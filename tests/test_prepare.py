@@ -1,10 +1,13 @@
 import os
+from datetime import date
 
+import numpy as np
 import pandas as pd
 from pandas import Timestamp
 from sklearn.feature_extraction import DictVectorizer
 
 from src.data import prepare
+from src.features.encoding import CategoricalVectorizer
 
 os.environ["WANDB_MODE"] = "offline"
 
@@ -54,3 +57,49 @@ def test_preprocess():
     X, dv = prepare.preprocess(df, DictVectorizer(), fit_dv=True)
     assert dv.feature_names_ == expected_feature_names
     assert X.shape == (3, 12)
+
+
+def test_split_by_dates_matches_dataset_split():
+    rng = np.random.default_rng(42)
+    n_rows = 1000
+    df = pd.DataFrame(
+        {
+            'start_station_id': rng.choice(['31239', '31205', '31313'], n_rows),
+            'end_station_id': rng.choice(['31251', '31224', '31313'], n_rows),
+            'rideable_type': rng.choice(
+                ['docked_bike', 'classic_bike'], n_rows
+            ),
+            'member_casual': rng.choice(['casual', 'member'], n_rows),
+            'duration': rng.uniform(0, 100, n_rows),
+            'started_at': Timestamp('2023-02-01')
+            + pd.to_timedelta(
+                rng.integers(0, 150 * 24 * 3600, n_rows), unit='s'
+            ),
+        }
+    )
+    split_dates = [
+        date(2023, 3, 1),
+        date(2023, 4, 1),
+        date(2023, 5, 1),
+        date(2023, 6, 1),
+    ]
+
+    splits, dv = prepare.split_by_dates.fn(
+        df.copy(), split_dates, CategoricalVectorizer(), fit_dv=True
+    )
+
+    _, _, expected_dv = prepare.dataset_split.fn(
+        df.copy(),
+        split_dates[1],
+        DictVectorizer(),
+        fit_dv=True,
+        start_split_date=split_dates[0],
+    )
+    assert dv.feature_names_ == expected_dv.feature_names_
+    assert len(splits) == 3
+    for (X, y), start, end in zip(splits, split_dates[:-1], split_dates[1:]):
+        X_expected, y_expected, _ = prepare.dataset_split.fn(
+            df.copy(), end, expected_dv, start_split_date=start
+        )
+        np.testing.assert_array_equal(y, y_expected)
+        np.testing.assert_array_equal(X.toarray(), X_expected.toarray())
@@ -0,0 +1,54 @@
+from datetime import date
+
+import numpy as np
+
+from src.data import processed
+from src.utils import write_pickle
+from src.models import data_cache
+
+
+def test_processed_data_round_trip(processed_data, tmp_path):
+    legacy_dir, dv, X, y = processed_data
+    dest_dir = tmp_path / 'processed'
+    dest_dir.mkdir()
+    write_pickle((X, y), dest_dir / 'train.pkl')
+    split_dates = [date(1970, 1, 1), date(2023, 4, 1), date(2023, 5, 1)]
+
+    manifest = processed.write_processed(
+        dest_dir, dv, [('train', X, y), ('val', X[:2], y[:2])], split_dates
+    )
+
+    assert processed.read_manifest(dest_dir) == manifest
+    assert manifest['feature_names'] == list(dv.get_feature_names_out())
+    assert manifest['splits']['val'] == {
+        'shape': [2, X.shape[1]],
+        'nnz': X[:2].nnz,
+        'dates': ['2023-04-01', '2023-05-01'],
+    }
+    assert not (dest_dir / 'train.pkl').exists()
+    X_loaded, y_loaded = processed.load_processed_split(dest_dir, 'train')
+    assert isinstance(y_loaded, np.memmap)
+    assert not X_loaded.data.flags.owndata  # a view of the memory map
+    assert (X_loaded != X).nnz == 0
+    np.testing.assert_array_equal(y_loaded, y)
+    # the older format is still read
+    assert processed.read_manifest(legacy_dir) is None
+    X_legacy, _ = processed.load_processed_split(legacy_dir, 'val')
+    assert (X_legacy != X).nnz == 0
+
+
+def test_build_entry_from_processed_data(processed_data, tmp_path):
+    artifact_dir, dv, X, y = processed_data
+    entry_dir = tmp_path / 'entry'
+    entry_dir.mkdir()
+    processed.write_processed(
+        artifact_dir, dv, [(split, X, y) for split in data_cache.SPLITS]
+    )
+
+    data_cache.build_entry(artifact_dir, entry_dir)
+
+    np.testing.assert_array_equal(
+        data_cache.load_dmatrix(entry_dir, 'test').get_label(), y
+    )
+    X_cached, _ = data_cache.load_split(entry_dir, 'test')
+    assert (X_cached != X).nnz == 0
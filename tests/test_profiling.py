@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from src import profiling
+
+
+@profiling.profiled()
+def double_rows(df: pd.DataFrame) -> pd.DataFrame:
+    with profiling.profile_stage('allocate') as stage:
+        block = np.ones(20 * 2**20, np.uint8)
+        stage.rows_out = len(block)
+    return pd.concat([df, df])
+
+
+@profiling.profiled(report=True)
+def run_flow(df: pd.DataFrame) -> None:
+    double_rows(df)
+
+
+def test_report_of_profiled_stages(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROFILE_DIR', str(tmp_path))
+
+    run_flow(pd.DataFrame({'a': range(10)}))
+
+    (report_path,) = tmp_path.glob('run_flow-*.json')
+    stages = {
+        stage['name']: stage
+        for stage in json.loads(report_path.read_text())['stages']
+    }
+    assert list(stages) == ['allocate', 'double_rows', 'run_flow']
+    assert stages['allocate']['parent'] == 'double_rows'
+    assert stages['double_rows']['parent'] == 'run_flow'
+    assert stages['double_rows']['rows_in'] == 10
+    assert stages['double_rows']['rows_out'] == 20
+    assert stages['allocate']['peak_rss_bytes'] > 20 * 2**20
+    assert stages['run_flow']['wall_seconds'] >= (
+        stages['double_rows']['wall_seconds']
+    )
+
+
+def make_report(stages):
+    return {
+        'stages': [
+            {name: None for name in profiling.METRICS} | stage
+            for stage in stages
+        ]
+    }
+
+
+def test_diff_reports_finds_regressions(tmp_path, capsys):
+    old = make_report(
+        [
+            {'name': 'process_data', 'wall_seconds': 1.0, 'rows_out': 10},
+            {'name': 'process_data', 'wall_seconds': 1.0, 'rows_out': 10},
+            {'name': 'fit', 'wall_seconds': 10.0},
+        ]
+    )
+    new = make_report(
+        [
+            {'name': 'process_data', 'wall_seconds': 3.0, 'rows_out': 20},
+            {'name': 'fit', 'wall_seconds': 9.0},
+        ]
+    )
+
+    rows = profiling.diff_reports(old, new)
+
+    assert [(r['stage'], r['metric'], r['regression']) for r in rows] == [
+        ('process_data', 'wall_seconds', True),
+        ('process_data', 'rows_out', False),
+        ('fit', 'wall_seconds', False),
+    ]
+    old_path, new_path = tmp_path / 'old.json', tmp_path / 'new.json'
+    old_path.write_text(json.dumps(old))
+    new_path.write_text(json.dumps(new))
+    assert profiling.main([str(old_path), str(new_path)]) == 1
+    assert 'REGRESSION' in capsys.readouterr().out
+    assert profiling.main([str(old_path), str(old_path)]) == 0
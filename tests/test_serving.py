@@ -0,0 +1,58 @@
+import pytest
+from numpy.testing import assert_allclose
+from sklearn.feature_extraction import DictVectorizer
+
+from src.utils import read_pickle, get_categorical_features
+from src.data.interim import write_interim
+from src.data.prepare import get_features, add_time_features
+from src.serving.predict import PREDICTION_COL, TripScorer
+from src.features.encoding import CategoricalVectorizer
+
+
+@pytest.fixture(
+    name='pipeline_path', params=[DictVectorizer, CategoricalVectorizer]
+)
+def fixture_pipeline_path(request, make_trips, fit_pipeline):
+    return fit_pipeline(add_time_features(make_trips()), request.param())
+
+
+def get_expected(pipeline_path, df):
+    pipeline = read_pickle(pipeline_path)
+    return pipeline.predict(
+        get_features(add_time_features(df.copy()), pipeline[0])
+    )
+
+
+def test_batch_scoring_matches_pipeline(pipeline_path, make_trips, tmp_path):
+    df = make_trips(120)
+    df.loc[0, 'start_station_id'] = 'unseen'
+    expected = get_expected(pipeline_path, df)
+    scorer = TripScorer(pipeline_path)
+
+    assert_allclose(scorer.predict_frame(df, chunksize=50), expected, rtol=1e-6)
+
+    trips = df.assign(ride_id=range(len(df))).sample(frac=1, random_state=0)
+    write_interim(trips, tmp_path / 'trips.parquet')
+    scored = scorer.predict_parquet(
+        tmp_path / 'trips.parquet', chunksize=50, columns=['ride_id']
+    )
+    # every prediction is on the row of its trip
+    assert_allclose(
+        scored[PREDICTION_COL],
+        expected[scored.ride_id],
+        rtol=1e-6,
+    )
+    assert sorted(scored.ride_id) == list(range(len(df)))
+
+
+def test_single_trip_matches_pipeline(pipeline_path, make_trips):
+    df = make_trips(4)
+    df.loc[1, 'end_station_id'] = 'unseen'
+    expected = get_expected(pipeline_path, df)
+    scorer = TripScorer(pipeline_path)
+
+    trips = df[get_categorical_features() + ['started_at']].to_dict('records')
+    for trip, prediction in zip(trips, expected):
+        assert scorer.predict_trip(trip) == pytest.approx(prediction, rel=1e-6)
+    trips[0]['started_at'] = trips[0]['started_at'].isoformat()
+    assert scorer.predict_trip(trips[0]) == pytest.approx(expected[0], rel=1e-6)
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+from numpy.testing import assert_allclose
+
+from src.utils import TARGET_COL, read_pickle, get_categorical_features
+from src.features import station_pairs
+from src.data.interim import write_interim
+from src.data.prepare import get_features, add_time_features
+from src.serving.predict import TripScorer
+from src.features.encoding import CategoricalVectorizer
+
+
+def make_store(make_trips, store_dir, features_dir):
+    """Interim store of trips in April and May, and its feature store."""
+    april = make_trips(200)
+    may = make_trips(100)
+    may['started_at'] += pd.Timedelta(days=30)
+    write_interim(april, store_dir, '202304')
+    station_pairs.update_features(store_dir, features_dir)
+    write_interim(may, store_dir, '202305')
+    station_pairs.update_features(store_dir, features_dir)
+    return april, may
+
+
+def aggregate(trips, history=None):
+    """Stats of the history (the trips by default) of every trip's key."""
+    keys = station_pairs.KEY_COLUMNS
+    stats = (
+        (trips if history is None else history)
+        .groupby(keys)[TARGET_COL]
+        .agg(['size', 'mean', 'median'])
+        .reset_index()
+    )
+    return trips[keys].merge(stats, on=keys, how='left')
+
+
+def test_update_features_adds_new_months(make_trips, tmp_path):
+    store_dir, features_dir = tmp_path / 'store', tmp_path / 'features'
+    april_histogram = features_dir / 'months' / '2023-4.npz'
+    april, may = make_store(make_trips, store_dir, features_dir)
+    mtime = april_histogram.stat().st_mtime_ns
+
+    manifest = station_pairs.update_features(store_dir, features_dir)
+
+    assert sorted(manifest) == ['2023-4', '2023-5']
+    # unchanged months aren't aggregated again
+    assert april_histogram.stat().st_mtime_ns == mtime
+    trips = pd.concat([april, may], ignore_index=True)
+    expected = aggregate(trips)
+    index = station_pairs.StationPairIndex.load(features_dir)
+    assert isinstance(index.keys, np.memmap)
+    assert len(index.keys) == len(expected.drop_duplicates())
+
+    trips.loc[0, 'end_station_id'] = 'unseen'
+    features = index.lookup(trips)
+
+    assert features.pair_trips[0] == 0
+    assert np.isnan(features.pair_mean_duration[0])
+    assert_allclose(features.pair_trips[1:], expected['size'][1:])
+    assert_allclose(
+        features.pair_mean_duration[1:], expected['mean'][1:], rtol=1e-6
+    )
+    # medians are interpolated within their 1 minute bin
+    assert_allclose(
+        features.pair_median_duration[1:], expected['median'][1:], atol=1
+    )
+
+
+def test_pair_features_only_use_earlier_months(make_trips, tmp_path):
+    features_dir = tmp_path / 'features'
+    april, may = make_store(make_trips, tmp_path / 'store', features_dir)
+
+    df = station_pairs.add_pair_features(
+        pd.concat([april, may], ignore_index=True), features_dir
+    )
+
+    expected = aggregate(may, history=april)
+    assert (df.pair_trips[: len(april)] == 0).all()
+    may_features = df[len(april) :].reset_index(drop=True)
+    assert_allclose(may_features.pair_trips, expected['size'].fillna(0))
+    assert_allclose(
+        may_features.pair_mean_duration, expected['mean'], rtol=1e-6
+    )
+
+
+def test_scorer_looks_up_pair_features(make_trips, fit_pipeline, tmp_path):
+    features_dir = tmp_path / 'features'
+    april, may = make_store(make_trips, tmp_path / 'store', features_dir)
+    index = station_pairs.StationPairIndex.load(features_dir)
+    df = add_time_features(pd.concat([april, may], ignore_index=True))
+    df = df.join(index.lookup(df))
+    dv = CategoricalVectorizer()
+    pipeline_path = fit_pipeline(df, dv)
+    expected = read_pickle(pipeline_path).predict(get_features(df, dv))
+
+    scorer = TripScorer(pipeline_path, features_dir)
+
+    assert set(station_pairs.PAIR_FEATURES) <= set(dv.vocabulary_)
+    assert_allclose(scorer.predict_frame(df, chunksize=70), expected, rtol=1e-6)
+    trips = df[get_categorical_features() + ['started_at']].to_dict('records')
+    for trip, prediction in zip(trips[:5], expected):
+        assert scorer.predict_trip(trip) == pytest.approx(prediction, rel=1e-6)
@@ -0,0 +1,55 @@
+import numpy as np
+import scipy as sp
+import xgboost as xgb
+from numpy.testing import assert_allclose
+
+from src.serving.trees import TreeEnsemble
+
+
+def make_data(n_rows=500, n_features=40, seed=42):
+    rng = np.random.default_rng(seed)
+    X = sp.sparse.random(
+        n_rows, n_features, density=0.2, format='csr', random_state=seed
+    )
+    # explicit zeros are values, not missing
+    X.data[::7] = 0
+    y = X @ rng.random(n_features) + (X[:, 0].toarray().ravel() == 0)
+    return X, y
+
+
+def test_predictions_match_booster(tmp_path):
+    X, y = make_data()
+    booster = xgb.train(
+        {'max_depth': 6, 'seed': 42},
+        xgb.DMatrix(X, label=y),
+        num_boost_round=30,
+    )
+    X_test, _ = make_data(seed=0)
+    dtest = xgb.DMatrix(X_test)
+
+    trees = TreeEnsemble.from_booster(booster)
+    assert_allclose(trees.predict(X_test), booster.predict(dtest), rtol=1e-5)
+    assert_allclose(
+        trees.predict(X_test, iteration_range=(0, 10), chunksize=64),
+        booster.predict(dtest, iteration_range=(0, 10)),
+        rtol=1e-5,
+    )
+
+    trees.save(tmp_path / 'trees.npz')
+    loaded = TreeEnsemble.load(tmp_path / 'trees.npz')
+    assert_allclose(loaded.predict(X_test), trees.predict(X_test))
+
+
+def test_early_stopped_model_is_exported_up_to_its_best_iteration():
+    X, y = make_data()
+    X_val, y_val = make_data(seed=1)
+    model = xgb.XGBRegressor(
+        n_estimators=200, learning_rate=1.0, early_stopping_rounds=5
+    )
+    model.fit(X, y, eval_set=[(X_val, y_val)], verbose=False)
+    assert model.best_iteration + 1 < model.get_booster().num_boosted_rounds()
+    X_test, _ = make_data(seed=0)
+
+    trees = TreeEnsemble.from_booster(model.get_booster())
+
+    assert_allclose(trees.predict(X_test), model.predict(X_test), rtol=1e-5)
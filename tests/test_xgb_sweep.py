@@ -0,0 +1,39 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from src.models import xgb_sweep
+from src.models.backend import load_training_data
+
+
+def test_split_evenly():
+    assert xgb_sweep.split_evenly(5, 2) == [3, 2]
+    assert xgb_sweep.split_evenly(2, 4) == [1, 1, 0, 0]
+
+
+def get_worker_data(data_dir):
+    # pylint: disable-next=protected-access
+    worker_data = xgb_sweep._worker_data
+    # what a trial gets when it loads the data
+    trial_data = load_training_data(data_dir, nthread=1)
+    return {
+        split: (dmatrix.num_row(), trial_data[split] is dmatrix)
+        for split, dmatrix in worker_data.items()
+    }
+
+
+def test_sweep_workers_build_data_once_for_their_trials(training_data_dir):
+    with ProcessPoolExecutor(
+        max_workers=2,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=xgb_sweep.init_sweep_worker,
+        initargs=(training_data_dir, 1),
+    ) as executor:
+        results = [
+            executor.submit(get_worker_data, training_data_dir)
+            for _ in range(2)
+        ]
+
+    # every worker has its own DMatrices, reused by all its trials
+    assert [r.result() for r in results] == [
+        {'train': (4, True), 'val': (4, True), 'test': (4, True)}
+    ] * 2
@@ -0,0 +1,32 @@
+from zipfile import ZIP_STORED, ZipFile
+
+from pandas.testing import assert_frame_equal
+
+from src.data import combine_raw
+from src.data.zip_reader import get_archive_sources
+
+
+def test_process_data_reads_from_nested_archives(raw_csv, tmp_path):
+    csv_path = tmp_path / '202004-capitalbikeshare-tripdata.csv'
+    csv_path.write_text(raw_csv)
+    monthly_zip_path = tmp_path / '202005-capitalbikeshare-tripdata.zip'
+    with ZipFile(monthly_zip_path, 'w') as zip_ref:
+        zip_ref.writestr('__MACOSX/._202005-capitalbikeshare-tripdata.csv', '')
+        # some monthly archives contain a misnamed csv
+        zip_ref.writestr('202005-capitalbikeshare-tripdata 2.csv', raw_csv)
+    all_zip_path = tmp_path / 'all_raw_data.zip'
+    with ZipFile(all_zip_path, 'w') as zip_ref:
+        zip_ref.write(csv_path, csv_path.name)
+        zip_ref.write(monthly_zip_path, monthly_zip_path.name, ZIP_STORED)
+    files_before = sorted(tmp_path.iterdir())
+
+    sources = get_archive_sources(all_zip_path)
+
+    assert list(sources) == [
+        '202004-capitalbikeshare-tripdata',
+        '202005-capitalbikeshare-tripdata',
+    ]
+    expected = combine_raw.process_data.fn(csv_path)
+    for source in [monthly_zip_path, *sources.values()]:
+        assert_frame_equal(combine_raw.process_data.fn(source), expected)
+    assert sorted(tmp_path.iterdir()) == files_before